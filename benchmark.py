@@ -0,0 +1,319 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+# 无界面运行，并使用临时的用户目录，避免读写真实的设置文件和缓存
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+BENCH_HOME = tempfile.mkdtemp(prefix="photo_album_bench_home_")
+os.environ["HOME"] = BENCH_HOME
+os.environ["USERPROFILE"] = BENCH_HOME
+
+from PyQt5.QtWidgets import QApplication, QLabel
+from PyQt5.QtGui import QImage, QImageWriter, QPainter, QLinearGradient, QColor
+from PyQt5.QtCore import Qt, QSize
+
+from photo_album import (SUPPORTED_FORMATS, FolderScanner, ImageCache, ImageSurface,
+                         PhotoAlbum, load_scaled_image)
+
+# 默认的图片尺寸（百万像素），从缩略图大小到5000万像素
+DEFAULT_MEGAPIXELS = [0.01, 0.3, 2, 12, 50]
+
+# 大图只使用这些格式，避免生成体积巨大的文本格式文件（如XPM）
+LARGE_IMAGE_FORMATS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.webp')
+
+# 显示区域大小
+DISPLAY_SIZE = QSize(1920, 1080)
+
+
+def writable_formats():
+    """返回SUPPORTED_FORMATS中当前Qt可以写入的格式"""
+    writable = {bytes(name).decode().lower() for name in QImageWriter.supportedImageFormats()}
+    aliases = {'jfif': 'jpeg', 'jpg': 'jpeg', 'tif': 'tiff'}
+    return [ext for ext in SUPPORTED_FORMATS
+            if ext[1:] in writable or aliases.get(ext[1:]) in writable]
+
+
+def make_image(megapixels, seed):
+    """生成带渐变的测试图片（纯色图片的压缩和解码速度不具代表性）"""
+    width = max(16, int((megapixels * 1000000 * 4 / 3) ** 0.5))
+    height = max(16, width * 3 // 4)
+    image = QImage(width, height, QImage.Format_RGB32)
+    painter = QPainter(image)
+    gradient = QLinearGradient(0, 0, width, height)
+    gradient.setColorAt(0, QColor.fromHsv(seed * 37 % 360, 200, 230))
+    gradient.setColorAt(1, QColor.fromHsv(seed * 91 % 360, 160, 60))
+    painter.fillRect(0, 0, width, height, gradient)
+    painter.setPen(QColor(255, 255, 255))
+    for i in range(0, width, max(8, width // 64)):
+        painter.drawLine(i, 0, width - i, height)
+    painter.end()
+    return image
+
+
+def generate_tree(root, count, depth, fanout, megapixels):
+    """生成测试图片目录树，返回[(路径, 百万像素, 格式)]"""
+    directories = [root]
+    level = [root]
+    for _ in range(depth):
+        next_level = []
+        for parent in level:
+            for i in range(fanout):
+                path = os.path.join(parent, f"dir{i}")
+                os.makedirs(path, exist_ok=True)
+                next_level.append(path)
+        directories.extend(next_level)
+        level = next_level
+
+    formats = writable_formats()
+    large_formats = [ext for ext in formats if ext in LARGE_IMAGE_FORMATS]
+    cached_images = {}
+    created = []
+    for i in range(count):
+        size = megapixels[i % len(megapixels)]
+        candidates = formats if size <= 0.3 else large_formats
+        ext = candidates[i % len(candidates)]
+        # 同一尺寸的图片只绘制一次，不同文件使用不同的格式
+        if size not in cached_images:
+            cached_images[size] = make_image(size, i)
+        image = cached_images[size]
+        path = os.path.join(directories[i % len(directories)], f"image{i:06d}{ext}")
+        if not image.save(path):
+            # 部分格式有尺寸限制（如ICO），改用PNG
+            path = os.path.splitext(path)[0] + ".png"
+            image.save(path)
+            ext = ".png"
+        created.append((path, size, ext))
+    return created
+
+
+def summarize(samples):
+    """统计耗时（毫秒）"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        'count': len(ordered),
+        'mean_ms': sum(ordered) / len(ordered),
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'max_ms': ordered[-1],
+    }
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def bench_scan(root, catalog_file):
+    """扫描耗时：无目录数据库、首次建立目录数据库、使用已有目录数据库"""
+    results = {}
+    for name, catalog in (('scan_no_catalog', None), ('scan_catalog_cold', catalog_file),
+                          ('scan_catalog_warm', catalog_file)):
+        scanner = FolderScanner([root], True, catalog_file=catalog)
+        found = []
+        first = []
+        start = time.perf_counter()
+
+        def on_batch(batch):
+            if not first:
+                first.append((time.perf_counter() - start) * 1000)
+            found.extend(batch)
+
+        scanner.batch_found.connect(on_batch)
+        # 直接在当前线程中运行，信号同步投递
+        _, elapsed = timed(scanner.run)
+        results[name] = {
+            'count': 1,
+            'mean_ms': elapsed,
+            'p50_ms': elapsed,
+            'p95_ms': elapsed,
+            'max_ms': elapsed,
+            'first_batch_ms': first[0] if first else None,
+            'images': len(found),
+            'dirs_changed': scanner.dirs_changed,
+        }
+        print(f"  {name}: {elapsed:.1f} ms，{len(found)} 张图片")
+    return results
+
+
+def bench_decode(images):
+    """按尺寸和格式统计缩小解码耗时，以及完整解码后缩放的耗时（旧的显示路径）"""
+    results = {}
+    for path, megapixels, ext in images:
+        image, decode_ms = timed(load_scaled_image, path, DISPLAY_SIZE)
+        if image.isNull():
+            continue
+        full, full_ms = timed(QImage, path)
+        _, scale_ms = timed(full.scaled, DISPLAY_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        for key, value in ((f"decode_scaled/{megapixels}MP", decode_ms),
+                           (f"decode_scaled/{ext}", decode_ms),
+                           (f"decode_full/{megapixels}MP", full_ms),
+                           (f"scale_full/{megapixels}MP", scale_ms)):
+            results.setdefault(key, []).append(value)
+    return {key: summarize(samples) for key, samples in results.items()}
+
+
+def bench_resize(images, steps):
+    """窗口调整大小时的快速缩放和停止调整后的高质量缩放"""
+    label = QLabel()
+    label.resize(1280, 720)
+    label.show()
+    surface = ImageSurface(label, ImageCache())
+    fast = []
+    smooth = []
+    for path, megapixels, ext in images:
+        if megapixels < 2:
+            continue
+        # 每张图片从不同于调整过程中任何尺寸的大小开始，避免高质量缩放因尺寸未变而被跳过
+        label.resize(1400, 800)
+        surface.show_image(path)
+        for i in range(steps):
+            label.resize(1280 - i * 10, 720 - i * 6)
+            _, elapsed = timed(surface.render_fast)
+            fast.append(elapsed)
+        _, elapsed = timed(surface.render_smooth)
+        smooth.append(elapsed)
+    label.close()
+    return {'resize_fast': summarize(fast), 'resize_smooth': summarize(smooth)}
+
+
+def bench_slideshow(app, root, ticks):
+    """幻灯片定时器触发到画面显示的耗时（有预读和无预读）"""
+    window = PhotoAlbum()
+    window.use_viewer_window.setChecked(True)
+    window.image_viewer.resize(1280, 720)
+    window.add_folder(root)
+    while window.scanner is not None:
+        app.processEvents()
+        time.sleep(0.01)
+
+    results = {}
+    for name, depth in (('tick_to_frame_prefetch', 3), ('tick_to_frame_no_prefetch', 0)):
+        window.prefetch_spin.setValue(depth)
+        window.image_cache.clear()
+        window.toggle_slideshow()
+        window.scheduler.stop()  # 由测试代码模拟到达显示时间
+        samples = []
+        viewer_samples = []
+        for _ in range(min(ticks, len(window.images))):
+            # 等待预读完成，相当于两次切换之间的显示时间
+            window.prefetcher.pool.waitForDone()
+            app.processEvents()
+            _, elapsed = timed(window.show_next_image)
+            samples.append(elapsed)
+            _, elapsed = timed(window.image_viewer.display_image,
+                               window.images[window.current_image_index])
+            viewer_samples.append(elapsed)
+        window.toggle_slideshow()
+        results[name] = summarize(samples)
+        results[f"viewer_display/{'prefetch' if depth else 'no_prefetch'}"] = summarize(viewer_samples)
+    window.close()
+    return results
+
+
+def compare(baseline_file, results, threshold):
+    """与之前的结果比较，p50耗时增加超过阈值视为性能下降，返回下降的项目"""
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    print(f"\n与 {baseline_file} 比较（阈值 {threshold:.0%}）:")
+    for name, current in sorted(results.items()):
+        old = baseline.get(name)
+        if not old or not old.get('p50_ms') or current.get('p50_ms') is None:
+            continue
+        ratio = current['p50_ms'] / old['p50_ms']
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  <-- 变慢"
+        print(f"  {name}: {old['p50_ms']:.2f} -> {current['p50_ms']:.2f} ms ({ratio - 1:+.0%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="电子相册性能测试（无界面运行）")
+    parser.add_argument("--images", type=int, default=40, help="生成的图片数量")
+    parser.add_argument("--depth", type=int, default=2, help="文件夹层数")
+    parser.add_argument("--fanout", type=int, default=3, help="每层的子文件夹数量")
+    parser.add_argument("--megapixels", type=float, nargs="+", default=DEFAULT_MEGAPIXELS,
+                        help="图片尺寸（百万像素），按顺序循环使用")
+    parser.add_argument("--ticks", type=int, default=20, help="模拟的幻灯片切换次数")
+    parser.add_argument("--resize-steps", type=int, default=10, help="每张图片模拟的调整大小次数")
+    parser.add_argument("--tree", help="使用已有的图片文件夹，不生成测试图片")
+    parser.add_argument("--output", default="bench_output.json", help="结果保存的JSON文件")
+    parser.add_argument("--compare", help="与之前保存的结果比较")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定为变慢的p50增幅")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    work_dir = tempfile.mkdtemp(prefix="photo_album_bench_")
+    try:
+        if args.tree:
+            root = args.tree
+            images = []
+            for directory, _, files in os.walk(root):
+                for name in files:
+                    ext = os.path.splitext(name)[1].lower()
+                    if ext in SUPPORTED_FORMATS:
+                        path = os.path.join(directory, name)
+                        size = QImage(path).size()
+                        images.append((path, round(size.width() * size.height() / 1000000, 1), ext))
+        else:
+            root = os.path.join(work_dir, "images")
+            print(f"生成 {args.images} 张测试图片...")
+            images = generate_tree(root, args.images, args.depth, args.fanout, args.megapixels)
+
+        results = {}
+        print("扫描:")
+        results.update(bench_scan(root, os.path.join(work_dir, "catalog.db")))
+        print("解码和缩放...")
+        results.update(bench_decode(images))
+        print("调整大小...")
+        results.update(bench_resize(images, args.resize_steps))
+        print("幻灯片切换...")
+        results.update(bench_slideshow(app, root, args.ticks))
+
+        report = {
+            'meta': {
+                'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+                'python': sys.version.split()[0],
+                'platform': sys.platform,
+                'images': len(images),
+                'megapixels': args.megapixels,
+                'display_size': [DISPLAY_SIZE.width(), DISPLAY_SIZE.height()],
+            },
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+        print("\n结果:")
+        for name, stats in sorted(results.items()):
+            if stats.get('count'):
+                print(f"  {name}: p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms ({stats['count']} 次)")
+        print(f"\n结果已保存到 {args.output}")
+
+        if args.compare:
+            regressions = compare(args.compare, results, args.threshold)
+            if regressions:
+                print(f"\n{len(regressions)} 项变慢")
+                return 1
+            print("\n没有发现性能下降")
+        return 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        shutil.rmtree(BENCH_HOME, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,31 +4,3330 @@ import time
 import random
 import warnings
 import json
+import sqlite3
+import threading
+import bisect
+import hashlib
+import csv
+import ctypes
+import argparse
+import multiprocessing
+import zipfile
+import tarfile
+import zlib
+import struct
+import fnmatch
+import itertools
+import shlex
+import re
+import math
+import calendar
+import datetime
+from array import array
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 # 抑制PyQt5的弃用警告
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
+# 程序启动时间（用于统计首张图片的显示耗时）
+APP_START_TIME = time.perf_counter()
+
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QPushButton, QLabel, QListWidget, QFileDialog, QCheckBox, 
-                             QSpinBox, QGroupBox, QSlider, QComboBox, QFrame, QStyle, QMenu, QAction, QMessageBox)
-from PyQt5.QtGui import QPixmap, QImage, QCursor, QFont, QColor, QPalette, QDragEnterEvent, QDropEvent
-from PyQt5.QtCore import Qt, QTimer, QSize, QPoint, QMimeData, QSettings
+                             QPushButton, QLabel, QListWidget, QListWidgetItem, QFileDialog, QCheckBox, QLineEdit, 
+                             QSpinBox, QGroupBox, QSlider, QComboBox, QFrame, QStyle, QMenu, QAction, QMessageBox,
+                             QListView, QShortcut, QInputDialog)
+from PyQt5.QtGui import (QPixmap, QImage, QImageReader, QImageIOHandler, QCursor, QFont, QColor, QPalette,
+                         QDragEnterEvent, QDropEvent, QKeySequence, QPainter, QTransform, QGuiApplication)
+from PyQt5.QtCore import (Qt, QTimer, QSize, QPoint, QMimeData, QSettings, QThread, pyqtSignal, QFileSystemWatcher,
+                          QRunnable, QThreadPool, QObject, QEvent, QAbstractListModel, QModelIndex, QUrl,
+                          QBuffer, QByteArray, QFile, QIODevice, QRect, QRectF, QPointF, QCoreApplication)
+
+# 定义应用程序常量
+APP_NAME = "电子相册"
+SETTINGS_FILE = os.path.join(os.path.expanduser("~"), ".photo_album_settings.json")
+# 图片目录数据库，与设置文件放在同一目录
+CATALOG_FILE = os.path.join(os.path.dirname(SETTINGS_FILE), ".photo_album_catalog.db")
+
+# 支持的图片格式（PyQt5原生支持，无需额外插件）
+SUPPORTED_FORMATS = (
+    # 常见格式
+    '.jpg', '.jpeg', '.png', '.bmp', '.gif',
+    # 扩展格式（原生支持）
+    '.webp', '.tiff', '.tif', '.ico', '.xpm',
+    '.pbm', '.pgm', '.ppm', '.xbm', '.jfif'
+)
+
+# 压缩包：可以像文件夹一样添加，其中的图片直接从压缩包中读取，不解压到磁盘
+# （只支持可随机读取的格式，TAR需未压缩）；内存中缓存成员索引的压缩包数量
+ARCHIVE_FORMATS = ('.zip', '.cbz', '.tar')
+ARCHIVE_INDEX_CACHE = 32
+
+# 后台扫描参数：每批最多发送的图片数量，以及两批之间的最长间隔（秒）
+SCAN_BATCH_SIZE = 500
+SCAN_BATCH_INTERVAL = 0.2
+
+# 监视文件夹变化：连续变化合并处理的等待时间（毫秒），以及持续变化时的最长推迟时间（秒）
+WATCH_DEBOUNCE_MS = 500
+WATCH_MAX_DELAY = 5.0
+
+# 解码图片缓存的默认内存上限（MB）
+DEFAULT_CACHE_BUDGET_MB = 256
+
+# 默认预读的图片数量
+DEFAULT_PREFETCH_DEPTH = 3
+
+# 停止调整窗口大小多久后（毫秒）进行高质量缩放
+RESIZE_IDLE_MS = 150
+
+# 切换效果：过渡时长（毫秒，计入切换间隔）、帧间隔（毫秒，约60帧/秒）
+TRANSITION_DURATION_MS = 800
+TRANSITION_FRAME_MS = 16
+TRANSITION_EFFECTS = {
+    "无": None,
+    "淡入淡出": 'fade',
+    "滑动": 'slide',
+}
+
+# 缩放查看：分块大小（像素）、分块缓存的内存上限（MB）、最大放大倍数和每格滚轮的缩放比例
+TILE_SIZE = 512
+TILE_CACHE_MB = 96
+ZOOM_MAX_SCALE = 8.0
+ZOOM_STEP = 1.25
+
+# 读取EXIF信息时最多读取的文件头字节数
+EXIF_HEADER_BYTES = 256 * 1024
+
+# 重复照片：感知哈希（dHash）的边长、视为重复的最大汉明距离
+DHASH_SIZE = 8
+DUPLICATE_MAX_DISTANCE = 5
+
+# 后台计算哈希、读取EXIF、检查图片时每批处理的图片数（每批保存一次到图片目录）
+CATALOG_BATCH_SIZE = 500
+
+# 图片检查：完整解码检查时的解码尺寸、检查JPEG结束标记时读取的文件末尾字节数
+VALIDATION_DECODE_SIZE = 256
+JPEG_TAIL_BYTES = 1024
+
+# 缩略图：磁盘缓存目录、缓存图片尺寸、缩略图条中显示的尺寸和内存中保留的数量
+THUMBNAIL_DIR = os.path.join(os.path.dirname(SETTINGS_FILE), ".photo_album_thumbnails", "normal")
+THUMBNAIL_SIZE = 128
+THUMBNAIL_ICON_SIZE = 96
+THUMBNAIL_MEMORY_COUNT = 1000
+
+# 屏幕尺寸图片的磁盘缓存（启动时直接显示上次的图片）
+DISPLAY_CACHE_DIR = os.path.join(os.path.dirname(SETTINGS_FILE), ".photo_album_display_cache")
+DISPLAY_CACHE_QUALITY = 90
+
+# 慢速存储（网络文件夹）的本地缓存：缓存目录、总大小上限（MB）、同时复制的文件数、带宽上限（MB/秒，0为不限）、
+# 按播放顺序提前复制的图片数、每次读取的字节数
+STAGING_DIR = os.path.join(os.path.dirname(SETTINGS_FILE), ".photo_album_staging")
+STAGING_CACHE_MB = 2048
+STAGING_MAX_CONCURRENT = 2
+STAGING_BANDWIDTH_MBPS = 0
+STAGING_LOOKAHEAD = 20
+STAGING_CHUNK_BYTES = 256 * 1024
+# 判断慢速存储：每个文件夹保留的最近读取耗时样本数、判断所需的最少样本数、读取一个文件耗时的中位数阈值（毫秒）
+STAGING_LATENCY_SAMPLES = 9
+STAGING_MIN_SAMPLES = 3
+STAGING_SLOW_READ_MS = 50
+
+# 测试用：为指定文件夹下的文件读取增加人为延迟，模拟网络存储
+# 格式为"文件夹=毫秒"，多个文件夹用路径分隔符隔开，如 PHOTO_ALBUM_READ_LATENCY=/tmp/slow=200
+SIMULATED_READ_LATENCY = {}
+for _item in os.environ.get('PHOTO_ALBUM_READ_LATENCY', '').split(os.pathsep):
+    _root, _, _ms = _item.rpartition('=')
+    if _root:
+        try:
+            SIMULATED_READ_LATENCY[os.path.abspath(_root)] = float(_ms) / 1000
+        except ValueError:
+            pass
+
+# 性能统计：每个阶段保留的最近样本数、可导出的样本总数、HUD刷新间隔（毫秒）
+PERF_WINDOW_SIZE = 1000
+PERF_LOG_SIZE = 100000
+HUD_REFRESH_MS = 500
+
+# 性能统计的阶段名称
+PERF_STAGE_NAMES = {
+    'read': "读取",
+    'decode': "解码",
+    'scale': "缩放",
+    'set_pixmap': "设置",
+    'present': "上屏",
+    'tick': "切换间隔",
+    'late': "切换延迟",
+    'frame': "过渡帧间隔",
+    'first_image': "首张图片",
+}
+
+# 幻灯片：提前多久（毫秒）开始准备下一张，以及超过显示时间多久算作错过
+SLIDESHOW_PREPARE_LEAD_MS = 1500
+SLIDESHOW_LATE_TOLERANCE_MS = 20
+
+# 设置停止修改多久后（毫秒）写入文件，期间的多次修改合并为一次写入；连续修改时最多推迟多久
+SETTINGS_SAVE_DELAY_MS = 1000
+SETTINGS_MAX_DELAY_MS = 5000
+
+# 筛选栏停止输入多久后（毫秒）应用筛选条件
+FILTER_DEBOUNCE_MS = 250
+
+# 保存的播放列表在播放顺序下拉框中的前缀，以及加载时每条查询的id数（SQLite参数个数有上限）
+PLAYLIST_ORDER_PREFIX = "播放列表: "
+PLAYLIST_QUERY_CHUNK = 500
+# id区间不超过播放列表长度的多少倍时改用一次范围查询读取
+PLAYLIST_RANGE_FACTOR = 4
+
+
+def read_directory(path, is_cancelled=None):
+    """读取一个文件夹，返回(修改时间, 子文件夹名列表, [(图片文件名, 修改时间, 大小)])
+    
+    压缩包作为子文件夹列出；path为压缩包时列出其中的图片。读取失败时抛出OSError，被取消时返回None。
+    """
+    if path.lower().endswith(ARCHIVE_FORMATS) and os.path.isfile(path):
+        return read_archive(path)
+    # 先取文件夹的修改时间，读取过程中发生的变化会使记录的时间过期
+    mtime_ns = os.stat(path).st_mtime_ns
+    subdirs = []
+    files = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if is_cancelled is not None and is_cancelled():
+                return None
+            try:
+                if entry.is_dir():
+                    # 与os.walk一致，不进入符号链接指向的目录
+                    if not entry.is_symlink():
+                        subdirs.append(entry.name)
+                elif entry.name.lower().endswith(SUPPORTED_FORMATS) and entry.is_file():
+                    stat = entry.stat()
+                    files.append((entry.name, stat.st_mtime_ns, stat.st_size))
+                elif entry.name.lower().endswith(ARCHIVE_FORMATS) and entry.is_file():
+                    subdirs.append(entry.name)
+            except OSError:
+                continue
+    return mtime_ns, subdirs, files
+
+
+class ArchiveIndex:
+    """压缩包的成员索引，缓存在内存中
+    
+    ZIP只读取末尾的中央目录，TAR读取各成员的文件头（跳过数据）。读取成员时按索引中的偏移量
+    直接定位到成员数据，不必再解析整个压缩包。压缩包的修改时间或大小变化后索引自动失效。
+    """
+    # ZIP本地文件头的固定部分：签名、版本、标志、压缩方式、时间、CRC、大小、文件名长度、扩展字段长度
+    LOCAL_HEADER = struct.Struct('<4s22xHH')
+
+    def __init__(self, capacity=ARCHIVE_INDEX_CACHE):
+        self.capacity = capacity
+        self._indexes = OrderedDict()  # 压缩包路径 -> (修改时间, 大小, {成员名: (偏移量, 压缩后大小, 大小, 压缩方式)})
+        self._archives = {}  # 路径 -> 是否为压缩包文件
+        self._lock = threading.Lock()
+
+    def is_archive(self, path):
+        with self._lock:
+            result = self._archives.get(path)
+        if result is None:
+            result = os.path.isfile(path)
+            with self._lock:
+                self._archives[path] = result
+        return result
+
+    def split(self, image_path):
+        """把压缩包中图片的路径拆分为(压缩包路径, 成员名)，不在压缩包中时返回None"""
+        lower = image_path.lower()
+        for extension in ARCHIVE_FORMATS:
+            position = lower.find(extension + os.sep)
+            while position >= 0:
+                end = position + len(extension)
+                if self.is_archive(image_path[:end]):
+                    return image_path[:end], image_path[end + 1:].replace(os.sep, '/')
+                position = lower.find(extension + os.sep, end)
+        return None
+
+    def members(self, archive_path):
+        """返回压缩包的成员索引，读取失败时抛出OSError"""
+        stat = os.stat(archive_path)
+        with self._lock:
+            cached = self._indexes.get(archive_path)
+            if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                self._indexes.move_to_end(archive_path)
+                return cached[2]
+        members = self._read_index(archive_path)
+        with self._lock:
+            self._indexes[archive_path] = (stat.st_mtime_ns, stat.st_size, members)
+            self._archives[archive_path] = True
+            while len(self._indexes) > self.capacity:
+                self._indexes.popitem(last=False)
+        return members
+
+    @staticmethod
+    def _read_index(archive_path):
+        members = {}
+        try:
+            if archive_path.lower().endswith('.tar'):
+                with tarfile.open(archive_path, 'r:') as archive:
+                    for info in archive:
+                        if info.isfile() and info.name.lower().endswith(SUPPORTED_FORMATS):
+                            members[info.name] = (info.offset_data, info.size, info.size, None)
+            else:
+                with zipfile.ZipFile(archive_path) as archive:
+                    for info in archive.infolist():
+                        # 跳过加密的成员
+                        if (not info.is_dir() and not info.flag_bits & 0x1
+                                and info.filename.lower().endswith(SUPPORTED_FORMATS)):
+                            members[info.filename] = (info.header_offset, info.compress_size,
+                                                      info.file_size, info.compress_type)
+        except (tarfile.TarError, zipfile.BadZipFile) as e:
+            raise OSError(f"无法读取压缩包 {archive_path}: {e}")
+        return members
+
+    def stat(self, archive_path, member):
+        """返回成员的(修改时间, 大小)，修改时间使用压缩包的修改时间"""
+        entry = self.members(archive_path).get(member)
+        if entry is None:
+            raise FileNotFoundError(f"压缩包中没有 {member}: {archive_path}")
+        return os.stat(archive_path).st_mtime_ns, entry[2]
+
+    def read(self, archive_path, member):
+        """读取一个成员的全部内容"""
+        entry = self.members(archive_path).get(member)
+        if entry is None:
+            raise FileNotFoundError(f"压缩包中没有 {member}: {archive_path}")
+        offset, compressed_size, size, method = entry
+        with open(archive_path, 'rb') as f:
+            f.seek(offset)
+            if method is not None:
+                signature, name_length, extra_length = self.LOCAL_HEADER.unpack(f.read(self.LOCAL_HEADER.size))
+                if signature != b'PK\x03\x04':
+                    raise OSError(f"压缩包已损坏: {archive_path}")
+                f.seek(offset + self.LOCAL_HEADER.size + name_length + extra_length)
+            data = f.read(compressed_size)
+        if method is None or method == zipfile.ZIP_STORED:
+            return data
+        if method == zipfile.ZIP_DEFLATED:
+            try:
+                return zlib.decompress(data, -15)
+            except zlib.error as e:
+                raise OSError(f"解压 {member} 时出错: {e}")
+        # 其他压缩方式交给zipfile处理
+        try:
+            with zipfile.ZipFile(archive_path) as archive:
+                return archive.read(member)
+        except (zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+            raise OSError(f"解压 {member} 时出错: {e}")
+
+
+# 所有线程共用的压缩包索引
+archive_index = ArchiveIndex()
+
+# 图片文件的修改时间和大小（压缩包中的图片使用压缩包的修改时间）
+ImageStat = namedtuple('ImageStat', ['st_mtime_ns', 'st_mtime', 'st_size'])
+
+
+def read_archive(path):
+    """读取压缩包中的图片列表，格式与read_directory相同，成员名中的/换成路径分隔符"""
+    mtime_ns = os.stat(path).st_mtime_ns
+    files = [(name.replace('/', os.sep), mtime_ns, entry[2])
+             for name, entry in archive_index.members(path).items()]
+    return mtime_ns, [], files
+
+
+def stat_image(image_path):
+    """返回图片的修改时间和大小，压缩包中的图片也适用；文件不存在时抛出OSError"""
+    member = archive_index.split(image_path)
+    if member is None:
+        return os.stat(image_path)
+    mtime_ns, size = archive_index.stat(*member)
+    return ImageStat(mtime_ns, mtime_ns / 1e9, size)
+
+
+def image_file_path(image_path):
+    """图片在文件系统中对应的文件（压缩包中的图片为压缩包本身）"""
+    member = archive_index.split(image_path)
+    return image_path if member is None else member[0]
+
+
+@contextmanager
+def open_image_reader(image_path):
+    """打开图片的QImageReader，压缩包中的图片从内存中读取"""
+    member = archive_index.split(image_path)
+    if member is None:
+        yield QImageReader(image_path)
+        return
+    try:
+        data = QByteArray(archive_index.read(*member))
+    except OSError as e:
+        print(f"读取图片时出错: {e}")
+        data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.ReadOnly)
+    reader = QImageReader(buffer)
+    try:
+        yield reader
+    finally:
+        # 读取器必须先于缓冲区释放
+        reader.setDevice(None)
+        buffer.close()
+
+
+class ShuffleOrder:
+    """随机播放顺序：按需生成的Fisher–Yates洗牌排列，每一轮中每张图片恰好出现一次
+    
+    排列只在取下一张时才生成下一个元素（未交换过的位置不占内存），已生成的索引保存在
+    本轮的历史中，上一张/下一张都是O(1)操作。每一轮由种子和轮数确定，重启后按种子重放到
+    保存的位置即可恢复同一轮；为此记录本轮中排列范围扩大时已生成的数量。图片列表重新映射后
+    无法重放，映射后的历史作为本轮的起点（base）另外保存（见ImageCatalog.put_shuffle_base）。
+    """
+
+    def __init__(self, count=0, seed=None, cycle=0):
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.count = count
+        self.cycle = cycle
+        self._start_cycle()
+
+    def _start_cycle(self):
+        self._rng = random.Random(f"{self.seed}:{self.cycle}")
+        self._swaps = {}  # 排列中被交换过的位置 -> 该位置上的索引
+        self._drawn = 0
+        self.history = []  # 本轮已生成的索引
+        self.position = -1  # 当前图片在history中的位置
+        self.start_count = self.count  # 本轮开始（或重新映射）时的排列范围
+        self.resizes = []  # 排列范围变化时的[已生成的数量, 新的范围]
+        self.swapped = False  # 本轮的前两张是否因avoid交换过
+        self.remaps = 0  # 本轮重新映射的次数
+        self.base = None  # 最近一次重新映射后的历史
+
+    def reset(self, count=0):
+        """图片列表整体重建后从第一轮重新开始（保留种子）"""
+        self.count = count
+        self.cycle = 0
+        self._start_cycle()
+
+    def resize(self, count):
+        """图片追加到列表末尾后扩大排列范围，本轮尚未出现的新图片会在本轮中出现"""
+        if count == self.count:
+            return
+        if self.resizes and self.resizes[-1][0] == self._drawn:
+            self.resizes[-1][1] = count
+        else:
+            self.resizes.append([self._drawn, count])
+        self.count = count
+
+    def remap(self, mapping, count):
+        """图片列表发生插入或删除后重新映射索引，mapping(旧索引)返回新索引或None"""
+        history = []
+        position = -1
+        for i, index in enumerate(self.history):
+            new_index = mapping(index)
+            if new_index is None:
+                continue
+            history.append(new_index)
+            if i <= self.position:
+                position = len(history) - 1
+        self._restart_from(history, position, count)
+        self._rebase(self.remaps + 1, array('l', history))
+
+    def _rebase(self, remaps, base):
+        """以base为起点继续本轮，后面的索引使用新的随机数序列，重启后可从base重放"""
+        self.remaps = remaps
+        self.base = base
+        self._rng = random.Random(f"{self.seed}:{self.cycle}:{remaps}")
+        self.start_count = self.count
+        self.resizes = []
+        self.swapped = False
+
+    def _restart_from(self, history, position, count):
+        """以history为本轮已生成的索引继续本轮，其余索引在后面随机出现"""
+        drawn = set(history)
+        remaining = [index for index in range(count) if index not in drawn]
+        start = len(history)
+        self._swaps = {start + i: index for i, index in enumerate(remaining) if start + i != index}
+        self._drawn = start
+        self.history = history
+        self.position = position
+        self.count = count
+
+    def _draw(self):
+        i = self._drawn
+        j = self._rng.randrange(i, self.count)
+        value = self._swaps.get(j, j)
+        self._swaps[j] = self._swaps.pop(i, i)
+        self._drawn += 1
+        return value
+
+    def _extend(self, count):
+        """生成后续的count个索引（不超过本轮剩余的数量）"""
+        while len(self.history) - self.position - 1 < count and self._drawn < self.count:
+            self.history.append(self._draw())
+
+    def current(self):
+        return self.history[self.position] if self.position >= 0 else None
+
+    def next(self, avoid=None):
+        """下一张图片的索引，一轮结束后自动开始新的一轮
+        
+        avoid为正在显示的图片：一轮的第一张恰好是它时与第二张交换，不会连续显示同一张。
+        """
+        if self.count <= 0:
+            return None
+        self._extend(1)
+        if self.position + 1 >= len(self.history):
+            self.cycle += 1
+            self._start_cycle()
+            self._extend(1)
+        if self.position < 0 and avoid is not None and self.history[0] == avoid and self.count > 1:
+            self._extend(2)
+            self.history[0], self.history[1] = self.history[1], self.history[0]
+            self.swapped = True
+        self.position += 1
+        return self.history[self.position]
+
+    def prev(self):
+        """上一张图片的索引（回到本轮已播放过的图片），已在本轮开头时返回None"""
+        if self.position <= 0:
+            return None
+        self.position -= 1
+        return self.history[self.position]
+
+    def peek(self, count):
+        """接下来的count张图片的索引，不改变当前位置（用于预读）"""
+        self._extend(count)
+        return self.history[self.position + 1:self.position + 1 + count]
+
+    def upcoming(self):
+        """逐个生成接下来的图片索引直到本轮结束，不改变当前位置；只生成实际取用的部分"""
+        offset = self.position + 1
+        while True:
+            self._extend(offset - self.position)
+            if offset >= len(self.history):
+                return
+            yield self.history[offset]
+            offset += 1
+
+    def state(self):
+        """用于保存到设置文件的状态（不含已播放的索引，重启后按种子重放）"""
+        return {'seed': self.seed, 'cycle': self.cycle, 'position': self.position, 'count': self.count,
+                'start_count': self.start_count, 'resizes': self.resizes, 'swapped': self.swapped,
+                'remaps': self.remaps}
+
+    def base_key(self):
+        """base所属的轮次和重新映射次数，保存和读取base时用于核对"""
+        return f"{self.seed}:{self.cycle}:{self.remaps}"
+
+    @classmethod
+    def from_state(cls, state, saved_base=None):
+        """按种子重放到保存的位置，恢复同一轮已播放的图片，本轮其余的图片随后随机出现
+        
+        本轮重新映射过时需要传入保存的(base_key, base)。
+        """
+        shuffle = cls(state['start_count'], state['seed'], state['cycle'])
+        if state['remaps']:
+            shuffle.remaps = state['remaps']
+            if saved_base is None or saved_base[0] != shuffle.base_key():
+                raise ValueError("缺少重新映射后的随机播放记录")
+            base = saved_base[1]
+            if any(index >= shuffle.count for index in base):
+                raise ValueError("随机播放记录中的图片索引超出范围")
+            shuffle._restart_from(list(base), -1, shuffle.count)
+            shuffle._rebase(state['remaps'], base)
+        resizes = {drawn: count for drawn, count in state['resizes']}
+        length = max(state['position'] + 1, 2 if state['swapped'] else 0)
+        while len(shuffle.history) < length:
+            shuffle.count = resizes.get(shuffle._drawn, shuffle.count)
+            if shuffle._drawn >= shuffle.count:
+                raise ValueError("随机播放记录与排列范围不一致")
+            shuffle.history.append(shuffle._draw())
+        if state['swapped']:
+            shuffle.history[0], shuffle.history[1] = shuffle.history[1], shuffle.history[0]
+            shuffle.swapped = True
+        # 之后的范围变化发生在未重放的预读部分，按当前已生成的数量重新记录
+        shuffle.resizes = [[drawn, count] for drawn, count in state['resizes'] if drawn < shuffle._drawn]
+        shuffle.resize(state['count'])
+        shuffle.position = state['position']
+        return shuffle
+
+
+class ImageIndex:
+    """紧凑的图片列表：文件夹路径只保存一次，每张图片只记录文件夹编号和文件名
+    
+    文件名以UTF-8编码连续存放在一个bytearray中，配合偏移数组按索引O(1)取出，
+    百万张图片时占用的内存远小于完整路径字符串的列表。用法与只读的路径列表相同。
+    """
+
+    def __init__(self, paths=()):
+        self.folders = []  # 文件夹编号 -> 文件夹路径
+        self._folder_ids = {}  # 文件夹路径 -> 编号
+        self._file_folders = array('L')  # 图片索引 -> 文件夹编号
+        self._name_offsets = array('Q', [0])  # 图片索引 -> 文件名在_names中的起始位置
+        self._names = bytearray()
+        self.extend(paths)
+
+    def __len__(self):
+        return len(self._file_folders)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._file_folders)))]
+        if index < 0:
+            index += len(self._file_folders)
+        return os.path.join(self.folders[self._file_folders[index]], self.name(index))
+
+    def __iter__(self):
+        for index in range(len(self._file_folders)):
+            yield self[index]
+
+    def folder_id(self, folder):
+        """返回文件夹的编号，不存在时新建"""
+        folder_id = self._folder_ids.get(folder)
+        if folder_id is None:
+            folder_id = len(self.folders)
+            self.folders.append(folder)
+            self._folder_ids[folder] = folder_id
+        return folder_id
+
+    def find_folder(self, folder):
+        """返回文件夹的编号，不存在时返回None"""
+        return self._folder_ids.get(folder)
+
+    def folder(self, index):
+        """第index张图片所在的文件夹"""
+        return self.folders[self._file_folders[index]]
+
+    def folder_id_of(self, index):
+        return self._file_folders[index]
+
+    def name(self, index):
+        """第index张图片的文件名"""
+        start = self._name_offsets[index]
+        end = self._name_offsets[index + 1]
+        return self._names[start:end].decode('utf-8', 'surrogatepass')
+
+    def append_name(self, folder_id, name):
+        self._file_folders.append(folder_id)
+        self._names += name.encode('utf-8', 'surrogatepass')
+        self._name_offsets.append(len(self._names))
+
+    def append(self, path):
+        folder, name = os.path.split(path)
+        self.append_name(self.folder_id(folder), name)
+
+    def extend(self, paths):
+        # 同一文件夹的图片通常连续出现，缓存上一个文件夹的编号
+        last_folder = None
+        folder_id = None
+        for path in paths:
+            folder, name = os.path.split(path)
+            if folder != last_folder:
+                folder_id = self.folder_id(folder)
+                last_folder = folder
+            self.append_name(folder_id, name)
+
+    def find(self, path, start=0):
+        """查找图片的索引，不存在时返回-1"""
+        folder, name = os.path.split(path)
+        folder_id = self.find_folder(folder)
+        if folder_id is None:
+            return -1
+        for index in range(start, len(self._file_folders)):
+            if self._file_folders[index] == folder_id and self.name(index) == name:
+                return index
+        return -1
+
+    def index(self, path):
+        """与list.index相同，不存在时抛出ValueError"""
+        index = self.find(path)
+        if index < 0:
+            raise ValueError(f"{path} 不在图片列表中")
+        return index
+
+    def __contains__(self, path):
+        return self.find(path) >= 0
+
+    def memory_bytes(self):
+        """图片列表本身占用的大致内存（不含文件夹路径字符串）"""
+        return (self._file_folders.itemsize * len(self._file_folders)
+                + self._name_offsets.itemsize * len(self._name_offsets)
+                + len(self._names))
+
+
+class ImageFilter:
+    """图片筛选条件，由筛选栏中的文字解析而来，各条件同时满足
+    
+    - 普通文字：文件名包含该文字（可使用*和?通配符）
+    - folder:文字：所在文件夹的路径包含该文字
+    - ext:jpg,png：扩展名
+    - date:2024-05、after:2024-01-01、before:2024-12-31：文件修改日期（年、年-月或年-月-日）
+    - size>2MB、size<500KB：文件大小
+    """
+    SIZE_PATTERN = re.compile(r'^size([<>]=?)(\d+(?:\.\d+)?)([kmg]?b?)$', re.IGNORECASE)
+    SIZE_UNITS = {'': 1, 'b': 1, 'k': 1024, 'kb': 1024, 'm': 1024 ** 2, 'mb': 1024 ** 2, 'g': 1024 ** 3, 'gb': 1024 ** 3}
+
+    def __init__(self):
+        self.names = []  # 文件名条件（小写）
+        self.folders = []  # 文件夹条件（小写）
+        self.extensions = None  # 允许的扩展名集合（小写，含点）
+        self.mtime_range = [None, None]  # 修改时间范围（纳秒，左闭右开）
+        self.size_range = [None, None]  # 大小范围（字节，闭区间）
+
+    @classmethod
+    def parse(cls, text):
+        """解析筛选文字，格式有误时抛出ValueError"""
+        image_filter = cls()
+        try:
+            tokens = shlex.split(text)
+        except ValueError:
+            tokens = text.split()
+        for token in tokens:
+            key, separator, value = token.partition(':')
+            key = key.lower()
+            if separator and key in ('folder', 'ext', 'date', 'after', 'before'):
+                if not value:
+                    raise ValueError(f"{key}: 后缺少内容")
+                if key == 'folder':
+                    image_filter.folders.append(value.lower())
+                elif key == 'ext':
+                    extensions = {'.' + ext.lower().lstrip('.') for ext in value.split(',') if ext}
+                    image_filter.extensions = (extensions if image_filter.extensions is None
+                                               else image_filter.extensions & extensions)
+                else:
+                    start, end = cls.parse_period(value)
+                    if key in ('date', 'after'):
+                        image_filter.narrow(image_filter.mtime_range, start, None)
+                    if key in ('date', 'before'):
+                        image_filter.narrow(image_filter.mtime_range, None, end)
+                continue
+            match = cls.SIZE_PATTERN.match(token)
+            if match:
+                operator, number, unit = match.groups()
+                size = int(float(number) * cls.SIZE_UNITS[unit.lower()])
+                if operator.startswith('>'):
+                    image_filter.narrow(image_filter.size_range, size + (operator == '>'), None)
+                else:
+                    image_filter.narrow(image_filter.size_range, None, size - (operator == '<'))
+                continue
+            image_filter.names.append(token.lower())
+        return image_filter
+
+    @staticmethod
+    def parse_period(text):
+        """把"2024"、"2024-05"或"2024-05-01"解析为本地时间的(开始, 结束)纳秒数"""
+        parts = text.split('-')
+        try:
+            if not 1 <= len(parts) <= 3:
+                raise ValueError
+            numbers = [int(part) for part in parts]
+            # datetime.date拒绝不存在的日期（如2024-13、2024-02-30），mktime会把它们换算成别的日期
+            first = datetime.date(*numbers + [1] * (3 - len(numbers)))
+            if len(numbers) == 1:
+                last = datetime.date(first.year + 1, 1, 1)
+            elif len(numbers) == 2:
+                last = datetime.date(first.year + first.month // 12, first.month % 12 + 1, 1)
+            else:
+                last = first + datetime.timedelta(days=1)
+            start = time.mktime(first.timetuple())
+            end = time.mktime(last.timetuple())
+        except (ValueError, OverflowError):
+            raise ValueError(f"无效的日期: {text}")
+        return int(start * 1e9), int(end * 1e9)
+
+    @staticmethod
+    def narrow(bounds, low, high):
+        if low is not None:
+            bounds[0] = low if bounds[0] is None else max(bounds[0], low)
+        if high is not None:
+            bounds[1] = high if bounds[1] is None else min(bounds[1], high)
+
+    def match_name(self, name):
+        name = name.lower()
+        for pattern in self.names:
+            if '*' in pattern or '?' in pattern or '[' in pattern:
+                if not fnmatch.fnmatchcase(name, pattern):
+                    return False
+            elif pattern not in name:
+                return False
+        return True
+
+
+class LibraryIndex:
+    """图片库的内存索引，用于快速筛选
+    
+    文件名和文件夹使用ImageIndex中的数据；扩展名按编号保存，修改时间和大小从图片目录中读取，
+    筛选时不访问文件系统。图片列表只在末尾追加时可以增量更新。
+    百万张图片时建立索引和查询需要数百毫秒，只在FilterWorker的线程中使用。
+    """
+
+    def __init__(self):
+        self.extensions = []  # 扩展名编号 -> 扩展名
+        self._extension_ids = {}
+        self.file_extensions = array('H')  # 图片索引 -> 扩展名编号
+        self.mtimes = array('q')  # 图片索引 -> 修改时间（纳秒）
+        self.sizes = array('q')  # 图片索引 -> 大小
+
+    def __len__(self):
+        return len(self.mtimes)
+
+    def extend(self, images, catalog=None, end=None):
+        """为图片列表中新增的图片（到end为止）建立索引"""
+        listings = {}  # 文件夹 -> {文件名: (修改时间, 大小)}
+        for index in range(len(self.mtimes), len(images) if end is None else end):
+            folder = images.folder(index)
+            name = images.name(index)
+            files = listings.get(folder)
+            if files is None:
+                files = listings[folder] = self._catalog_listing(catalog, folder) if catalog is not None else {}
+            entry = files.get(name)
+            if entry is None:
+                # 图片目录中没有记录（如图片目录无法使用时）
+                try:
+                    stat = stat_image(os.path.join(folder, name))
+                    entry = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    entry = (0, 0)
+            extension = os.path.splitext(name)[1].lower()
+            extension_id = self._extension_ids.get(extension)
+            if extension_id is None:
+                extension_id = len(self.extensions)
+                self.extensions.append(extension)
+                self._extension_ids[extension] = extension_id
+            self.file_extensions.append(extension_id)
+            self.mtimes.append(entry[0])
+            self.sizes.append(entry[1])
+
+    @staticmethod
+    def _catalog_listing(catalog, folder):
+        """图片目录中记录的一个文件夹的{文件名: (修改时间, 大小)}"""
+        try:
+            listing = catalog.get_directory(folder)
+            if listing is not None:
+                return {entry[0]: entry[1:] for entry in listing[2]}
+            # 压缩包中子文件夹里的图片记录在压缩包下，成员名带有子文件夹
+            member = archive_index.split(os.path.join(folder, ''))
+            if member is None:
+                return {}
+            listing = catalog.get_directory(member[0])
+        except sqlite3.Error:
+            return {}
+        if listing is None:
+            return {}
+        prefix = member[1].replace('/', os.sep)
+        return {entry[0][len(prefix):]: entry[1:] for entry in listing[2] if entry[0].startswith(prefix)}
+
+    def query(self, images, image_filter, start=0, end=None):
+        """返回[start, end)中符合条件的图片索引（按图片列表顺序）"""
+        extension_ids = None
+        if image_filter.extensions is not None:
+            extension_ids = {extension_id for extension_id, extension in enumerate(self.extensions)
+                             if extension in image_filter.extensions}
+        # 文件夹条件按文件夹编号只判断一次
+        folder_matches = {}
+        low_mtime, high_mtime = image_filter.mtime_range
+        low_size, high_size = image_filter.size_range
+        result = array('l')
+        for index in range(start, len(self.mtimes) if end is None else end):
+            if extension_ids is not None and self.file_extensions[index] not in extension_ids:
+                continue
+            if low_mtime is not None and self.mtimes[index] < low_mtime:
+                continue
+            if high_mtime is not None and self.mtimes[index] >= high_mtime:
+                continue
+            if low_size is not None and self.sizes[index] < low_size:
+                continue
+            if high_size is not None and self.sizes[index] > high_size:
+                continue
+            if image_filter.folders:
+                folder_id = images.folder_id_of(index)
+                matched = folder_matches.get(folder_id)
+                if matched is None:
+                    folder = images.folders[folder_id].lower()
+                    matched = all(pattern in folder for pattern in image_filter.folders)
+                    folder_matches[folder_id] = matched
+                if not matched:
+                    continue
+            if image_filter.names and not image_filter.match_name(images.name(index)):
+                continue
+            result.append(index)
+        return result
+
+
+class SavedPlaylist:
+    """保存的播放列表与当前图片列表的对应关系
+    
+    播放列表中的图片按(文件夹, 文件名)记录，随扫描结果逐批对应到图片索引。
+    尚未扫描到或已不在图片库中的图片只是不参与播放，不需要逐个检查文件是否存在。
+    """
+
+    def __init__(self, name, entries):
+        self.name = name
+        self.entries = entries  # [(文件夹, 文件名)]，按播放顺序
+        self.reset()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def reset(self):
+        """图片列表重建后重新对应"""
+        self.indices = array('l', [-1]) * len(self.entries)  # 播放列表位置 -> 图片索引（未对应为-1）
+        self.resolved = 0  # 已对应的图片数
+        self._checked = 0  # 已检查过的图片列表长度
+        self._unresolved = {}  # 文件夹 -> {文件名: 播放列表位置}
+        for position, (folder, name) in enumerate(self.entries):
+            if os.sep in name:
+                # 压缩包子文件夹中的图片在图片列表中属于子文件夹
+                folder, name = os.path.split(os.path.join(folder, name))
+            self._unresolved.setdefault(folder, {}).setdefault(name, position)
+
+    def resolve(self, images):
+        """为图片列表中新增的图片找到在播放列表中的位置，返回是否有新对应的图片"""
+        found = self.resolved
+        folder_names = {}  # 文件夹编号 -> {文件名: 播放列表位置}，不在播放列表中的文件夹为None
+        for index in range(self._checked, len(images)):
+            folder_id = images.folder_id_of(index)
+            if folder_id in folder_names:
+                names = folder_names[folder_id]
+            else:
+                names = folder_names[folder_id] = self._unresolved.get(images.folders[folder_id])
+            if names:
+                position = names.pop(images.name(index), None)
+                if position is not None:
+                    self.indices[position] = index
+                    self.resolved += 1
+        self._checked = len(images)
+        return self.resolved != found
+
+    def order(self, count, allowed=None):
+        """返回(顺序, 位置)：顺序为已对应的图片索引，位置为图片索引 -> 在顺序中的位置
+        
+        allowed为筛选后的位置数组时只保留符合筛选条件的图片。
+        """
+        order = array('l')
+        positions = array('l', [-1]) * count
+        for index in self.indices:
+            if index >= 0 and (allowed is None or allowed[index] >= 0):
+                positions[index] = len(order)
+                order.append(index)
+        return order, positions
+
+
+class SettingsStore(QObject):
+    """设置文件的延迟保存
+    
+    修改设置时只标记为待保存，延迟一段时间后在主线程中收集设置，再由后台线程写入；
+    内容没有变化时不写入。写入时先写临时文件再重命名，避免中途中断导致文件损坏。
+    """
+
+    def __init__(self, path, collect, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.collect = collect  # 返回设置字典的函数（需要在主线程中调用）
+        self._lock = threading.Lock()
+        self._pending_text = None
+        self._last_written = None
+        self._writer = None
+        self._dirty_since = 0.0
+        # 记录文件的现有内容，设置没有变化时不必重写
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self._last_written = f.read()
+        except (OSError, UnicodeDecodeError):
+            pass
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush_async)
+
+    def mark_dirty(self):
+        """标记设置已修改，停止修改一段时间后保存（连续修改时最多推迟SETTINGS_MAX_DELAY_MS）"""
+        now = time.monotonic()
+        if not self.timer.isActive():
+            self._dirty_since = now
+        elif (now - self._dirty_since) * 1000 >= SETTINGS_MAX_DELAY_MS:
+            return
+        self.timer.start(SETTINGS_SAVE_DELAY_MS)
+
+    def flush_async(self):
+        """在后台线程中保存设置"""
+        text = self._serialize()
+        if text is None:
+            return
+        with self._lock:
+            if self._writer is not None:
+                # 正在写入的可能是更早的内容，交给写入线程写入最新的内容（与已写入的相同时跳过）
+                self._pending_text = text
+                return
+            if text == self._last_written:
+                return
+            self._pending_text = text
+            self._writer = threading.Thread(target=self._write_pending, daemon=True)
+            self._writer.start()
+
+    def flush(self):
+        """立即保存设置（程序退出时调用）"""
+        self.timer.stop()
+        text = self._serialize()
+        with self._lock:
+            self._pending_text = None
+            writer = self._writer
+        if writer is not None:
+            writer.join()
+        with self._lock:
+            unchanged = text == self._last_written
+        if text is not None and not unchanged:
+            self._write_file(text)
+
+    def _serialize(self):
+        try:
+            return json.dumps(self.collect(), ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"保存设置时出错: {e}")
+            return None
+
+    def _write_pending(self):
+        while True:
+            with self._lock:
+                text = self._pending_text
+                self._pending_text = None
+                if text is None:
+                    self._writer = None
+                    return
+                if text == self._last_written:
+                    continue
+            self._write_file(text)
+
+    def _write_file(self, text):
+        temp_path = self.path + ".tmp"
+        try:
+            # 创建目录（如果不存在）
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+            with self._lock:
+                self._last_written = text
+        except OSError as e:
+            print(f"保存设置时出错: {e}")
+
+
+class ImageCatalog:
+    """持久化的图片目录（SQLite），记录每个文件夹的修改时间、子文件夹和图片文件
+    
+    sqlite3连接不能跨线程使用，每个线程需要创建自己的ImageCatalog。
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS dirs (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            subdirs TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dir TEXT NOT NULL,
+            name TEXT NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            UNIQUE (dir, name)
+        );
+        CREATE TABLE IF NOT EXISTS hashes (
+            dir TEXT NOT NULL,
+            name TEXT NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            dhash INTEGER NOT NULL,
+            PRIMARY KEY (dir, name)
+        );
+        CREATE TABLE IF NOT EXISTS metadata (
+            dir TEXT NOT NULL,
+            name TEXT NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            taken INTEGER,
+            orientation INTEGER NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            PRIMARY KEY (dir, name)
+        );
+        CREATE TABLE IF NOT EXISTS validation (
+            dir TEXT NOT NULL,
+            name TEXT NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            full_decode INTEGER NOT NULL,
+            error TEXT NOT NULL,
+            PRIMARY KEY (dir, name)
+        );
+        CREATE TABLE IF NOT EXISTS playlists (
+            name TEXT PRIMARY KEY,
+            file_ids BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS shuffle_base (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            key TEXT NOT NULL,
+            indices BLOB NOT NULL
+        );
+    """
+
+    def __init__(self, path=CATALOG_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        # WAL模式下扫描线程写入时，其他线程仍可读取
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    def get_directory(self, path):
+        """返回(修改时间, 子文件夹名列表, [(文件名, 修改时间, 大小)])，未记录时返回None"""
+        row = self.conn.execute("SELECT mtime_ns, subdirs FROM dirs WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return None
+        subdirs = json.loads(row[1])
+        files = self.conn.execute(
+            "SELECT name, mtime_ns, size FROM files WHERE dir = ? ORDER BY id", (path,)).fetchall()
+        return row[0], subdirs, files
+
+    def update_directory(self, path, mtime_ns, subdirs, files):
+        """更新一个文件夹的记录，files为[(文件名, 修改时间, 大小)]"""
+        row = self.conn.execute("SELECT subdirs FROM dirs WHERE path = ?", (path,)).fetchone()
+        if row is not None:
+            # 已删除的子文件夹连同其下所有记录一起移除
+            for name in set(json.loads(row[0])) - set(subdirs):
+                self.remove_tree(os.path.join(path, name))
+        self.conn.execute("INSERT OR REPLACE INTO dirs (path, mtime_ns, subdirs) VALUES (?, ?, ?)",
+                          (path, mtime_ns, json.dumps(subdirs, ensure_ascii=False)))
+        
+        names = {name for name, _, _ in files}
+        stale = [(path, name) for (name,) in self.conn.execute("SELECT name FROM files WHERE dir = ?", (path,))
+                 if name not in names]
+        self.conn.executemany("DELETE FROM files WHERE dir = ? AND name = ?", stale)
+        # 保留已有记录的id，只更新修改时间和大小
+        self.conn.executemany(
+            "INSERT INTO files (dir, name, mtime_ns, size) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (dir, name) DO UPDATE SET mtime_ns = excluded.mtime_ns, size = excluded.size",
+            [(path, name, mtime_ns, size) for name, mtime_ns, size in files])
+
+    def remove_tree(self, path):
+        """删除一个文件夹及其所有子文件夹的记录"""
+        path = path.rstrip("/\\")
+        lower = path + os.sep
+        upper = path + chr(ord(os.sep) + 1)
+        self.conn.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (path, lower, upper))
+        self.conn.execute("DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)", (path, lower, upper))
+        self.conn.execute("DELETE FROM hashes WHERE dir = ? OR (dir >= ? AND dir < ?)", (path, lower, upper))
+        self.conn.execute("DELETE FROM metadata WHERE dir = ? OR (dir >= ? AND dir < ?)", (path, lower, upper))
+        self.conn.execute("DELETE FROM validation WHERE dir = ? OR (dir >= ? AND dir < ?)", (path, lower, upper))
+
+    def get_hash(self, path, mtime_ns, size):
+        """返回图片的感知哈希，未记录或文件已变化时返回None"""
+        directory, name = os.path.split(path)
+        row = self.conn.execute("SELECT mtime_ns, size, dhash FROM hashes WHERE dir = ? AND name = ?",
+                                (directory, name)).fetchone()
+        if row is None or row[0] != mtime_ns or row[1] != size:
+            return None
+        # SQLite只支持有符号64位整数
+        return row[2] & 0xFFFFFFFFFFFFFFFF
+
+    def get_metadata(self, path, mtime_ns, size):
+        """返回(拍摄时间, EXIF方向, 宽, 高)，未记录或文件已变化时返回None"""
+        directory, name = os.path.split(path)
+        row = self.conn.execute(
+            "SELECT mtime_ns, size, taken, orientation, width, height FROM metadata WHERE dir = ? AND name = ?",
+            (directory, name)).fetchone()
+        if row is None or row[0] != mtime_ns or row[1] != size:
+            return None
+        return row[2:]
+
+    def put_metadata(self, rows):
+        """记录图片信息，rows为[(路径, 修改时间, 大小, (拍摄时间, EXIF方向, 宽, 高))]"""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO metadata (dir, name, mtime_ns, size, taken, orientation, width, height) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [os.path.split(path) + (mtime_ns, size) + tuple(metadata)
+             for path, mtime_ns, size, metadata in rows])
+
+    def get_orientations(self):
+        """返回上次读取的需要旋转或翻转的图片的EXIF方向 {路径: 方向}"""
+        return {os.path.join(directory, name): orientation for directory, name, orientation in
+                self.conn.execute("SELECT dir, name, orientation FROM metadata WHERE orientation != 1")}
+
+    def get_validation(self, path, mtime_ns, size, full_decode):
+        """返回图片的检查结果（空字符串表示正常），未记录、文件已变化或检查不够完整时返回None"""
+        directory, name = os.path.split(path)
+        row = self.conn.execute(
+            "SELECT mtime_ns, size, full_decode, error FROM validation WHERE dir = ? AND name = ?",
+            (directory, name)).fetchone()
+        if row is None or row[0] != mtime_ns or row[1] != size:
+            return None
+        # 只检查了文件头的正常结果不能代替完整解码检查
+        if full_decode and not row[2] and not row[3]:
+            return None
+        return row[3]
+
+    def put_validation(self, rows, full_decode):
+        """记录检查结果，rows为[(路径, 修改时间, 大小, 错误原因)]"""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO validation (dir, name, mtime_ns, size, full_decode, error) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [os.path.split(path) + (mtime_ns, size, int(full_decode), error)
+             for path, mtime_ns, size, error in rows])
+
+    def playlist_names(self):
+        """所有保存的播放列表名称"""
+        return [name for (name,) in self.conn.execute("SELECT name FROM playlists ORDER BY name")]
+
+    def save_playlist(self, name, paths):
+        """按顺序保存播放列表（同名时覆盖），返回保存的图片数（不在图片目录中的图片不保存）
+        
+        只保存图片在files表中的id（每张8字节），不重复保存路径。
+        """
+        ids = self.file_ids(paths)
+        self._write_playlist(name, ids)
+        return len(ids)
+
+    def append_playlist(self, name, paths):
+        """把图片追加到播放列表末尾（已在其中的图片不重复添加），播放列表不存在时新建，返回追加的图片数"""
+        ids = self._read_playlist(name) or array('q')
+        existing = set(ids)
+        added = 0
+        for file_id in self.file_ids(paths):
+            if file_id not in existing:
+                existing.add(file_id)
+                ids.append(file_id)
+                added += 1
+        self._write_playlist(name, ids)
+        return added
+
+    def file_ids(self, paths):
+        """图片在files表中的id（按paths的顺序，不在图片目录中的图片跳过）"""
+        ids = array('q')
+        listings = {}  # 文件夹 -> {文件名: id}
+        for path in paths:
+            directory, file_name = self.file_key(path)
+            listing = listings.get(directory)
+            if listing is None:
+                listing = dict(self.conn.execute("SELECT name, id FROM files WHERE dir = ?", (directory,)))
+                listings[directory] = listing
+            file_id = listing.get(file_name)
+            if file_id is not None:
+                ids.append(file_id)
+        return ids
+
+    def file_stat(self, path):
+        """图片在files表中记录的修改时间和大小（ImageStat），没有记录时返回None"""
+        row = self.conn.execute("SELECT mtime_ns, size FROM files WHERE dir = ? AND name = ?",
+                                self.file_key(path)).fetchone()
+        if row is None:
+            return None
+        return ImageStat(row[0], row[0] / 1e9, row[1])
+
+    def _read_playlist(self, name):
+        row = self.conn.execute("SELECT file_ids FROM playlists WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        # 按小端序保存，在不同字节序的机器之间通用
+        ids = array('q')
+        ids.frombytes(row[0])
+        if sys.byteorder != 'little':
+            ids.byteswap()
+        return ids
+
+    def _write_playlist(self, name, ids):
+        data = array('q', ids)
+        if sys.byteorder != 'little':
+            data.byteswap()
+        self.conn.execute("INSERT OR REPLACE INTO playlists (name, file_ids) VALUES (?, ?)",
+                          (name, data.tobytes()))
+        self.conn.commit()
+
+    def load_playlist(self, name):
+        """返回播放列表中图片的(文件夹, 文件名)列表，播放列表不存在时返回None
+        
+        已从图片目录中删除的图片直接跳过。
+        """
+        ids = self._read_playlist(name)
+        if ids is None:
+            return None
+        if not ids:
+            return []
+        entries = {}
+        low, high = min(ids), max(ids)
+        if high - low < PLAYLIST_RANGE_FACTOR * len(ids):
+            # 同一文件夹的图片id连续，播放列表占id区间的大部分时一次范围查询比逐个查找快得多
+            for file_id, directory, file_name in self.conn.execute(
+                    "SELECT id, dir, name FROM files WHERE id BETWEEN ? AND ?", (low, high)):
+                entries[file_id] = (directory, file_name)
+        else:
+            for start in range(0, len(ids), PLAYLIST_QUERY_CHUNK):
+                chunk = ids[start:start + PLAYLIST_QUERY_CHUNK]
+                query = "SELECT id, dir, name FROM files WHERE id IN (%s)" % ",".join("?" * len(chunk))
+                for file_id, directory, file_name in self.conn.execute(query, chunk):
+                    entries[file_id] = (directory, file_name)
+        return [entries[file_id] for file_id in ids if file_id in entries]
+
+    def delete_playlist(self, name):
+        self.conn.execute("DELETE FROM playlists WHERE name = ?", (name,))
+        self.conn.commit()
+
+    def put_shuffle_base(self, key, indices):
+        """保存随机播放重新映射后的起点（只保留最近一次，见ShuffleOrder）"""
+        data = array('q', indices)
+        if sys.byteorder != 'little':
+            data.byteswap()
+        self.conn.execute("INSERT OR REPLACE INTO shuffle_base (id, key, indices) VALUES (0, ?, ?)",
+                          (key, data.tobytes()))
+        self.conn.commit()
+
+    def get_shuffle_base(self):
+        """返回(key, 索引数组)，没有保存过时返回None"""
+        row = self.conn.execute("SELECT key, indices FROM shuffle_base WHERE id = 0").fetchone()
+        if row is None:
+            return None
+        indices = array('q')
+        indices.frombytes(row[1])
+        if sys.byteorder != 'little':
+            indices.byteswap()
+        return row[0], indices
+
+    @staticmethod
+    def file_key(path):
+        """图片在files表中的(文件夹, 文件名)：压缩包中的图片记录在压缩包下，成员名可以包含子文件夹"""
+        member = archive_index.split(path)
+        if member is None:
+            return os.path.split(path)
+        return member[0], member[1].replace('/', os.sep)
+
+    def put_hashes(self, rows):
+        """记录感知哈希，rows为[(路径, 修改时间, 大小, 哈希)]"""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO hashes (dir, name, mtime_ns, size, dhash) VALUES (?, ?, ?, ?, ?)",
+            [os.path.split(path) + (mtime_ns, size, value - (1 << 64) if value >= 1 << 63 else value)
+             for path, mtime_ns, size, value in rows])
+
+
+class FolderScanner(QThread):
+    """在后台线程中扫描文件夹，分批发送找到的图片
+    
+    文件夹的修改时间与图片目录中的记录一致时直接使用记录的内容，
+    只有修改时间变化的文件夹才会重新读取。
+    """
+    batch_found = pyqtSignal(list)  # 新找到的一批图片路径
+    progress = pyqtSignal(int, int)  # 已扫描文件夹数, 已找到图片数
+    directories_scanned = pyqtSignal(list)  # 本批扫描过的文件夹（用于监视文件夹变化）
+
+    def __init__(self, folders, include_subfolders, parent=None, catalog_file=CATALOG_FILE):
+        super().__init__(parent)
+        self.folders = list(folders)
+        self.include_subfolders = include_subfolders
+        self.catalog_file = catalog_file
+        self._cancelled = False
+        self.dirs_scanned = 0
+        self.dirs_changed = 0
+        self.images_found = 0
+        self._directories = []
+
+    def cancel(self):
+        """请求取消扫描（扫描线程会在处理下一个条目前退出）"""
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
+
+    def run(self):
+        catalog = None
+        if self.catalog_file:
+            try:
+                catalog = ImageCatalog(self.catalog_file)
+            except sqlite3.Error as e:
+                print(f"打开图片目录时出错: {e}")
+        try:
+            self._scan(catalog)
+        finally:
+            if catalog is not None:
+                catalog.close()
+
+    def _scan(self, catalog):
+        batch = []
+        last_emit = time.monotonic()
+        for folder in self.folders:
+            # 使用栈代替递归，保持与os.walk相同的自顶向下遍历顺序
+            stack = [folder]
+            while stack and not self._cancelled:
+                current = stack.pop()
+                listing = self._list_directory(catalog, current)
+                self.dirs_scanned += 1
+                if listing is None:
+                    continue
+                self._directories.append(current)
+                subdirs, files = listing
+                for name in files:
+                    batch.append(os.path.join(current, name))
+                    if len(batch) >= SCAN_BATCH_SIZE:
+                        self._emit_batch(batch)
+                        batch = []
+                        last_emit = time.monotonic()
+                if self.include_subfolders:
+                    stack.extend(os.path.join(current, name) for name in reversed(subdirs))
+
+                # 第一批图片尽快发出，之后按时间间隔合并发送
+                now = time.monotonic()
+                if batch and (self.images_found == 0 or now - last_emit >= SCAN_BATCH_INTERVAL):
+                    self._emit_batch(batch)
+                    batch = []
+                    last_emit = now
+                    if catalog is not None:
+                        catalog.commit()
+            if self._cancelled:
+                return
+        if batch:
+            self._emit_batch(batch)
+        if self._directories:
+            self.directories_scanned.emit(self._directories)
+            self._directories = []
+        self.progress.emit(self.dirs_scanned, self.images_found)
+
+    def _list_directory(self, catalog, path):
+        """返回(子文件夹名列表, 图片文件名列表)，出错或取消时返回None"""
+        if catalog is not None:
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError as e:
+                print(f"扫描文件夹时出错: {e}")
+                return None
+            cached = catalog.get_directory(path)
+            if cached is not None and cached[0] == mtime_ns:
+                return cached[1], [name for name, _, _ in cached[2]]
+        
+        try:
+            listing = read_directory(path, self.is_cancelled)
+        except OSError as e:
+            print(f"扫描文件夹时出错: {e}")
+            return None
+        if listing is None:
+            return None
+        mtime_ns, subdirs, files = listing
+        
+        self.dirs_changed += 1
+        if catalog is not None:
+            try:
+                catalog.update_directory(path, mtime_ns, subdirs, files)
+            except sqlite3.Error as e:
+                print(f"更新图片目录时出错: {e}")
+        return subdirs, [name for name, _, _ in files]
+
+    def _emit_batch(self, batch):
+        self.images_found += len(batch)
+        self.batch_found.emit(batch)
+        if self._directories:
+            self.directories_scanned.emit(self._directories)
+            self._directories = []
+        self.progress.emit(self.dirs_scanned, self.images_found)
+
+
+def process_memory_mb():
+    """当前进程占用的物理内存（MB），无法获取时返回None"""
+    try:
+        if sys.platform == 'win32':
+            class ProcessMemoryCounters(ctypes.Structure):
+                _fields_ = [('cb', ctypes.c_ulong), ('PageFaultCount', ctypes.c_ulong),
+                            ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                            ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+            counters = ProcessMemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize / (1024 * 1024)
+            return None
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, AttributeError, ValueError):
+        return None
+
+
+def dhash_image(image_path):
+    """计算图片的感知哈希（dHash，64位），无法解码时返回None
+    
+    先按小尺寸解码（JPEG可直接缩小解码），转为灰度后缩小到9x8，
+    每行相邻像素比较亮度得到一位。
+    """
+    with open_image_reader(image_path) as reader:
+        size = reader.size()
+        if size.isValid() and reader.supportsOption(QImageIOHandler.ScaledSize):
+            reader.setScaledSize(size.scaled(QSize(64, 64), Qt.KeepAspectRatioByExpanding))
+        image = reader.read()
+    if image.isNull():
+        return None
+    image = image.convertToFormat(QImage.Format_Grayscale8).scaled(
+        DHASH_SIZE + 1, DHASH_SIZE, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    value = 0
+    for y in range(DHASH_SIZE):
+        row = [image.pixelColor(x, y).value() for x in range(DHASH_SIZE + 1)]
+        for x in range(DHASH_SIZE):
+            value = (value << 1) | (row[x] > row[x + 1])
+    return value
+
+
+def validate_image(image_path, full_decode=False):
+    """检查图片能否显示，正常时返回空字符串，否则返回原因
+    
+    默认只读取文件头；full_decode为True时还检查JPEG是否被截断并按小尺寸完整解码一次。
+    """
+    with open_image_reader(image_path) as reader:
+        can_read = reader.canRead()
+        image_format = bytes(reader.format()).lower()
+    if not can_read:
+        try:
+            stat_image(image_path)
+        except OSError:
+            return "文件不存在"
+        return "不是可识别的图片"
+    if not full_decode:
+        return ""
+    
+    try:
+        data = read_image_file(image_path)
+    except OSError:
+        return "无法读取文件"
+    # 截断的JPEG仍能解码出一部分（其余为灰色），只能通过结束标记判断
+    if image_format in (b'jpeg', b'jpg') and not data.right(JPEG_TAIL_BYTES).contains(b'\xff\xd9'):
+        return "文件不完整"
+    if decode_scaled_image(data, QSize(VALIDATION_DECODE_SIZE, VALIDATION_DECODE_SIZE)).isNull():
+        return "无法解码"
+    return ""
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """按汉明距离组织的BK树，用于查找相近的感知哈希"""
+
+    def __init__(self):
+        self.root = None  # (哈希, 条目, {距离: 子节点})
+
+    def add(self, value, item):
+        if self.root is None:
+            self.root = (value, item, {})
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, item, {})
+                return
+            node = child
+
+    def find(self, value, max_distance):
+        """返回距离不超过max_distance的最近条目，没有时返回None"""
+        best = None
+        best_distance = max_distance + 1
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming_distance(value, node_value)
+            if distance < best_distance:
+                best, best_distance = item, distance
+            # 三角不等式：只有距离在[d-r, d+r]内的子树可能包含结果
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return best
+
+
+class CatalogTask(QThread):
+    """为每张图片计算一项信息的后台线程基类
+    
+    结果按文件修改时间和大小保存在图片目录中，文件未变化时直接使用；未保存的图片在线程池中
+    并行计算，每批保存一次。子类实现：
+    
+    - lookup(catalog, path, mtime_ns, size)：从图片目录中取出已保存的结果，没有时返回None
+    - compute(path)：计算一张图片的结果（在线程池中调用）
+    - store(catalog, rows)：保存一批结果，rows为[(路径, 修改时间, 大小, 结果)]
+    - finish(results)：处理全部结果，results[i]为(修改时间, 结果)，文件无法访问时为None
+    
+    需要解码图片的子类设置CPU_BOUND，线程池给界面线程留出一个核心；只读取文件头的子类以读取为主，
+    至少使用两个线程。
+    """
+    progress = pyqtSignal(int, int)  # 已处理图片数, 总数
+    CPU_BOUND = False
+
+    def __init__(self, paths, parent=None, catalog_file=CATALOG_FILE):
+        super().__init__(parent)
+        # 可以直接传入ImageIndex，需要时才生成路径字符串（扫描完成后才启动，之后图片列表变化时换成新的ImageIndex）
+        self.paths = paths
+        self.catalog_file = catalog_file
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        catalog = None
+        if self.catalog_file:
+            try:
+                catalog = ImageCatalog(self.catalog_file)
+            except sqlite3.Error as e:
+                print(f"打开图片目录时出错: {e}")
+        try:
+            results = self._process(catalog)
+        finally:
+            if catalog is not None:
+                catalog.close()
+        if results is not None and not self._cancelled:
+            self.finish(results)
+
+    def _process(self, catalog):
+        total = len(self.paths)
+        results = [None] * total
+        missing = []  # (索引, 修改时间, 大小)
+        for index, path in enumerate(self.paths):
+            if self._cancelled:
+                return None
+            try:
+                stat = stat_image(path)
+            except OSError:
+                continue
+            cached = self.lookup(catalog, path, stat.st_mtime_ns, stat.st_size) if catalog is not None else None
+            if cached is None:
+                missing.append((index, stat.st_mtime_ns, stat.st_size))
+            else:
+                results[index] = (stat.st_mtime_ns, cached)
+        
+        done = total - len(missing)
+        self.progress.emit(done, total)
+        if self.CPU_BOUND:
+            workers = max(1, QThread.idealThreadCount() - 1)
+        else:
+            workers = max(2, QThread.idealThreadCount())
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for start in range(0, len(missing), CATALOG_BATCH_SIZE):
+                if self._cancelled:
+                    return None
+                batch = missing[start:start + CATALOG_BATCH_SIZE]
+                rows = []
+                for (index, mtime_ns, size), value in zip(
+                        batch, pool.map(self.compute, [self.paths[index] for index, _, _ in batch])):
+                    results[index] = (mtime_ns, value)
+                    if value is not None:
+                        rows.append((self.paths[index], mtime_ns, size, value))
+                if catalog is not None:
+                    try:
+                        self.store(catalog, rows)
+                        catalog.commit()
+                    except sqlite3.Error as e:
+                        print(f"保存到图片目录时出错: {e}")
+                done += len(batch)
+                self.progress.emit(done, total)
+        return results
+
+
+class DuplicateFinder(CatalogTask):
+    """在后台计算图片的感知哈希并找出重复照片
+    
+    按列表顺序，每组相近的照片只保留第一张，其余的作为重复照片发出。
+    """
+    duplicates_found = pyqtSignal(list)  # 重复照片的路径
+    CPU_BOUND = True
+
+    def lookup(self, catalog, path, mtime_ns, size):
+        return catalog.get_hash(path, mtime_ns, size)
+
+    def compute(self, path):
+        return dhash_image(path)
+
+    def store(self, catalog, rows):
+        catalog.put_hashes(rows)
+
+    def finish(self, results):
+        tree = BKTree()
+        duplicates = []
+        for path, result in zip(self.paths, results):
+            if self._cancelled:
+                return
+            if result is None or result[1] is None:
+                continue
+            value = result[1]
+            if tree.find(value, DUPLICATE_MAX_DISTANCE) is not None:
+                duplicates.append(path)
+            else:
+                tree.add(value, path)
+        self.duplicates_found.emit(duplicates)
+
+
+class MetadataReader(CatalogTask):
+    """在后台读取图片的EXIF信息（拍摄时间、方向、尺寸），只读取文件头
+    
+    没有拍摄时间的图片使用文件修改时间。
+    """
+    metadata_ready = pyqtSignal(object)  # (拍摄时间array, {路径: 需要旋转的EXIF方向})
+
+    def lookup(self, catalog, path, mtime_ns, size):
+        return catalog.get_metadata(path, mtime_ns, size)
+
+    def compute(self, path):
+        try:
+            return read_image_metadata(path)
+        except OSError:
+            return None
+
+    def store(self, catalog, rows):
+        catalog.put_metadata(rows)
+
+    def finish(self, results):
+        taken = array('q', bytes(8 * len(results)))
+        orientations = {}
+        for index, result in enumerate(results):
+            if result is None:
+                continue
+            mtime_ns, metadata = result
+            if metadata is None or metadata[0] is None:
+                taken[index] = mtime_ns // 1000000000
+                if metadata is None:
+                    continue
+            else:
+                taken[index] = metadata[0]
+            if metadata[1] != 1:
+                orientations[self.paths[index]] = metadata[1]
+        self.metadata_ready.emit((taken, orientations))
+
+
+class ImageValidator(CatalogTask):
+    """在后台检查图片能否显示，找出损坏或不是图片的文件"""
+    invalid_found = pyqtSignal(dict)  # {路径: (原因, 修改时间)}
+    CPU_BOUND = True
+
+    def __init__(self, paths, full_decode=False, parent=None, catalog_file=CATALOG_FILE):
+        super().__init__(paths, parent, catalog_file)
+        self.full_decode = full_decode
+
+    def lookup(self, catalog, path, mtime_ns, size):
+        return catalog.get_validation(path, mtime_ns, size, self.full_decode)
+
+    def compute(self, path):
+        return validate_image(path, self.full_decode)
+
+    def store(self, catalog, rows):
+        catalog.put_validation(rows, self.full_decode)
+
+    def finish(self, results):
+        invalid = {}
+        for path, result in zip(self.paths, results):
+            if result is not None and result[1]:
+                invalid[path] = (result[1], result[0])
+        self.invalid_found.emit(invalid)
+
+
+class RecheckTask(QRunnable):
+    """在线程池中重新检查一张显示时解码失败的图片"""
+
+    def __init__(self, checker, image_path):
+        super().__init__()
+        self.checker = checker
+        self.image_path = image_path
+
+    def run(self):
+        try:
+            stat = stat_image(self.image_path)
+            # 先确认文件能完整读出：读取失败（网络中断、本地副本被删除等）只是暂时的，不算图片损坏
+            read_image_file(self.image_path)
+            reason = validate_image(self.image_path, full_decode=True)
+        except OSError:
+            stat, reason = None, ""
+        finally:
+            self.checker.task_done(self.image_path)
+        if reason:
+            self.checker.failed.emit(self.image_path, reason, stat.st_mtime_ns, stat.st_size)
+
+
+class DisplayFailureChecker(QObject):
+    """显示时解码失败的图片在后台完整检查一次，确实无法解码时才放入隔离列表"""
+    failed = pyqtSignal(str, str, object, object)  # 图片路径, 原因, 修改时间, 大小
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def check(self, image_path):
+        with self._lock:
+            if image_path in self._pending:
+                return
+            self._pending.add(image_path)
+        self.pool.start(RecheckTask(self, image_path))
+
+    def task_done(self, image_path):
+        with self._lock:
+            self._pending.discard(image_path)
+
+    def shutdown(self):
+        self.pool.clear()
+        self.pool.waitForDone()
+
+
+class FilterTask(QRunnable):
+    """在线程池中为新增的图片建立筛选索引，并筛选出[start, end)中符合条件的图片"""
+
+    def __init__(self, worker, generation, library_index, images, image_filter, start, end, use_catalog):
+        super().__init__()
+        self.worker = worker
+        self.generation = generation
+        self.library_index = library_index
+        self.images = images
+        self.image_filter = image_filter
+        self.start = start
+        self.end = end
+        self.use_catalog = use_catalog
+
+    def run(self):
+        started = time.perf_counter()
+        catalog = None
+        try:
+            if self.use_catalog:
+                try:
+                    catalog = ImageCatalog()
+                except sqlite3.Error as e:
+                    print(f"打开图片目录时出错: {e}")
+            self.library_index.extend(self.images, catalog, self.end)
+            matches = self.library_index.query(self.images, self.image_filter, self.start, self.end)
+        except Exception as e:
+            print(f"筛选图片时出错: {e}")
+            matches = array('l')
+        finally:
+            if catalog is not None:
+                catalog.close()
+        elapsed = (time.perf_counter() - started) * 1000
+        self.worker.finished.emit(self.generation, self.start, self.end, matches, elapsed)
+
+
+class FilterWorker(QObject):
+    """在后台线程中筛选图片，结果按提交顺序返回（只有一个线程，LibraryIndex只在其中访问）"""
+    finished = pyqtSignal(int, int, int, object, float)  # 代数, 开始, 结束, 符合条件的图片索引, 耗时（毫秒）
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+
+    def submit(self, generation, library_index, images, image_filter, start, end, use_catalog):
+        self.pool.start(FilterTask(self, generation, library_index, images, image_filter, start, end, use_catalog))
+
+    def shutdown(self):
+        self.pool.clear()
+        self.pool.waitForDone()
+
+
+class PerfMonitor:
+    """记录显示图片各阶段的耗时，提供滚动百分位统计并可导出为CSV/JSON
+    
+    可以在任意线程中记录（预读线程也会记录读取和解码耗时）。
+    """
+
+    def __init__(self, window_size=PERF_WINDOW_SIZE, log_size=PERF_LOG_SIZE):
+        self._lock = threading.Lock()
+        self._window_size = window_size
+        self._samples = {}  # 阶段 -> 最近的耗时（毫秒）
+        self._log = deque(maxlen=log_size)  # (时间戳, 阶段, 耗时)
+
+    def record(self, stage, ms):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self._window_size)
+            samples.append(ms)
+            self._log.append((time.time(), stage, ms))
+
+    def record_all(self, timings):
+        for stage, ms in timings.items():
+            self.record(stage, ms)
+
+    def percentiles(self, stage):
+        """返回阶段的统计：次数、平均值和p50/p95/p99（毫秒），没有样本时返回None"""
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if not samples:
+            return None
+        last = len(samples) - 1
+        return {
+            'count': len(samples),
+            'mean': sum(samples) / len(samples),
+            'p50': samples[int(round(last * 0.50))],
+            'p95': samples[int(round(last * 0.95))],
+            'p99': samples[int(round(last * 0.99))],
+        }
+
+    def summary(self):
+        with self._lock:
+            stages = list(self._samples)
+        return {stage: self.percentiles(stage) for stage in stages}
+
+    def export(self, path):
+        """导出所有样本，按扩展名保存为CSV或JSON"""
+        with self._lock:
+            log = list(self._log)
+        if path.lower().endswith('.json'):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'summary': self.summary(), 'samples': log}, f, ensure_ascii=False, indent=2)
+        else:
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['timestamp', 'stage', 'ms'])
+                writer.writerows(log)
+
+
+def parse_exif_date(text):
+    """EXIF日期（"YYYY:MM:DD HH:MM:SS"）转换为秒数，格式错误时返回None"""
+    try:
+        return calendar.timegm(time.strptime(text.strip('\x00 '), "%Y:%m:%d %H:%M:%S"))
+    except (ValueError, OverflowError):
+        return None
+
+
+def parse_exif(data):
+    """解析TIFF格式的EXIF数据，返回(拍摄时间, 方向)"""
+    if data[:2] == b'II':
+        byteorder = 'little'
+    elif data[:2] == b'MM':
+        byteorder = 'big'
+    else:
+        return None, 1
+    
+    def number(offset, length):
+        if offset < 0 or offset + length > len(data):
+            raise ValueError("EXIF数据不完整")
+        return int.from_bytes(data[offset:offset + length], byteorder)
+    
+    def entries(offset):
+        # 每项12字节：标签、类型、数量、值（或值的偏移）
+        for i in range(number(offset, 2)):
+            entry = offset + 2 + i * 12
+            yield number(entry, 2), number(entry + 4, 4), entry + 8
+    
+    def text(count, value_offset):
+        start = number(value_offset, 4) if count > 4 else value_offset
+        return data[start:start + count].decode('ascii', 'ignore')
+    
+    taken = None
+    orientation = 1
+    try:
+        exif_offset = None
+        modified = None
+        for tag, count, value_offset in entries(number(4, 4)):
+            if tag == 0x0112:
+                orientation = number(value_offset, 2)
+            elif tag == 0x8769:
+                exif_offset = number(value_offset, 4)
+            elif tag == 0x0132:
+                modified = text(count, value_offset)
+        if exif_offset is not None:
+            for tag, count, value_offset in entries(exif_offset):
+                # 拍摄时间，没有时使用数字化时间
+                if tag == 0x9003 or (tag == 0x9004 and taken is None):
+                    taken = parse_exif_date(text(count, value_offset))
+        if taken is None and modified:
+            taken = parse_exif_date(modified)
+    except ValueError:
+        pass
+    return taken, orientation if 1 <= orientation <= 8 else 1
+
+
+def read_image_metadata(image_path):
+    """只读取文件头，返回(拍摄时间, EXIF方向, 宽, 高)，拍摄时间为秒数（没有时为None）
+    
+    JPEG从APP1段读取EXIF、从SOF段读取尺寸；TIFF直接解析文件头；其他格式由QImageReader读取文件头中的尺寸。
+    读取失败时抛出OSError。
+    """
+    member = archive_index.split(image_path)
+    if member is None:
+        with open(image_path, 'rb') as f:
+            header = f.read(EXIF_HEADER_BYTES)
+    else:
+        header = archive_index.read(*member)[:EXIF_HEADER_BYTES]
+    taken = None
+    orientation = 1
+    width = height = 0
+    if header[:2] == b'\xff\xd8':
+        position = 2
+        while position + 4 <= len(header) and header[position] == 0xFF:
+            marker = header[position + 1]
+            if marker == 0xFF:
+                position += 1  # 填充字节
+                continue
+            if marker in (0xDA, 0xD9):
+                break  # 图像数据开始
+            length = int.from_bytes(header[position + 2:position + 4], 'big')
+            segment = header[position + 4:position + 2 + length]
+            if marker == 0xE1 and segment[:6] == b'Exif\x00\x00':
+                taken, orientation = parse_exif(segment[6:])
+            elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC) and len(segment) >= 5:
+                height = int.from_bytes(segment[1:3], 'big')
+                width = int.from_bytes(segment[3:5], 'big')
+                break
+            position += 2 + length
+    elif header[:4] in (b'II*\x00', b'MM\x00*'):
+        taken, orientation = parse_exif(header)
+    if not width or not height:
+        with open_image_reader(image_path) as reader:
+            size = reader.size()
+        if size.isValid():
+            width, height = size.width(), size.height()
+    return taken, orientation, width, height
+
+
+def apply_orientation(image, orientation):
+    """按EXIF方向旋转或翻转图片"""
+    if orientation in (2, 5, 7):
+        image = image.mirrored(True, False)
+    elif orientation == 4:
+        image = image.mirrored(False, True)
+    rotation = {3: 180, 5: 270, 6: 90, 7: 90, 8: 270}.get(orientation)
+    if rotation:
+        image = image.transformed(QTransform().rotate(rotation))
+    return image
+
+
+def orientation_transform(size, orientation):
+    """原图坐标 -> 按EXIF方向旋转或翻转后的坐标（与apply_orientation一致），size为原图尺寸"""
+    transform = QTransform()
+    if orientation in (2, 5, 7):
+        transform = QTransform(-1, 0, 0, 1, size.width(), 0)
+    elif orientation == 4:
+        transform = QTransform(1, 0, 0, -1, 0, size.height())
+    rotation = {3: 180, 5: 270, 6: 90, 7: 90, 8: 270}.get(orientation)
+    if rotation:
+        transform *= QImage.trueMatrix(QTransform().rotate(rotation), size.width(), size.height())
+    return transform
+
+
+def decode_scaled_image(data, size, timings=None, orientation=1):
+    """从内存中的文件内容（QByteArray）解码图片并按比例缩放到目标尺寸，失败时返回空QImage
+    
+    先从文件头读取原始尺寸，支持缩小解码的格式（如JPEG可在DCT阶段直接缩小）
+    按接近目标的尺寸解码，避免先解码出完整的大图；其他格式解码原图后再缩放。
+    orientation为EXIF方向，在缩放后的图片上旋转，需要转90度时按宽高互换的尺寸解码。
+    timings不为None时记录解码和缩放的耗时（毫秒）。
+    """
+    timings = timings if timings is not None else {}
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.ReadOnly)
+    reader = QImageReader(buffer)
+    try:
+        if orientation in (5, 6, 7, 8):
+            size = size.transposed()
+        image = _decode_scaled(reader, buffer, size, timings)
+        if orientation != 1 and not image.isNull():
+            image = apply_orientation(image, orientation)
+        return image
+    finally:
+        # 读取器不持有缓冲区，必须先于缓冲区释放，否则析构时会访问已销毁的设备
+        reader.setDevice(None)
+        buffer.close()
+
+
+def _decode_scaled(reader, buffer, size, timings):
+    start = time.perf_counter()
+    original_size = reader.size()
+    if original_size.isValid() and reader.supportsOption(QImageIOHandler.ScaledSize):
+        target_size = original_size.scaled(size, Qt.KeepAspectRatio)
+        # 只在缩小时使用缩小解码，放大仍按原图缩放
+        if 0 < target_size.width() < original_size.width():
+            reader.setScaledSize(target_size)
+            image = reader.read()
+            if not image.isNull():
+                timings['decode'] = (time.perf_counter() - start) * 1000
+                return image
+            # 缩小解码失败时重新按原图解码
+            buffer.seek(0)
+            reader.setDevice(None)
+            reader.setDevice(buffer)
+            reader.setScaledSize(QSize())
+    
+    image = reader.read()
+    timings['decode'] = (time.perf_counter() - start) * 1000
+    if image.isNull():
+        return image
+    start = time.perf_counter()
+    image = image.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    timings['scale'] = (time.perf_counter() - start) * 1000
+    return image
+
+
+def simulate_read_latency(path):
+    """测试用：按SIMULATED_READ_LATENCY为读取增加延迟"""
+    if not SIMULATED_READ_LATENCY:
+        return
+    path = os.path.abspath(path)
+    for root, delay in SIMULATED_READ_LATENCY.items():
+        if path.startswith(root + os.sep):
+            time.sleep(delay)
+            return
+
+
+def read_image_file(image_path):
+    """读取图片文件的全部内容，返回QByteArray（失败时抛出OSError）
+    
+    普通文件用QFile直接读入QByteArray，不再经过Python的bytes复制一次。
+    """
+    simulate_read_latency(image_path)
+    member = archive_index.split(image_path)
+    if member is not None:
+        return QByteArray(archive_index.read(*member))
+    file = QFile(image_path)
+    if not file.open(QIODevice.ReadOnly):
+        raise OSError(f"{image_path}: {file.errorString()}")
+    try:
+        data = file.readAll()
+        if file.error() != QFile.NoError:
+            raise OSError(f"{image_path}: {file.errorString()}")
+        return data
+    finally:
+        file.close()
+
+
+def load_scaled_image(image_path, size, timings=None, orientation=1):
+    """读取并解码图片，按比例缩放到目标尺寸，失败时返回空QImage
+    
+    timings不为None时记录读取、解码和缩放的耗时（毫秒）。
+    """
+    timings = timings if timings is not None else {}
+    start = time.perf_counter()
+    try:
+        data = read_image_file(image_path)
+    except OSError:
+        return QImage()
+    timings['read'] = (time.perf_counter() - start) * 1000
+    return decode_scaled_image(data, size, timings, orientation)
+
+
+class ImageCache:
+    """解码后图片的LRU缓存，按路径、文件修改时间、目标尺寸和EXIF方向索引，超出内存上限时淘汰最久未使用的图片
+    
+    缓存中保存的是QImage（可以在后台线程中创建），显示时再转换为QPixmap。
+    """
+
+    def __init__(self, budget_mb=DEFAULT_CACHE_BUDGET_MB, monitor=None):
+        self.monitor = monitor  # 可选的PerfMonitor，记录解码各阶段的耗时
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.orientations = {}  # 图片路径 -> EXIF方向（只记录需要旋转或翻转的图片）
+        self.display_cache = None  # 可选的DisplayFrameCache，有预先生成的同尺寸图片时不再解码原图
+        self.staging = None  # 可选的StagingCache，慢速存储上的图片优先读取本地副本
+
+    def make_key(self, image_path, size, stat=None):
+        """生成缓存键，文件被修改或方向变化后旧的缓存自动失效（文件不存在时抛出OSError）
+        
+        键的最后一项是解码时使用的EXIF方向。stat为None时读取文件信息；界面线程中传入图片目录中
+        记录的修改时间和大小，不必访问可能很慢的网络文件夹。
+        """
+        stat = stat or stat_image(image_path)
+        return (image_path, stat.st_mtime_ns, size.width(), size.height(), self.orientations.get(image_path, 1))
+
+    def get(self, key):
+        """取出缓存的图片，不存在时返回None"""
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        """加入一张图片，必要时淘汰最久未使用的图片"""
+        cost = image.sizeInBytes()
+        with self._lock:
+            if cost > self.budget_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.used_bytes -= old.sizeInBytes()
+            self._entries[key] = image
+            self.used_bytes += cost
+            self._evict()
+
+    def contains(self, key):
+        """是否已缓存（不计入命中统计）"""
+        with self._lock:
+            return key in self._entries
+
+    def get_scaled(self, image_path, size, stat=None):
+        """返回缩放到目标尺寸的图片，未缓存时解码并加入缓存"""
+        try:
+            key = self.make_key(image_path, size, stat)
+        except OSError as e:
+            print(f"读取图片时出错: {e}")
+            return QImage()
+        image = self.get(key)
+        if image is None:
+            image = self.load(image_path, size, key[-1], stat)
+            if not image.isNull():
+                self.put(key, image)
+        return image
+
+    def load(self, image_path, size, orientation=None, stat=None):
+        """解码图片（不经过缓存），并记录各阶段耗时；orientation默认使用已知的EXIF方向"""
+        if orientation is None:
+            orientation = self.orientations.get(image_path, 1)
+        if self.display_cache is not None:
+            frame = self.display_cache.get(image_path, size, orientation, stat)
+            if frame is not None:
+                return frame
+        timings = {}
+        source = image_path if self.staging is None else self.staging.local_path(image_path)
+        image = load_scaled_image(source, size, timings, orientation)
+        if source == image_path and self.staging is not None and 'read' in timings:
+            self.staging.record_read(image_path, timings['read'])
+        if self.monitor is not None:
+            self.monitor.record_all(timings)
+        return image
+
+    def set_budget_mb(self, budget_mb):
+        """修改内存上限"""
+        with self._lock:
+            self.budget_bytes = budget_mb * 1024 * 1024
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.used_bytes = 0
+
+    def stats(self):
+        """返回命中统计，用于调整内存上限"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self._entries),
+                'used_mb': self.used_bytes / (1024 * 1024),
+                'budget_mb': self.budget_bytes / (1024 * 1024),
+            }
+
+    def _evict(self):
+        while self.used_bytes > self.budget_bytes and self._entries:
+            _, image = self._entries.popitem(last=False)
+            self.used_bytes -= image.sizeInBytes()
+
+
+class PrefetchTask(QRunnable):
+    """在线程池中解码并缩放一张图片，放入缓存"""
+
+    def __init__(self, prefetcher, generation, image_path, size):
+        super().__init__()
+        self.prefetcher = prefetcher
+        self.generation = generation
+        self.image_path = image_path
+        self.size = QSize(size)
+
+    def run(self):
+        try:
+            # 播放顺序或文件夹变化后，过期的任务直接放弃
+            if self.generation != self.prefetcher.generation:
+                return
+            try:
+                key = self.prefetcher.image_cache.make_key(self.image_path, self.size)
+            except OSError:
+                return
+            if self.prefetcher.image_cache.contains(key):
+                return
+            # 按键中的方向解码，方向在解码期间变化时不会以新的键缓存旧方向的图片
+            image = self.prefetcher.image_cache.load(self.image_path, self.size, key[-1])
+            if not image.isNull() and self.generation == self.prefetcher.generation:
+                self.prefetcher.image_cache.put(key, image)
+        finally:
+            self.prefetcher.task_done(self.image_path, self.size)
 
-# 定义应用程序常量
-APP_NAME = "电子相册"
-SETTINGS_FILE = os.path.join(os.path.expanduser("~"), ".photo_album_settings.json")
 
-# 支持的图片格式（PyQt5原生支持，无需额外插件）
-SUPPORTED_FORMATS = (
-    # 常见格式
-    '.jpg', '.jpeg', '.png', '.bmp', '.gif',
-    # 扩展格式（原生支持）
-    '.webp', '.tiff', '.tif', '.ico', '.xpm',
-    '.pbm', '.pgm', '.ppm', '.xbm', '.jfif'
-)
+class ImagePrefetcher:
+    """在后台线程池中提前解码并缩放接下来要显示的图片，放入共享缓存"""
+
+    def __init__(self, image_cache):
+        self.image_cache = image_cache
+        self.generation = 0
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max(1, min(4, QThread.idealThreadCount() - 1)))
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def prefetch(self, image_paths, size, priority=0):
+        """按顺序提交预读任务，已在进行中的图片不会重复提交
+        
+        priority大于0时即使图片已在队列中也再提交一次，排在普通预读之前（任务开始时会跳过已缓存的图片）。
+        """
+        if size.isEmpty():
+            return
+        for image_path in image_paths:
+            task_key = (image_path, size.width(), size.height())
+            with self._lock:
+                if task_key in self._pending and priority <= 0:
+                    continue
+                self._pending.add(task_key)
+            self.pool.start(PrefetchTask(self, self.generation, image_path, size), priority)
+
+    def task_done(self, image_path, size):
+        with self._lock:
+            self._pending.discard((image_path, size.width(), size.height()))
+
+    def cancel(self):
+        """取消所有尚未完成的预读任务"""
+        self.generation += 1
+        self.pool.clear()
+        with self._lock:
+            self._pending.clear()
+
+    def shutdown(self):
+        self.cancel()
+        self.pool.waitForDone()
+
+
+class StagingTask(QRunnable):
+    """在线程池中把一张图片复制到本地缓存"""
+
+    def __init__(self, staging, generation, image_path):
+        super().__init__()
+        self.staging = staging
+        self.generation = generation
+        self.image_path = image_path
+
+    def run(self):
+        try:
+            # 播放顺序变化后，尚未开始的旧任务直接放弃
+            if self.generation == self.staging.generation:
+                self.staging.copy(self.image_path)
+        finally:
+            self.staging.task_done(self.image_path)
+
+
+class StagingCache:
+    """慢速存储（网络文件夹）的本地缓存
+    
+    按图片文件夹统计读取一个文件的耗时，中位数超过阈值的文件夹视为慢速存储，
+    其中接下来要播放的图片按播放顺序在后台复制到本地，显示时读取本地副本，不受网络读取波动影响。
+    本地副本按原图路径、修改时间和大小命名（原图变化后自动失效），总大小超过上限时淘汰最久未使用的副本。
+    原图是否变化只在后台复制任务中检查，显示时按记录的对应关系取本地副本，不在界面线程中访问网络文件夹。
+    复制时限制同时复制的文件数和总带宽，避免占满网络。
+    """
+
+    def __init__(self, directory=STAGING_DIR, budget_mb=STAGING_CACHE_MB,
+                 max_concurrent=STAGING_MAX_CONCURRENT, bandwidth_mbps=STAGING_BANDWIDTH_MBPS):
+        self.directory = directory
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.bandwidth_bytes = bandwidth_mbps * 1024 * 1024
+        self.roots = []
+        self._latency = {}  # 文件夹 -> 最近的读取耗时（毫秒）
+        self.slow_roots = set()
+        self._entries = OrderedDict()  # 本地副本文件名 -> 大小，按最近使用排序
+        self._staged = {}  # 原图路径 -> 复制任务确认过的本地副本文件名
+        self.used_bytes = 0
+        self._copying = set()
+        self._throttle_until = 0.0
+        self._stopped = False
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max(1, max_concurrent))
+        self._pending = set()
+        self._load_entries()
+
+    def _load_entries(self):
+        """读取上次运行留下的本地副本，按修改时间排列"""
+        try:
+            entries = [(entry.stat().st_mtime, entry.name, entry.stat().st_size)
+                       for entry in os.scandir(self.directory)
+                       if entry.is_file() and not entry.name.endswith('.tmp')]
+        except OSError:
+            return
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self.used_bytes += size
+        self._evict()
+
+    def set_roots(self, folders):
+        """设置图片文件夹（按文件夹统计读取耗时），重新开始判断慢速存储"""
+        with self._lock:
+            self.roots = sorted((os.path.abspath(folder) for folder in folders), key=len, reverse=True)
+            self._latency.clear()
+            self.slow_roots.clear()
+
+    def root_of(self, image_path):
+        path = os.path.abspath(image_path)
+        for root in self.roots:
+            if path.startswith(root + os.sep):
+                return root
+        return None
+
+    def record_read(self, image_path, elapsed_ms):
+        """记录一次从原图读取的耗时，更新所在文件夹是否为慢速存储"""
+        root = self.root_of(image_path)
+        if root is None:
+            return
+        with self._lock:
+            samples = self._latency.setdefault(root, deque(maxlen=STAGING_LATENCY_SAMPLES))
+            samples.append(elapsed_ms)
+            if len(samples) < STAGING_MIN_SAMPLES:
+                return
+            median = sorted(samples)[len(samples) // 2]
+            if median >= STAGING_SLOW_READ_MS:
+                if root not in self.slow_roots:
+                    print(f"检测到慢速存储（读取耗时中位数 {median:.0f} ms）: {root}")
+                self.slow_roots.add(root)
+            else:
+                self.slow_roots.discard(root)
+
+    def is_slow(self, image_path):
+        return bool(self.slow_roots) and self.root_of(image_path) in self.slow_roots
+
+    def entry_name(self, image_path, stat):
+        key = f"{os.path.abspath(image_path)}|{stat.st_mtime_ns}|{stat.st_size}"
+        return hashlib.md5(key.encode('utf-8')).hexdigest() + os.path.splitext(image_path)[1].lower()
+
+    def local_path(self, image_path):
+        """返回图片的本地副本路径，没有副本时返回原路径（不读取原图的文件信息）"""
+        with self._lock:
+            name = self._staged.get(image_path)
+            if name is None:
+                return image_path
+            if name not in self._entries:
+                # 副本已被淘汰
+                del self._staged[image_path]
+                return image_path
+            self._entries.move_to_end(name)
+        return os.path.join(self.directory, name)
+
+    def stage(self, image_paths):
+        """按播放顺序提交复制任务（只复制慢速存储上的图片），替换之前尚未开始的任务"""
+        image_paths = [image_path for image_path in image_paths if self.is_slow(image_path)]
+        if not image_paths and not self._pending:
+            return
+        self.cancel()
+        for priority, image_path in enumerate(reversed(image_paths)):
+            with self._lock:
+                if image_path in self._pending:
+                    continue
+                self._pending.add(image_path)
+            # 越靠前的图片优先级越高
+            self.pool.start(StagingTask(self, self.generation, image_path), priority)
+
+    def task_done(self, image_path):
+        with self._lock:
+            self._pending.discard(image_path)
+
+    def copy(self, image_path):
+        """把一张图片复制到本地缓存（已有副本时只更新使用顺序），并记录原图对应的副本"""
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            with self._lock:
+                self._staged.pop(image_path, None)
+            return
+        name = self.entry_name(image_path, stat)
+        with self._lock:
+            if self._staged.get(image_path) != name:
+                # 原图已变化，旧的副本不再使用
+                self._staged.pop(image_path, None)
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                self._staged[image_path] = name
+                return
+            if name in self._copying:
+                return
+            self._copying.add(name)
+        path = os.path.join(self.directory, name)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            simulate_read_latency(image_path)
+            with open(image_path, 'rb') as source, open(temp_path, 'wb') as target:
+                while True:
+                    if self._stopped:
+                        raise OSError("已停止")
+                    chunk = source.read(STAGING_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    self._throttle(len(chunk))
+            os.replace(temp_path, path)
+        except OSError as e:
+            if not self._stopped:
+                print(f"复制到本地缓存时出错: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+        finally:
+            with self._lock:
+                self._copying.discard(name)
+        with self._lock:
+            self._entries[name] = stat.st_size
+            self.used_bytes += stat.st_size
+            self._staged[image_path] = name
+            self._evict()
+
+    def _throttle(self, size):
+        """限制所有复制线程的总带宽"""
+        if self.bandwidth_bytes <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._throttle_until = max(self._throttle_until, now) + size / self.bandwidth_bytes
+            delay = self._throttle_until - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def _evict(self):
+        """删除最久未使用的副本直到总大小不超过上限（调用时需持有锁或在初始化中）"""
+        while self.used_bytes > self.budget_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self.used_bytes -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'slow_roots': len(self.slow_roots),
+                'entries': len(self._entries),
+                'used_mb': self.used_bytes / (1024 * 1024),
+                'pending': len(self._pending),
+            }
+
+    def cancel(self):
+        """取消尚未开始的复制任务"""
+        self.generation += 1
+        self.pool.clear()
+        with self._lock:
+            self._pending.clear()
+
+    def shutdown(self):
+        self._stopped = True
+        self.cancel()
+        self.pool.waitForDone()
+
+
+class SlideshowScheduler(QObject):
+    """按绝对时间安排幻灯片切换
+    
+    每张图片的显示时间是上一个显示时间加上间隔，与显示本身的耗时无关，因此不会累积漂移。
+    在显示时间之前先发出prepare_due，让下一张图片提前在后台解码；到达显示时间时发出display_due。
+    显示晚于预定时间时发出deadline_missed；落后超过一个间隔时跳到下一个未过期的时间，不会连续补播。
+    """
+    prepare_due = pyqtSignal()
+    display_due = pyqtSignal()
+    deadline_missed = pyqtSignal(float)  # 晚了多少毫秒
+
+    def __init__(self, interval_ms, lead_ms=SLIDESHOW_PREPARE_LEAD_MS, parent=None):
+        super().__init__(parent)
+        self.interval = interval_ms / 1000
+        self.lead = lead_ms / 1000
+        self.deadline = None  # 下一张的显示时间（time.perf_counter）
+        self.prepared = False
+        self.missed = 0
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self._on_timeout)
+
+    def is_active(self):
+        return self.deadline is not None
+
+    def start(self):
+        self.missed = 0
+        self._schedule(time.perf_counter() + self.interval)
+
+    def stop(self):
+        self.timer.stop()
+        self.deadline = None
+
+    def set_interval(self, interval_ms):
+        """修改间隔：下一张的显示时间按新间隔从上一次显示重新计算"""
+        interval = interval_ms / 1000
+        if self.deadline is not None:
+            last_shown = self.deadline - self.interval
+            self.interval = interval
+            self._schedule(max(last_shown + interval, time.perf_counter()))
+        else:
+            self.interval = interval
+
+    def reschedule(self):
+        """下一张图片变化时（如播放顺序改变）重新准备，显示时间不变"""
+        if self.deadline is not None:
+            self._schedule(self.deadline)
+
+    def _schedule(self, deadline):
+        self.deadline = deadline
+        self.prepared = False
+        self._arm()
+
+    def _arm(self):
+        now = time.perf_counter()
+        # 准备时间最多提前半个间隔，避免与上一张的显示挤在一起
+        prepare_at = self.deadline - min(self.lead, self.interval / 2)
+        if not self.prepared and now < prepare_at:
+            target = prepare_at
+        else:
+            target = self.deadline
+        self.timer.start(max(0, int((target - now) * 1000)))
+
+    def _on_timeout(self):
+        if self.deadline is None:
+            return
+        now = time.perf_counter()
+        if not self.prepared:
+            self.prepared = True
+            self.prepare_due.emit()
+            if now < self.deadline:
+                self._arm()
+                return
+        # 定时器可能提前一点触发
+        if now < self.deadline:
+            self._arm()
+            return
+        
+        late = (now - self.deadline) * 1000
+        if late > SLIDESHOW_LATE_TOLERANCE_MS:
+            self.missed += 1
+            self.deadline_missed.emit(late)
+        deadline = self.deadline
+        self.display_due.emit()
+        if self.deadline is None or self.deadline != deadline:
+            return  # 显示时停止或重新安排了播放
+        
+        next_deadline = deadline + self.interval
+        now = time.perf_counter()
+        if next_deadline <= now:
+            # 落后超过一个间隔时跳过错过的时间点
+            skipped = int((now - next_deadline) / self.interval) + 1
+            next_deadline += skipped * self.interval
+        self._schedule(next_deadline)
+
+
+class ThumbnailCache:
+    """磁盘缩略图缓存，参照freedesktop缩略图规范
+    
+    缩略图以原图文件URI的MD5命名，保存为PNG，并在Thumb::MTime和Thumb::Size中记录原图的
+    修改时间和大小，原图变化后缩略图自动失效。
+    """
+
+    def __init__(self, directory=THUMBNAIL_DIR, size=THUMBNAIL_SIZE):
+        self.directory = directory
+        self.size = size
+
+    def thumbnail_path(self, image_path):
+        uri = QUrl.fromLocalFile(os.path.abspath(image_path)).toString(QUrl.FullyEncoded)
+        return os.path.join(self.directory, hashlib.md5(uri.encode('utf-8')).hexdigest() + ".png")
+
+    def load(self, image_path, stat=None):
+        """读取有效的缩略图，不存在或已过期时返回None"""
+        stat = stat or stat_image(image_path)
+        thumbnail = QImage(self.thumbnail_path(image_path))
+        if thumbnail.isNull():
+            return None
+        if thumbnail.text("Thumb::MTime") != str(int(stat.st_mtime)) or thumbnail.text("Thumb::Size") != str(stat.st_size):
+            return None
+        return thumbnail
+
+    def generate(self, image_path, stat=None):
+        """生成缩略图并写入磁盘缓存，失败时返回空QImage"""
+        stat = stat or stat_image(image_path)
+        thumbnail = load_scaled_image(image_path, QSize(self.size, self.size))
+        if thumbnail.isNull():
+            return thumbnail
+        if thumbnail.width() > self.size or thumbnail.height() > self.size:
+            thumbnail = thumbnail.scaled(self.size, self.size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        thumbnail.setText("Thumb::URI", QUrl.fromLocalFile(os.path.abspath(image_path)).toString(QUrl.FullyEncoded))
+        thumbnail.setText("Thumb::MTime", str(int(stat.st_mtime)))
+        thumbnail.setText("Thumb::Size", str(stat.st_size))
+        
+        # 先写临时文件再重命名，避免其他线程读到不完整的文件
+        path = self.thumbnail_path(image_path)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if thumbnail.save(temp_path, "PNG"):
+                os.replace(temp_path, path)
+        except OSError as e:
+            print(f"保存缩略图时出错: {e}")
+        return thumbnail
+
+    def get(self, image_path):
+        """读取缩略图，没有有效的缓存时生成"""
+        try:
+            stat = stat_image(image_path)
+        except OSError:
+            return QImage()
+        return self.load(image_path, stat) or self.generate(image_path, stat)
+
+
+class DisplayFrameCache:
+    """磁盘上的屏幕尺寸图片缓存
+    
+    按原图路径、修改时间、文件大小、屏幕尺寸和EXIF方向命名，保存为JPEG（已按方向旋转）。
+    启动时直接读取缓存的图片即可显示，不必解码原图；方向在读取EXIF信息后变化时旧的图片自动失效。
+    """
+
+    def __init__(self, directory=DISPLAY_CACHE_DIR, quality=DISPLAY_CACHE_QUALITY):
+        self.directory = directory
+        self.quality = quality
+
+    def frame_path(self, image_path, size, orientation, stat=None):
+        stat = stat or stat_image(image_path)
+        key = (f"{os.path.abspath(image_path)}|{stat.st_mtime_ns}|{stat.st_size}|{size.width()}x{size.height()}"
+               f"|{orientation}")
+        return os.path.join(self.directory, hashlib.md5(key.encode('utf-8')).hexdigest() + ".jpg")
+
+    def get(self, image_path, size, orientation, stat=None):
+        """读取缓存的图片，不存在、原图已变化或方向不同时返回None"""
+        try:
+            frame = QImage(self.frame_path(image_path, size, orientation, stat))
+        except OSError:
+            return None
+        return None if frame.isNull() else frame
+
+    def put(self, image_path, size, orientation, frame, stat=None):
+        """保存一张按orientation旋转过的屏幕尺寸图片"""
+        try:
+            path = self.frame_path(image_path, size, orientation, stat)
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            if frame.save(temp_path, "JPEG", self.quality):
+                os.replace(temp_path, path)
+        except OSError as e:
+            print(f"保存显示缓存时出错: {e}")
+
+
+class ThumbnailTask(QRunnable):
+    """在线程池中读取或生成一张缩略图"""
+
+    def __init__(self, loader, row, image_path):
+        super().__init__()
+        self.loader = loader
+        self.row = row
+        self.image_path = image_path
+
+    def run(self):
+        image = self.loader.cache.get(self.image_path)
+        if not image.isNull():
+            image = image.scaled(THUMBNAIL_ICON_SIZE, THUMBNAIL_ICON_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.loader.loaded.emit(self.row, self.image_path, image)
+
+
+class ThumbnailModel(QAbstractListModel):
+    """缩略图条的数据模型，只为视图中可见的图片加载缩略图"""
+    loaded = pyqtSignal(int, str, QImage)  # 行号, 图片路径, 缩略图（由后台线程发出）
+
+    # 待处理的请求过多时（快速滚动），放弃已经看不到的旧请求
+    MAX_PENDING = 200
+
+    def __init__(self, album, cache=None, parent=None):
+        super().__init__(parent)
+        self.album = album
+        self.cache = cache or ThumbnailCache()
+        self._icons = OrderedDict()  # 图片路径 -> QPixmap，只保留最近使用的
+        self._pending = set()
+        self._priority = 0
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(2)
+        self.placeholder = QPixmap(THUMBNAIL_ICON_SIZE, THUMBNAIL_ICON_SIZE)
+        self.placeholder.fill(QColor("#3a3a3a"))
+        self.loaded.connect(self.on_loaded)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.album.images)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.album.images):
+            return None
+        image_path = self.album.images[index.row()]
+        if role == Qt.DecorationRole:
+            icon = self._icons.get(image_path)
+            if icon is not None:
+                self._icons.move_to_end(image_path)
+                return icon
+            self.request(index.row(), image_path)
+            return self.placeholder
+        if role == Qt.ToolTipRole:
+            return image_path
+        return None
+
+    def request(self, row, image_path):
+        if image_path in self._pending:
+            return
+        if len(self._pending) >= self.MAX_PENDING:
+            self.pool.clear()
+            self._pending.clear()
+        self._pending.add(image_path)
+        # 最近请求的缩略图优先处理（即当前可见的）
+        self._priority += 1
+        self.pool.start(ThumbnailTask(self, row, image_path), self._priority)
+
+    def on_loaded(self, row, image_path, image):
+        self._pending.discard(image_path)
+        if image.isNull():
+            return
+        orientation = self.album.image_cache.orientations.get(image_path, 1)
+        if orientation != 1:
+            image = apply_orientation(image, orientation)
+        self._icons[image_path] = QPixmap.fromImage(image)
+        while len(self._icons) > THUMBNAIL_MEMORY_COUNT:
+            self._icons.popitem(last=False)
+        # 加载期间列表可能已变化，行号不再对应时等视图重新请求
+        if row < len(self.album.images) and self.album.images[row] == image_path:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def begin_append(self, count):
+        """在图片列表末尾追加图片之前调用"""
+        start = len(self.album.images)
+        self.beginInsertRows(QModelIndex(), start, start + count - 1)
+
+    def end_append(self):
+        self.endInsertRows()
+
+    def discard_icons(self, image_paths):
+        """丢弃这些图片已加载的缩略图（如图片方向变化后），可见的缩略图会重新请求"""
+        for image_path in image_paths:
+            self._icons.pop(image_path, None)
+        if self.album.images:
+            self.dataChanged.emit(self.index(0), self.index(len(self.album.images) - 1), [Qt.DecorationRole])
+
+    def begin_reset(self):
+        self.beginResetModel()
+
+    def end_reset(self):
+        self.endResetModel()
+
+    def shutdown(self):
+        self.pool.clear()
+        self.pool.waitForDone()
+
+
+class ImageSurface(QObject):
+    """在QLabel上显示缓存中的图片，并处理标签大小变化
+    
+    调整大小时复用已解码的屏幕尺寸图片，不再重新读取文件：拖动过程中使用快速缩放，
+    停止调整一段时间后再进行一次高质量缩放。
+    """
+
+    def __init__(self, label, image_cache, parent=None):
+        super().__init__(parent)
+        self.label = label
+        self.image_cache = image_cache
+        self.image_path = None
+        self.image_stat = None  # 图片目录中记录的修改时间和大小（None表示需要时读取文件信息）
+        self.source_image = None  # 调整大小时使用的已解码图片
+        self.rendered_size = QSize()
+        self.smooth_size = QSize()
+        self._present_start = None  # 设置图片的时间，用于统计到实际绘制的延迟
+        self.paused = False  # 标签暂时由其他视图（如缩放查看）绘制
+        
+        # 切换效果：(效果, 上一张, 下一张, 开始时间, 时长)
+        self.transition = None
+        self._last_frame_time = None
+        self.transition_timer = QTimer(self)
+        self.transition_timer.setTimerType(Qt.PreciseTimer)
+        self.transition_timer.timeout.connect(self.render_transition_frame)
+        
+        # 同一轮事件循环中的多次大小变化只缩放一次
+        self.fast_timer = QTimer(self)
+        self.fast_timer.setSingleShot(True)
+        self.fast_timer.timeout.connect(self.render_fast)
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.timeout.connect(self.render_smooth)
+        label.installEventFilter(self)
+
+    def show_image(self, image_path, transition=None, duration_ms=TRANSITION_DURATION_MS, stat=None):
+        """显示一张图片，返回缩放后的QImage
+        
+        transition为'fade'或'slide'时从当前画面过渡到新图片，只混合两张已缩放到标签大小的图片。
+        stat为图片目录中记录的修改时间和大小（见ImageCache.make_key），之后调整大小时也使用它。
+        """
+        previous = self.current_frame() if transition else None
+        self.finish_transition()
+        self.image_path = image_path
+        self.image_stat = stat
+        self.source_image = None
+        self.fast_timer.stop()
+        self.idle_timer.stop()
+        size = self.label.size()
+        image = self.image_cache.get_scaled(image_path, size, stat)
+        start = time.perf_counter()
+        pixmap = QPixmap.fromImage(image)
+        self.label.setPixmap(pixmap)
+        if self.image_cache.monitor is not None:
+            self.image_cache.monitor.record('set_pixmap', (time.perf_counter() - start) * 1000)
+            self._present_start = start
+        self.rendered_size = QSize(size)
+        self.smooth_size = QSize(size)
+        if previous is not None and not previous.isNull() and not pixmap.isNull() and duration_ms > 0:
+            self.transition = (transition, previous, pixmap, time.perf_counter(), duration_ms / 1000)
+            self._last_frame_time = None
+            self.render_transition_frame()
+            self.transition_timer.start(TRANSITION_FRAME_MS)
+        return image
+
+    def current_frame(self):
+        """当前显示的画面（过渡中为过渡的目标图片）"""
+        if self.transition is not None:
+            return self.transition[2]
+        return self.label.pixmap()
+
+    def render_transition_frame(self):
+        """绘制过渡的一帧，并记录帧间隔"""
+        if self.transition is None:
+            return
+        effect, previous, pixmap, start, duration = self.transition
+        now = time.perf_counter()
+        if self._last_frame_time is not None and self.image_cache.monitor is not None:
+            self.image_cache.monitor.record('frame', (now - self._last_frame_time) * 1000)
+        self._last_frame_time = now
+        progress = (now - start) / duration
+        if progress >= 1:
+            self.finish_transition()
+            return
+        progress = progress * progress * (3 - 2 * progress)  # 缓入缓出
+        
+        size = self.label.size()
+        canvas = QPixmap(size)
+        canvas.fill(Qt.transparent)
+        painter = QPainter(canvas)
+        previous_pos = QPoint((size.width() - previous.width()) // 2, (size.height() - previous.height()) // 2)
+        pixmap_pos = QPoint((size.width() - pixmap.width()) // 2, (size.height() - pixmap.height()) // 2)
+        if effect == 'slide':
+            offset = round(size.width() * progress)
+            painter.drawPixmap(previous_pos - QPoint(offset, 0), previous)
+            painter.drawPixmap(pixmap_pos + QPoint(size.width() - offset, 0), pixmap)
+        else:
+            painter.setOpacity(1 - progress)
+            painter.drawPixmap(previous_pos, previous)
+            painter.setOpacity(progress)
+            painter.drawPixmap(pixmap_pos, pixmap)
+        painter.end()
+        self.label.setPixmap(canvas)
+
+    def finish_transition(self):
+        """结束正在进行的过渡，直接显示目标图片"""
+        if self.transition is None:
+            return
+        pixmap = self.transition[2]
+        self.transition = None
+        self.transition_timer.stop()
+        self.label.setPixmap(pixmap)
+
+    def show_frame(self, image_path, source):
+        """显示一张已解码的屏幕尺寸图片（如启动时从磁盘缓存读取的），之后调整大小时也复用它"""
+        self.image_path = image_path
+        self.image_stat = None
+        self.source_image = source
+        self.fast_timer.stop()
+        self.idle_timer.stop()
+        size = self.label.size()
+        self.label.setPixmap(QPixmap.fromImage(source.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)))
+        self.rendered_size = QSize(size)
+        self.smooth_size = QSize(size)
+
+    def show_error(self, message):
+        """在画面中央显示无法显示图片的提示，代替空白画面"""
+        self.finish_transition()
+        self.label.setText(message)
+
+    def clear(self):
+        self.transition = None
+        self.transition_timer.stop()
+        self.image_path = None
+        self.image_stat = None
+        self.source_image = None
+        self.fast_timer.stop()
+        self.idle_timer.stop()
+        self.label.clear()
+
+    def pause(self):
+        """暂停调整大小时的重新缩放，由其他视图接管标签"""
+        self.finish_transition()
+        self.paused = True
+        self.fast_timer.stop()
+        self.idle_timer.stop()
+
+    def resume(self):
+        """恢复显示当前图片"""
+        self.paused = False
+        if self.image_path:
+            self.show_image(self.image_path, stat=self.image_stat)
+
+    def eventFilter(self, obj, event):
+        if obj is self.label:
+            if event.type() == QEvent.Resize and self.image_path and not self.paused:
+                self.finish_transition()
+                self.fast_timer.start(0)
+                self.idle_timer.start(RESIZE_IDLE_MS)
+            elif event.type() == QEvent.Paint and self._present_start is not None:
+                # 从设置图片到标签开始绘制的延迟
+                self.image_cache.monitor.record('present', (time.perf_counter() - self._present_start) * 1000)
+                self._present_start = None
+        return False
+
+    def render_fast(self):
+        """调整大小过程中快速缩放"""
+        size = self.label.size()
+        if size == self.rendered_size:
+            return
+        source = self._source()
+        if source.isNull():
+            return
+        self.label.setPixmap(QPixmap.fromImage(source.scaled(size, Qt.KeepAspectRatio, Qt.FastTransformation)))
+        self.rendered_size = QSize(size)
+
+    def render_smooth(self):
+        """停止调整大小后进行一次高质量缩放，并放入缓存"""
+        size = self.label.size()
+        if size == self.smooth_size:
+            if size != self.rendered_size:
+                self.show_image(self.image_path, stat=self.image_stat)
+            return
+        source = self._source()
+        if source.isNull():
+            return
+        image = source.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        try:
+            self.image_cache.put(self.image_cache.make_key(self.image_path, size, self.image_stat), image)
+        except OSError:
+            pass
+        self.label.setPixmap(QPixmap.fromImage(image))
+        self.rendered_size = QSize(size)
+        self.smooth_size = QSize(size)
+
+    def _source(self):
+        """按屏幕大小解码的图片，同一张图片只解码一次"""
+        if self.source_image is None:
+            screen = self.label.screen() or QApplication.primaryScreen()
+            self.source_image = self.image_cache.get_scaled(self.image_path, screen.size(), self.image_stat)
+        return self.source_image
+
+
+class TileCache:
+    """已解码图片分块的LRU缓存，按占用的字节数限制内存"""
+
+    def __init__(self, budget_mb=TILE_CACHE_MB):
+        self.budget = budget_mb * 1024 * 1024
+        self.used = 0
+        self._tiles = OrderedDict()  # (图片键, 层级, 列, 行) -> QImage
+
+    def get(self, key):
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+        return tile
+
+    def put(self, key, tile):
+        old = self._tiles.pop(key, None)
+        if old is not None:
+            self.used -= old.sizeInBytes()
+        self._tiles[key] = tile
+        self.used += tile.sizeInBytes()
+        while self.used > self.budget and len(self._tiles) > 1:
+            _, evicted = self._tiles.popitem(last=False)
+            self.used -= evicted.sizeInBytes()
+
+    def clear(self):
+        self._tiles.clear()
+        self.used = 0
+
+
+class TiledImageView(QObject):
+    """在QLabel上缩放和平移查看大图，只解码可见区域的分块
+    
+    分块组成多分辨率金字塔：第level层是原图缩小2^level倍，每块TILE_SIZE像素。
+    分块和坐标都按EXIF方向旋转后的图片计算，解码时换算回原图中的区域，解码后再旋转。
+    支持区域解码的格式（如JPEG）用setClipRect/setScaledSize只解码需要的分块；
+    不支持的格式解码一次整层后切成分块，这类格式即使指定缩小尺寸也会先按原尺寸解码，
+    原尺寸解码超过分块缓存上限的图片不能放大查看。分块在后台线程中解码，完成后再显示。
+    """
+    tiles_decoded = pyqtSignal(object, int, object, object)  # 图片键, 层级, 请求的分块位置, [(列, 行, 分块)]
+
+    def __init__(self, label, tile_cache=None, parent=None):
+        super().__init__(parent)
+        self.label = label
+        self.tile_cache = tile_cache if tile_cache is not None else TileCache()
+        self.image_path = None
+        self.image_key = None
+        self.orientation = 1  # 图片的EXIF方向
+        self.image_size = QSize()  # 按方向旋转后的尺寸
+        self.scale = None  # 显示像素/原图像素，None表示未缩放（适应窗口）
+        self.center = QPointF()  # 显示区域中心在原图中的位置
+        self.refused_path = None  # 太大而不能放大查看的图片
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+        self._pending = set()  # 正在解码的分块: (图片键, 层级, 列, 行)
+        self.tiles_decoded.connect(self.on_tiles_decoded)
+        label.installEventFilter(self)
+
+    def is_zoomed(self):
+        return self.scale is not None
+
+    def reset(self):
+        self.image_path = None
+        self.scale = None
+        # 尚未开始的解码任务不再需要
+        self.pool.clear()
+        self._pending.clear()
+
+    def shutdown(self):
+        self.reset()
+        self.pool.waitForDone()
+
+    def fit_scale(self):
+        size = self.label.size()
+        return min(size.width() / self.image_size.width(), size.height() / self.image_size.height())
+
+    def zoom_at(self, image_path, factor, pos, orientation=1):
+        """以标签上的pos为中心缩放，缩小到适应窗口时返回False（恢复普通显示）"""
+        if image_path == self.refused_path:
+            return False
+        if image_path != self.image_path or orientation != self.orientation:
+            # 只读取文件头中的尺寸
+            try:
+                stat = stat_image(image_path)
+            except OSError as e:
+                print(f"读取图片时出错: {e}")
+                return False
+            with open_image_reader(image_path) as reader:
+                size = reader.size()
+                clip_supported = reader.supportsOption(QImageIOHandler.ClipRect)
+            if not size.isValid() or size.isEmpty():
+                return False
+            if not clip_supported and size.width() * size.height() * 4 > self.tile_cache.budget:
+                # 不支持区域解码时每次都要按原尺寸解码整张图片，内存占用没有上限
+                print(f"图片太大且格式不支持区域解码，无法放大查看: {image_path}")
+                self.refused_path = image_path
+                return False
+            self.image_path = image_path
+            self.image_key = (image_path, stat.st_mtime_ns, orientation)
+            self.orientation = orientation
+            self.image_size = size.transposed() if orientation in (5, 6, 7, 8) else size
+            self.scale = None
+        
+        fit = self.fit_scale()
+        if self.scale is None:
+            self.scale = fit
+            self.center = QPointF(self.image_size.width() / 2, self.image_size.height() / 2)
+        scale = min(self.scale * factor, max(ZOOM_MAX_SCALE, fit))
+        if scale <= fit * 1.001:
+            self.scale = None
+            return False
+        # 保持鼠标下的点不动
+        anchor = self.to_image(pos)
+        self.scale = scale
+        half = QPointF(self.label.width() / 2, self.label.height() / 2)
+        self.center = anchor - (QPointF(pos) - half) / scale
+        self.render()
+        return True
+
+    def pan(self, delta):
+        """按标签上的像素偏移平移"""
+        if self.scale is None:
+            return
+        self.center -= QPointF(delta) / self.scale
+        self.render()
+
+    def to_image(self, pos):
+        """标签坐标 -> 原图坐标"""
+        half = QPointF(self.label.width() / 2, self.label.height() / 2)
+        return self.center + (QPointF(pos) - half) / self.scale
+
+    def _clamp_center(self):
+        # 图片比窗口小的方向居中，否则不允许移出图片边缘
+        for axis, view, total in ((0, self.label.width(), self.image_size.width()),
+                                  (1, self.label.height(), self.image_size.height())):
+            half = view / 2 / self.scale
+            value = self.center.x() if axis == 0 else self.center.y()
+            value = total / 2 if half * 2 >= total else min(max(value, half), total - half)
+            if axis == 0:
+                self.center.setX(value)
+            else:
+                self.center.setY(value)
+
+    def eventFilter(self, obj, event):
+        if obj is self.label and event.type() == QEvent.Resize and self.scale is not None:
+            QTimer.singleShot(0, self.render)
+        return False
+
+    def render(self, request=True):
+        """合成可见的分块并显示，request为True时在后台解码缺少的分块"""
+        if self.scale is None or self.image_path is None:
+            return
+        self._clamp_center()
+        width, height = self.label.width(), self.label.height()
+        if width <= 0 or height <= 0:
+            return
+        # 选择分辨率不低于显示所需的最小层级
+        max_level = max(0, math.ceil(math.log2(max(self.image_size.width(), self.image_size.height()) / TILE_SIZE)))
+        level = min(max_level, max(0, math.floor(math.log2(1 / self.scale)))) if self.scale < 1 else 0
+        span = TILE_SIZE << level  # 每个分块覆盖的原图像素
+        
+        left = self.center.x() - width / 2 / self.scale
+        top = self.center.y() - height / 2 / self.scale
+        right = min(self.image_size.width(), left + width / self.scale)
+        bottom = min(self.image_size.height(), top + height / self.scale)
+        
+        positions = [(column, row)
+                     for row in range(max(0, int(top // span)), int(max(0, bottom - 1) // span) + 1)
+                     for column in range(max(0, int(left // span)), int(max(0, right - 1) // span) + 1)]
+        missing = [position for position in positions
+                   if self.tile_cache.get((self.image_key, level) + position) is None
+                   and (self.image_key, level) + position not in self._pending]
+        if missing and request:
+            self.decode_tiles(level, missing)
+        
+        canvas = QImage(width, height, QImage.Format_ARGB32_Premultiplied)
+        canvas.fill(Qt.transparent)
+        painter = QPainter(canvas)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        for column, row in positions:
+            rect = self.tile_rect(level, column, row)
+            target = QRectF((rect.x() - left) * self.scale, (rect.y() - top) * self.scale,
+                            rect.width() * self.scale, rect.height() * self.scale)
+            tile = self.tile_cache.get((self.image_key, level, column, row))
+            if tile is not None:
+                painter.drawImage(target, tile)
+                continue
+            # 解码完成前先用上一层（分辨率减半）的分块代替
+            parent = self.tile_cache.get((self.image_key, level + 1, column // 2, row // 2))
+            if parent is not None:
+                parent_rect = self.tile_rect(level + 1, column // 2, row // 2)
+                factor = 2 << level  # 上一层的缩小倍数
+                source = QRectF((rect.x() - parent_rect.x()) / factor, (rect.y() - parent_rect.y()) / factor,
+                                rect.width() / factor, rect.height() / factor)
+                painter.drawImage(target, parent, source)
+        painter.end()
+        self.label.setPixmap(QPixmap.fromImage(canvas))
+
+    def tile_rect(self, level, column, row):
+        return tile_rect(self.image_size, level, column, row)
+
+    def decode_tiles(self, level, positions):
+        """在后台线程中解码缺少的分块"""
+        for position in positions:
+            self._pending.add((self.image_key, level) + position)
+        self.pool.start(TileDecodeTask(self, self.image_path, self.image_key, QSize(self.image_size),
+                                       self.orientation, level, positions))
+
+    def on_tiles_decoded(self, image_key, level, positions, tiles):
+        """分块解码完成：放入缓存，仍在查看这张图片时重新显示"""
+        for position in positions:
+            self._pending.discard((image_key, level) + position)
+        for column, row, tile in tiles:
+            self.tile_cache.put((image_key, level, column, row), tile)
+        if image_key == self.image_key and self.scale is not None:
+            # 不再提交新的解码任务，避免可见分块超过缓存上限时反复解码
+            self.render(request=False)
+
+
+class TileDecodeTask(QRunnable):
+    """在线程池中解码一组分块"""
+
+    def __init__(self, view, image_path, image_key, image_size, orientation, level, positions):
+        super().__init__()
+        self.view = view
+        self.image_path = image_path
+        self.image_key = image_key
+        self.image_size = image_size
+        self.orientation = orientation
+        self.level = level
+        self.positions = positions
+        self.budget = view.tile_cache.budget
+
+    def run(self):
+        if self.image_key != self.view.image_key:
+            # 已切换到别的图片
+            self.view.tiles_decoded.emit(self.image_key, self.level, self.positions, [])
+            return
+        try:
+            tiles = decode_tiles(self.image_path, self.image_size, self.level, self.positions, self.budget,
+                                 self.orientation)
+        except OSError as e:
+            print(f"解码图片分块时出错: {e}")
+            tiles = []
+        self.view.tiles_decoded.emit(self.image_key, self.level, self.positions, tiles)
+
+
+def tile_rect(image_size, level, column, row):
+    """分块在原图中的区域"""
+    span = TILE_SIZE << level
+    return QRect(column * span, row * span, span, span).intersected(QRect(QPoint(0, 0), image_size))
+
+
+def decode_tiles(image_path, image_size, level, positions, budget, orientation=1):
+    """解码分块，返回[(列, 行, 分块)]
+    
+    image_size和分块位置都按EXIF方向旋转后的图片计算，解码原图中对应的区域后再旋转。
+    支持区域解码时一次解码覆盖所有缺少分块的区域再切开（JPEG等格式每次读取都要从头解码到该区域，
+    逐块读取代价很高）；不支持时解码整层，按与可见区域的距离保留不超过budget四分之三的分块。
+    """
+    stored_size = image_size.transposed() if orientation in (5, 6, 7, 8) else image_size
+    to_stored = orientation_transform(stored_size, orientation).inverted()[0]
+    with open_image_reader(image_path) as reader:
+        if reader.supportsOption(QImageIOHandler.ClipRect):
+            bounds = QRect()
+            for column, row in positions:
+                bounds = bounds.united(tile_rect(image_size, level, column, row))
+            reader.setClipRect(to_stored.mapRect(QRectF(bounds)).toRect())
+        else:
+            bounds = QRect(QPoint(0, 0), image_size)
+        if level:
+            scaled = QSize(max(1, math.ceil(bounds.width() / (1 << level))),
+                           max(1, math.ceil(bounds.height() / (1 << level))))
+            reader.setScaledSize(scaled.transposed() if orientation in (5, 6, 7, 8) else scaled)
+        image = reader.read()
+        if image.isNull():
+            print(f"解码图片分块时出错: {reader.errorString()}")
+            return []
+    if orientation != 1:
+        image = apply_orientation(image, orientation)
+    
+    span = TILE_SIZE << level
+    first_column, first_row = bounds.x() // span, bounds.y() // span
+    tiles = [(column, row)
+             for row in range(first_row, math.ceil((bounds.y() + bounds.height()) / span))
+             for column in range(first_column, math.ceil((bounds.x() + bounds.width()) / span))]
+    if len(tiles) > len(positions):
+        # 整层解码：离可见区域越近越晚放入缓存（越晚被淘汰）
+        center_column = sum(column for column, _ in positions) / len(positions)
+        center_row = sum(row for _, row in positions) / len(positions)
+        wanted = set(positions)
+        tiles.sort(key=lambda tile: (tile in wanted, -abs(tile[0] - center_column) - abs(tile[1] - center_row)))
+        tile_bytes = TILE_SIZE * TILE_SIZE * image.depth() // 8
+        tiles = tiles[-max(len(positions), budget * 3 // 4 // tile_bytes):]
+    
+    image_rect = image.rect()
+    result = []
+    for column, row in tiles:
+        rect = QRect((column - first_column) * TILE_SIZE, (row - first_row) * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+        result.append((column, row, image.copy(rect.intersected(image_rect))))
+    return result
+
 
 class ImageViewer(QWidget):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, image_cache=None):
         super().__init__(parent)
         self.setWindowTitle("图片查看")
         # 修改窗口标志，移除标题栏并在任务栏中隐藏
@@ -39,6 +3338,7 @@ class ImageViewer(QWidget):
         self.is_dragging = False
         self.drag_start_position = QPoint()
         self.main_window = None  # 保存主窗口引用
+        self.image_cache = image_cache if image_cache is not None else ImageCache()  # 与主窗口共享的图片缓存
         
         # 全屏相关变量
         self.is_fullscreen = False
@@ -50,9 +3350,31 @@ class ImageViewer(QWidget):
         layout.setContentsMargins(0, 0, 0, 0)
         self.image_label = QLabel()
         self.image_label.setAlignment(Qt.AlignCenter)
-        self.image_label.setStyleSheet("background-color: rgba(0, 0, 0, 200);")
+        self.image_label.setStyleSheet("background-color: rgba(0, 0, 0, 200); color: #cccccc;")
         self.image_label.setMinimumSize(1, 1)  # 设置最小尺寸为1x1
         layout.addWidget(self.image_label)
+        self.surface = ImageSurface(self.image_label, self.image_cache, self)
+        # 滚轮缩放、拖动平移
+        self.zoom_view = TiledImageView(self.image_label, parent=self)
+        self.pan_start = None
+        
+        # 性能信息浮层（F3切换）
+        self.hud_label = QLabel(self)
+        self.hud_label.setStyleSheet("""
+            QLabel {
+                background-color: rgba(0, 0, 0, 170);
+                color: #8f8;
+                font-family: Consolas, monospace;
+                font-size: 12px;
+                padding: 6px;
+                border-radius: 4px;
+            }
+        """)
+        self.hud_label.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.hud_label.hide()
+        self.hud_timer = QTimer(self)
+        self.hud_timer.timeout.connect(self.update_hud)
+        QShortcut(QKeySequence(Qt.Key_F3), self, self.toggle_hud)
         
         # 创建全屏按钮
         self.fullscreen_button = QPushButton(self)
@@ -155,17 +3477,38 @@ class ImageViewer(QWidget):
                 self.main_window.toggle_slideshow()
             self.main_window.show()
     
-    def display_image(self, pixmap):
-        # 调整图片大小以适应标签，保持纵横比
-        scaled_pixmap = pixmap.scaled(self.image_label.size(), 
-                                      Qt.KeepAspectRatio, 
-                                      Qt.SmoothTransformation)
-        self.image_label.setPixmap(scaled_pixmap)
+    def display_image(self, image_path, transition=None, duration_ms=TRANSITION_DURATION_MS, stat=None):
+        # 切换图片时恢复适应窗口显示
+        if self.zoom_view.is_zoomed():
+            transition = None
+        self.zoom_view.reset()
+        self.surface.paused = False
+        # 从缓存中取出已按比例缩放到标签大小的图片
+        return self.surface.show_image(image_path, transition, duration_ms, stat)
+    
+    def wheelEvent(self, event):
+        """滚轮缩放，以鼠标位置为中心；缩小到适应窗口时恢复普通显示"""
+        image_path = self.surface.image_path
+        steps = event.angleDelta().y() / 120
+        if not image_path or not steps:
+            return
+        pos = self.image_label.mapFrom(self, event.pos())
+        orientation = self.image_cache.orientations.get(image_path, 1)
+        if self.zoom_view.zoom_at(image_path, ZOOM_STEP ** steps, pos, orientation):
+            self.surface.pause()
+        else:
+            self.reset_zoom()
+        event.accept()
+    
+    def reset_zoom(self):
+        """恢复适应窗口显示"""
+        self.zoom_view.reset()
+        self.pan_start = None
+        if self.surface.paused:
+            self.surface.resume()
     
     def resizeEvent(self, event):
-        # 窗口大小改变时保存大小并重新显示当前图片
-        if hasattr(self, 'current_pixmap'):
-            self.display_image(self.current_pixmap)
+        # 窗口大小改变时保存大小（图片由ImageSurface重新缩放）
         if self.main_window:
             self.main_window.save_settings()
             
@@ -174,6 +3517,39 @@ class ImageViewer(QWidget):
             
         super().resizeEvent(event)
     
+    def toggle_hud(self):
+        """显示或隐藏性能信息浮层"""
+        if self.hud_label.isVisible():
+            self.hud_timer.stop()
+            self.hud_label.hide()
+        else:
+            self.update_hud()
+            self.hud_label.show()
+            self.hud_label.raise_()
+            self.hud_timer.start(HUD_REFRESH_MS)
+    
+    def update_hud(self):
+        """刷新性能信息：各阶段耗时、切换间隔、缓存命中率和内存占用"""
+        monitor = self.image_cache.monitor
+        lines = []
+        if monitor is not None:
+            for stage, name in PERF_STAGE_NAMES.items():
+                stats = monitor.percentiles(stage)
+                if stats is None:
+                    continue
+                lines.append(f"{name}: p50 {stats['p50']:.1f}  p95 {stats['p95']:.1f}  p99 {stats['p99']:.1f} ms")
+        if self.main_window:
+            lines.append(f"设置的切换间隔: {self.main_window.interval_spin.value() * 1000} ms  "
+                         f"错过切换时间: {self.main_window.scheduler.missed} 次")
+        cache = self.image_cache.stats()
+        lines.append(f"缓存命中率: {cache['hit_rate']:.0%}  缓存: {cache['used_mb']:.0f}/{cache['budget_mb']:.0f} MB")
+        memory = process_memory_mb()
+        if memory is not None:
+            lines.append(f"进程内存: {memory:.0f} MB")
+        self.hud_label.setText("\n".join(lines))
+        self.hud_label.adjustSize()
+        self.hud_label.move(10, self.height() - self.hud_label.height() - 10)
+    
     def update_fullscreen_button_position(self):
         """更新按钮位置"""
         # 放在窗口右上角
@@ -204,6 +3580,10 @@ class ImageViewer(QWidget):
                 self.resizing = True
                 self.resize_start_pos = event.globalPos()
                 self.resize_start_size = self.size()
+            elif self.zoom_view.is_zoomed():
+                # 放大时拖动平移图片
+                self.pan_start = event.pos()
+                self.setCursor(Qt.ClosedHandCursor)
             else:
                 # 若当前已全屏，不执行拖动操作
                 if self.is_fullscreen:
@@ -215,6 +3595,12 @@ class ImageViewer(QWidget):
             event.accept()
     
     def mouseMoveEvent(self, event):
+        if self.pan_start is not None:
+            self.zoom_view.pan(event.pos() - self.pan_start)
+            self.pan_start = event.pos()
+            event.accept()
+            return
+        
         # 调整鼠标样式
         if self.is_resize_area(event.pos()):
             self.setCursor(Qt.SizeFDiagCursor)
@@ -237,6 +3623,9 @@ class ImageViewer(QWidget):
         if event.button() == Qt.LeftButton:
             self.is_dragging = False
             self.resizing = False
+            if self.pan_start is not None:
+                self.pan_start = None
+                self.setCursor(Qt.ArrowCursor)
         event.accept()
     
     def mouseDoubleClickEvent(self, event):
@@ -252,6 +3641,12 @@ class ImageViewer(QWidget):
         return (bottom_right - pos).manhattanLength() < 20
         
     def keyPressEvent(self, event):
+        # 放大时ESC或0键恢复适应窗口
+        if event.key() in (Qt.Key_Escape, Qt.Key_0) and self.zoom_view.is_zoomed():
+            self.reset_zoom()
+            event.accept()
+            return
+        
         # ESC键处理
         if event.key() == Qt.Key_Escape:
             if self.is_fullscreen:
@@ -269,6 +3664,9 @@ class ImageViewer(QWidget):
         event.accept()
     
     def closeEvent(self, event):
+        # 等待正在解码的分块完成
+        self.reset_zoom()
+        self.zoom_view.shutdown()
         # 窗口关闭时确保主窗口显示
         if self.main_window:
             # 暂停播放
@@ -288,12 +3686,15 @@ class ImageViewer(QWidget):
         if not self.main_window or not hasattr(self.main_window, 'images') or not self.main_window.images:
             return
             
-        # 获取当前图片路径
-        current_image = self.main_window.images[self.main_window.current_image_index]
-        
-        # 获取图片所在的文件夹并规范化路径
-        folder_path = os.path.dirname(os.path.abspath(current_image))
-        image_file = os.path.basename(current_image)
+        # 获取当前图片所在的文件夹和文件名并规范化路径
+        images = self.main_window.images
+        index = self.main_window.current_image_index
+        folder_path = os.path.abspath(images.folder(index))
+        image_file = images.name(index)
+        # 压缩包中的图片：打开压缩包所在的文件夹并选中压缩包
+        member = archive_index.split(images[index])
+        if member is not None:
+            folder_path, image_file = os.path.split(os.path.abspath(member[0]))
         
         try:
             # 在Windows中使用explorer打开文件夹并选中文件
@@ -301,7 +3702,7 @@ class ImageViewer(QWidget):
             if sys.platform == 'win32':
                 # 使用双引号包裹路径，处理路径中可能包含的空格
                 # 注意: 需要将反斜杠转义
-                current_image_path = current_image.replace('/', '\\')
+                current_image_path = os.path.join(folder_path, image_file).replace('/', '\\')
                 
                 # 直接打印调试信息
                 print(f"打开文件: {current_image_path}")
@@ -353,7 +3754,7 @@ class DropArea(QFrame):
         icon_label.setPixmap(QApplication.style().standardIcon(QStyle.SP_DirIcon).pixmap(64, 64))
         icon_label.setAlignment(Qt.AlignCenter)
         
-        text_label = QLabel("拖放文件夹到这里\n或点击选择文件夹")
+        text_label = QLabel("拖放文件夹或压缩包到这里\n或点击选择文件夹")
         text_label.setAlignment(Qt.AlignCenter)
         text_label.setStyleSheet("color: #666666; font-size: 14px;")
         
@@ -367,7 +3768,8 @@ class DropArea(QFrame):
     def dropEvent(self, event: QDropEvent):
         for url in event.mimeData().urls():
             folder_path = url.toLocalFile()
-            if os.path.isdir(folder_path):
+            if os.path.isdir(folder_path) or (folder_path.lower().endswith(ARCHIVE_FORMATS)
+                                               and os.path.isfile(folder_path)):
                 self.parent().add_folder(folder_path)
 
 class PhotoAlbum(QMainWindow):
@@ -376,14 +3778,76 @@ class PhotoAlbum(QMainWindow):
         self.setWindowTitle(APP_NAME)
         self.resize(1000, 700)
         self.folders = []
-        self.images = []
+        self.images = ImageIndex()
         self.current_image_index = 0
         self.slideshow_active = False
         self.play_order = "顺序播放"  # 默认播放顺序
+        self.scanner = None  # 当前的后台扫描线程
+        self.duplicate_finder = None  # 后台查找重复照片的线程
+        self.duplicate_paths = set()  # 重复照片（每组中除第一张外的其余照片）
+        self.metadata_reader = None  # 后台读取EXIF信息的线程
+        self.validator = None  # 后台检查图片的线程
+        self.quarantine = {}  # 无法显示的图片: 路径 -> {'reason': 原因, 'mtime_ns': 修改时间}
+        self.failure_checker = DisplayFailureChecker(self)  # 重新检查显示时解码失败的图片
+        self.failure_checker.failed.connect(self.on_display_failure_checked)
+        self.display_failures = 0  # 连续显示失败的次数
+        self.date_order = None  # 按拍摄时间排序的图片索引
+        self.date_positions = None  # 图片索引 -> 在date_order中的位置
+        self.library_index = None  # 筛选用的图片库索引（第一次筛选时建立，只在筛选线程中访问）
+        self.filter_worker = FilterWorker(self)
+        self.filter_worker.finished.connect(self.on_filter_results)
+        self.filter_generation = 0  # 播放列表重建时增加，丢弃之前提交的筛选的结果
+        self.show_first_match = False  # 扫描开始时有筛选条件：第一批筛选结果返回后显示第一张
+        self.image_filter = None  # 当前的筛选条件，None表示播放全部图片
+        self.playlist = None  # 筛选出的图片索引（按图片列表顺序）
+        self.playlist_positions = None  # 图片索引 -> 在playlist中的位置（不在其中为-1）
+        self.playlist_shuffle = None  # 在筛选出的图片中随机播放的顺序
+        self.filtered_date_order = None  # 按拍摄时间播放时筛选后的(顺序, 位置)
+        self.saved_playlist = None  # 正在播放的保存的播放列表
+        self.saved_order = None  # 播放保存的播放列表时（筛选后）的(顺序, 位置)
+        self.scanned_directories = []  # 已扫描的文件夹（监视模式下需要监视）
+        self.pending_directories = set()  # 等待处理变化的文件夹
+        self.pending_since = 0.0
+        
+        # 主线程使用的图片目录连接
+        try:
+            self.catalog = ImageCatalog()
+        except sqlite3.Error as e:
+            print(f"打开图片目录时出错: {e}")
+            self.catalog = None
+        
+        # 设置延迟保存（界面创建和加载设置时的修改会合并为一次写入）
+        self.settings_store = SettingsStore(SETTINGS_FILE, self.collect_settings, self)
+        
+        # 性能统计
+        self.perf_monitor = PerfMonitor()
+        self.last_tick_time = None
+        
+        # 主窗口和独立窗口共享的解码图片缓存
+        self.image_cache = ImageCache(monitor=self.perf_monitor)
+        if self.catalog is not None:
+            # 启动时就按上次读取的EXIF方向显示图片，不必等待读取整个图片库的EXIF信息
+            try:
+                self.image_cache.orientations = self.catalog.get_orientations()
+            except sqlite3.Error as e:
+                print(f"读取图片方向时出错: {e}")
+        
+        self.prefetcher = ImagePrefetcher(self.image_cache)
+        # 网络文件夹上接下来要播放的图片先复制到本地
+        self.staging = StagingCache()
+        self.image_cache.staging = self.staging
+        self.shuffle = ShuffleOrder()  # 随机播放顺序
+        self.pending_shuffle_state = None  # 等待扫描完成后恢复的随机播放状态
+        
+        # 独立图片查看器在首次使用或启动完成后再创建
+        self._image_viewer = None
+        self.viewer_geometry = {}
         
-        # 创建独立图片查看器
-        self.image_viewer = ImageViewer()
-        self.image_viewer.set_main_window(self)
+        # 启动时恢复上次显示的图片
+        self.display_cache = DisplayFrameCache()
+        self.image_cache.display_cache = self.display_cache
+        self.restore_image_path = None  # 等待在扫描结果中定位的上次显示的图片
+        self.first_image_shown = False
         
         # 设置应用样式
         self.setStyleSheet("""
@@ -439,6 +3903,86 @@ class PhotoAlbum(QMainWindow):
         
         # 加载保存的设置
         self.load_settings()
+        
+        # 窗口显示后先显示上次的图片，再扫描图片库
+        QTimer.singleShot(0, self.show_startup_image)
+    
+    @property
+    def image_viewer(self):
+        """独立图片查看器（首次使用时创建）"""
+        if self._image_viewer is None:
+            viewer = ImageViewer(image_cache=self.image_cache)
+            if self.viewer_geometry:
+                viewer.resize(self.viewer_geometry.get('width', 800), self.viewer_geometry.get('height', 600))
+                viewer.move(self.viewer_geometry.get('x', 100), self.viewer_geometry.get('y', 100))
+            if self.always_on_top.isChecked():
+                viewer.setWindowFlags(viewer.windowFlags() | Qt.WindowStaysOnTopHint)
+            viewer.set_main_window(self)
+            self._image_viewer = viewer
+        return self._image_viewer
+    
+    def viewer_visible(self):
+        return self._image_viewer is not None and self._image_viewer.isVisible()
+    
+    def show_startup_image(self):
+        """启动时立即显示上次的图片（优先使用磁盘上缓存的屏幕尺寸图片），然后在后台扫描图片库"""
+        image_path = self.restore_image_path
+        if image_path and os.path.exists(image_file_path(image_path)):
+            screen = self.screen() or QApplication.primaryScreen()
+            stat = self.known_stat(image_path)
+            orientation = self.image_cache.orientations.get(image_path, 1)
+            frame = self.display_cache.get(image_path, screen.size(), orientation, stat)
+            if frame is not None:
+                self.image_surface.show_frame(image_path, frame)
+            else:
+                self.image_surface.show_image(image_path, stat=stat)
+            self.setWindowTitle(f"电子相册 - {os.path.basename(image_path)}")
+            self.record_first_image()
+        else:
+            self.restore_image_path = None
+        QTimer.singleShot(0, self.finish_startup)
+    
+    def finish_startup(self):
+        """创建独立窗口并开始扫描图片库"""
+        self.image_viewer
+        if self.folders and self.scanner is None and not self.images:
+            self.load_images()
+    
+    def known_stat(self, image_path):
+        """图片目录中记录的修改时间和大小，界面线程中用它代替读取文件信息（没有记录时返回None）"""
+        if self.catalog is None:
+            return None
+        try:
+            return self.catalog.file_stat(image_path)
+        except sqlite3.Error:
+            return None
+    
+    def record_first_image(self):
+        """记录从程序启动到显示第一张图片的耗时"""
+        if self.first_image_shown:
+            return
+        self.first_image_shown = True
+        elapsed = (time.perf_counter() - APP_START_TIME) * 1000
+        self.perf_monitor.record('first_image', elapsed)
+    
+    def save_startup_frame(self):
+        """把当前图片的屏幕尺寸版本保存到磁盘缓存，下次启动时直接显示"""
+        if not self.images:
+            return
+        image_path = self.images[self.current_image_index]
+        screen = self.screen() or QApplication.primaryScreen()
+        size = screen.size()
+        stat = self.known_stat(image_path)
+        # 按解码时使用的方向保存，首次运行时EXIF信息尚未读完也不会以后一直显示未旋转的图片
+        orientation = self.image_cache.orientations.get(image_path, 1)
+        try:
+            if os.path.exists(self.display_cache.frame_path(image_path, size, orientation, stat)):
+                return
+        except OSError:
+            return
+        frame = self.image_cache.get_scaled(image_path, size, stat)
+        if not frame.isNull():
+            self.display_cache.put(image_path, size, orientation, frame, stat)
     
     def init_ui(self):
         # 创建主布局
@@ -478,6 +4022,45 @@ class PhotoAlbum(QMainWindow):
         self.include_subfolders.stateChanged.connect(self.reload_images)
         left_layout.addWidget(self.include_subfolders)
         
+        # 筛选栏：只播放符合条件的图片，不重新扫描
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setClearButtonEnabled(True)
+        self.filter_edit.setPlaceholderText("筛选: 文件名 folder: ext: date: size>")
+        self.filter_edit.setToolTip(
+            "多个条件用空格分隔，同时满足：\n"
+            "文件名中的文字（可用*和?通配符）\n"
+            "folder:文件夹名  ext:jpg,png\n"
+            "date:2024-05  after:2024-01-01  before:2024-12-31（按修改日期）\n"
+            "size>2MB  size<500KB")
+        self.filter_edit.textChanged.connect(lambda: self.filter_timer.start(FILTER_DEBOUNCE_MS))
+        self.filter_edit.returnPressed.connect(self.apply_filter)
+        left_layout.addWidget(self.filter_edit)
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.timeout.connect(self.apply_filter)
+        self.filter_status_label = QLabel("")
+        self.filter_status_label.setStyleSheet("color: #666666;")
+        left_layout.addWidget(self.filter_status_label)
+        
+        # 监视文件夹变化选项
+        self.watch_folders = QCheckBox("监视文件夹变化")
+        self.watch_folders.stateChanged.connect(self.toggle_watch_folders)
+        left_layout.addWidget(self.watch_folders)
+        
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.on_directory_changed)
+        # 压缩包作为文件监视
+        self.watcher.fileChanged.connect(self.on_directory_changed)
+        self.watch_timer = QTimer(self)
+        self.watch_timer.setSingleShot(True)
+        self.watch_timer.timeout.connect(self.apply_directory_changes)
+        
+        # 扫描状态
+        self.scan_status_label = QLabel("")
+        self.scan_status_label.setStyleSheet("color: #666666;")
+        self.scan_status_label.setWordWrap(True)
+        left_layout.addWidget(self.scan_status_label)
+        
         # 创建控制组
         control_group = QGroupBox("播放控制")
         control_layout = QVBoxLayout()
@@ -486,11 +4069,32 @@ class PhotoAlbum(QMainWindow):
         order_layout = QHBoxLayout()
         order_layout.addWidget(QLabel("播放顺序:"))
         self.order_combo = QComboBox()
-        self.order_combo.addItems(["顺序播放", "随机播放", "倒序播放"])
+        self.order_combo.addItems(["顺序播放", "随机播放", "倒序播放", "按拍摄时间"])
+        if self.catalog is not None:
+            try:
+                self.order_combo.addItems([PLAYLIST_ORDER_PREFIX + name for name in self.catalog.playlist_names()])
+            except sqlite3.Error as e:
+                print(f"读取播放列表时出错: {e}")
         self.order_combo.currentTextChanged.connect(self.change_play_order)
         order_layout.addWidget(self.order_combo)
         control_layout.addLayout(order_layout)
         
+        # 保存的播放列表
+        playlist_layout = QHBoxLayout()
+        self.save_playlist_btn = QPushButton("保存播放列表...")
+        self.save_playlist_btn.setToolTip("按当前播放顺序（含筛选）保存为播放列表")
+        self.save_playlist_btn.clicked.connect(self.save_current_playlist)
+        playlist_layout.addWidget(self.save_playlist_btn)
+        self.delete_playlist_btn = QPushButton("删除播放列表")
+        self.delete_playlist_btn.clicked.connect(self.delete_current_playlist)
+        self.delete_playlist_btn.setEnabled(False)
+        playlist_layout.addWidget(self.delete_playlist_btn)
+        self.save_playlist_btn.setEnabled(self.catalog is not None)
+        control_layout.addLayout(playlist_layout)
+        self.playlist_label = QLabel("")
+        self.playlist_label.setWordWrap(True)
+        control_layout.addWidget(self.playlist_label)
+        
         # 播放/暂停按钮
         self.play_btn = QPushButton("播放")
         self.play_btn.clicked.connect(self.toggle_slideshow)
@@ -505,15 +4109,80 @@ class PhotoAlbum(QMainWindow):
         interval_layout.addWidget(self.interval_spin)
         control_layout.addLayout(interval_layout)
         
+        # 切换效果
+        transition_layout = QHBoxLayout()
+        transition_layout.addWidget(QLabel("切换效果:"))
+        self.transition_combo = QComboBox()
+        self.transition_combo.addItems(list(TRANSITION_EFFECTS))
+        self.transition_combo.currentTextChanged.connect(self.save_settings)
+        transition_layout.addWidget(self.transition_combo)
+        control_layout.addLayout(transition_layout)
+        
         # 窗口置顶选项
         self.always_on_top = QCheckBox("窗口置顶")
         self.always_on_top.stateChanged.connect(self.toggle_always_on_top)
         control_layout.addWidget(self.always_on_top)
         
-        # 独立窗口播放选项
-        self.use_viewer_window = QCheckBox("独立窗口播放")
-        self.use_viewer_window.setChecked(True)
-        control_layout.addWidget(self.use_viewer_window)
+        # 独立窗口播放选项
+        self.use_viewer_window = QCheckBox("独立窗口播放")
+        self.use_viewer_window.setChecked(True)
+        control_layout.addWidget(self.use_viewer_window)
+        
+        # 跳过重复照片（连拍、多个文件夹中的副本），每组相近的照片只播放一张
+        self.skip_duplicates = QCheckBox("跳过重复照片")
+        self.skip_duplicates.stateChanged.connect(self.toggle_skip_duplicates)
+        control_layout.addWidget(self.skip_duplicates)
+        self.duplicate_status_label = QLabel("")
+        self.duplicate_status_label.setStyleSheet("color: #666666;")
+        control_layout.addWidget(self.duplicate_status_label)
+        
+        # 无法显示的图片（损坏、不完整或不是图片）放入隔离列表，播放时跳过
+        self.full_validation = QCheckBox("完整解码检查")
+        self.full_validation.setToolTip("除文件头外还完整解码每张图片，能发现不完整的文件，但检查较慢")
+        self.full_validation.stateChanged.connect(self.toggle_full_validation)
+        control_layout.addWidget(self.full_validation)
+        self.quarantine_label = QLabel("")
+        self.quarantine_label.setStyleSheet("color: #666666;")
+        control_layout.addWidget(self.quarantine_label)
+        self.quarantine_list = QListWidget()
+        self.quarantine_list.setMaximumHeight(100)
+        self.quarantine_list.hide()
+        control_layout.addWidget(self.quarantine_list)
+        self.clear_quarantine_button = QPushButton("清空并重新检查")
+        self.clear_quarantine_button.clicked.connect(self.clear_quarantine)
+        self.clear_quarantine_button.hide()
+        control_layout.addWidget(self.clear_quarantine_button)
+        
+        # 图片缓存上限
+        cache_layout = QHBoxLayout()
+        cache_layout.addWidget(QLabel("缓存上限(MB):"))
+        self.cache_budget_spin = QSpinBox()
+        self.cache_budget_spin.setRange(16, 4096)
+        self.cache_budget_spin.setSingleStep(16)
+        self.cache_budget_spin.setValue(DEFAULT_CACHE_BUDGET_MB)
+        self.cache_budget_spin.valueChanged.connect(self.change_cache_budget)
+        cache_layout.addWidget(self.cache_budget_spin)
+        control_layout.addLayout(cache_layout)
+        
+        # 预读张数
+        prefetch_layout = QHBoxLayout()
+        prefetch_layout.addWidget(QLabel("预读张数:"))
+        self.prefetch_spin = QSpinBox()
+        self.prefetch_spin.setRange(0, 20)
+        self.prefetch_spin.setValue(DEFAULT_PREFETCH_DEPTH)
+        self.prefetch_spin.valueChanged.connect(self.save_settings)
+        prefetch_layout.addWidget(self.prefetch_spin)
+        control_layout.addLayout(prefetch_layout)
+        
+        self.cache_stats_label = QLabel("")
+        self.cache_stats_label.setStyleSheet("color: #666666;")
+        self.cache_stats_label.setWordWrap(True)
+        control_layout.addWidget(self.cache_stats_label)
+        
+        # 导出性能日志（独立窗口中按F3显示性能信息）
+        self.export_perf_btn = QPushButton("导出性能日志")
+        self.export_perf_btn.clicked.connect(self.export_perf_log)
+        control_layout.addWidget(self.export_perf_btn)
         
         control_group.setLayout(control_layout)
         left_layout.addWidget(control_group)
@@ -537,17 +4206,55 @@ class PhotoAlbum(QMainWindow):
             QLabel {
                 background-color: #2c2c2c;
                 border-radius: 4px;
+                color: #cccccc;
             }
         """)
         self.image_label.setMinimumSize(1, 1)
+        self.image_surface = ImageSurface(self.image_label, self.image_cache, self)
+        
+        # 缩略图条（只渲染可见的缩略图，可直接跳转到任意图片）
+        self.thumbnail_model = ThumbnailModel(self, parent=self)
+        self.thumbnail_view = QListView()
+        # 使用ListMode加横向排列：IconMode会为每个条目单独计算布局，图片很多时很慢
+        self.thumbnail_view.setViewMode(QListView.ListMode)
+        self.thumbnail_view.setFlow(QListView.LeftToRight)
+        self.thumbnail_view.setWrapping(False)
+        self.thumbnail_view.setUniformItemSizes(True)
+        self.thumbnail_view.setIconSize(QSize(THUMBNAIL_ICON_SIZE, THUMBNAIL_ICON_SIZE))
+        self.thumbnail_view.setGridSize(QSize(THUMBNAIL_ICON_SIZE + 8, THUMBNAIL_ICON_SIZE + 8))
+        self.thumbnail_view.setFixedHeight(THUMBNAIL_ICON_SIZE + 30)
+        self.thumbnail_view.setHorizontalScrollMode(QListView.ScrollPerPixel)
+        self.thumbnail_view.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.thumbnail_view.setStyleSheet("""
+            QListView {
+                background-color: #2c2c2c;
+                border-radius: 4px;
+            }
+            QListView::item:selected {
+                background-color: #4CAF50;
+            }
+        """)
+        self.thumbnail_view.setModel(self.thumbnail_model)
+        self.thumbnail_view.clicked.connect(self.on_thumbnail_clicked)
+        self.thumbnail_view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.thumbnail_view.customContextMenuRequested.connect(self.show_thumbnail_context_menu)
+        
+        right_panel = QWidget()
+        right_layout = QVBoxLayout(right_panel)
+        right_layout.setContentsMargins(0, 0, 0, 0)
+        right_layout.addWidget(self.image_label, 1)
+        right_layout.addWidget(self.thumbnail_view)
         
         # 将左右两个面板添加到主布局
         main_layout.addWidget(left_panel)
-        main_layout.addWidget(self.image_label, 1)
+        main_layout.addWidget(right_panel, 1)
         
-        # 设置计时器用于幻灯片播放
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.show_next_image)
+        # 按显示时间安排幻灯片切换
+        self.scheduler = SlideshowScheduler(self.interval_spin.value() * 1000, parent=self)
+        self.scheduler.prepare_due.connect(self.prepare_next_slide)
+        self.scheduler.display_due.connect(self.on_slideshow_tick)
+        self.scheduler.deadline_missed.connect(self.on_deadline_missed)
+        self.interval_spin.valueChanged.connect(self.change_interval)
 
     def add_folder(self, folder_path):
         """添加文件夹到列表"""
@@ -555,7 +4262,6 @@ class PhotoAlbum(QMainWindow):
             self.folders.append(folder_path)
             self.folder_list.addItem(folder_path)
             self.load_images()
-            self.show_current_image()
             # 保存设置
             self.save_settings()
 
@@ -581,40 +4287,371 @@ class PhotoAlbum(QMainWindow):
             for folder in selected_folders:
                 self.add_folder(folder)
 
+    def select_archives(self):
+        """选择压缩包，作为文件夹添加"""
+        patterns = " ".join(f"*{extension}" for extension in ARCHIVE_FORMATS)
+        paths, _ = QFileDialog.getOpenFileNames(self, "选择压缩包", self.folders[-1] if self.folders else "",
+                                                f"压缩包 ({patterns})")
+        for path in paths:
+            self.add_folder(path)
+
     def load_images(self):
-        """加载所有图片"""
-        self.images = []
-        for folder in self.folders:
-            if self.include_subfolders.isChecked():
-                # 递归加载子文件夹中的图片
-                for root, _, files in os.walk(folder):
-                    for file in files:
-                        if file.lower().endswith(SUPPORTED_FORMATS):
-                            self.images.append(os.path.join(root, file))
-            else:
-                # 只加载当前文件夹中的图片，不包括子文件夹
-                for file in os.listdir(folder):
-                    file_path = os.path.join(folder, file)
-                    if os.path.isfile(file_path) and file.lower().endswith(SUPPORTED_FORMATS):
-                        self.images.append(file_path)
+        """加载所有图片（在后台线程中扫描，找到的图片分批加入列表）"""
+        # 文件夹集合变化时取消正在进行的扫描
+        self.cancel_scan()
+        
+        self.thumbnail_model.begin_reset()
+        self.images = ImageIndex()
+        self.thumbnail_model.end_reset()
+        self.current_image_index = 0
+        self.prefetcher.cancel()
+        self.staging.cancel()
+        self.staging.set_roots(self.folders)
+        self.shuffle.reset()
+        self.cancel_duplicate_search()
+        self.duplicate_paths = set()
+        self.cancel_metadata_read()
+        self.cancel_validation()
+        self.date_order = None
+        self.date_positions = None
+        self.library_index = None
+        self.show_first_match = False
+        self.set_playlist(None if self.image_filter is None else array('l'))
+        self.resolve_saved_playlist(reset=True)
+        self.scanned_directories = []
+        self.pending_directories.clear()
+        self.watch_timer.stop()
+        self.unwatch_directories()
+        if not self.folders:
+            self.scan_status_label.setText("")
+            return
         
-        if self.images:
+        self.scanner = FolderScanner(self.folders, self.include_subfolders.isChecked(), self)
+        self.scanner.batch_found.connect(self.on_scan_batch)
+        self.scanner.directories_scanned.connect(self.on_directories_scanned)
+        self.scanner.progress.connect(self.on_scan_progress)
+        self.scanner.finished.connect(self.on_scan_finished)
+        self.scan_status_label.setText("正在扫描图片...")
+        self.scanner.start()
+    
+    def cancel_scan(self):
+        """取消正在进行的后台扫描"""
+        if self.scanner is not None:
+            self.scanner.cancel()
+            # 线程结束后再释放对象，避免销毁仍在运行的线程
+            self.scanner.finished.connect(self.scanner.deleteLater)
+            self.scanner = None
+    
+    def on_scan_batch(self, batch):
+        """接收后台扫描到的一批图片"""
+        if self.sender() is not self.scanner:
+            return  # 已取消的扫描发来的过期结果
+        was_empty = not self.images
+        start = len(self.images)
+        self.thumbnail_model.begin_append(len(batch))
+        self.images.extend(batch)
+        self.thumbnail_model.end_append()
+        self.shuffle.resize(len(self.images))
+        self.extend_playlist(start)
+        self.resolve_saved_playlist()
+        
+        if self.restore_image_path is not None:
+            # 上次显示的图片已在显示，找到它在列表中的位置后从这里继续播放
+            if self.restore_image_path in batch:
+                self.current_image_index = start + batch.index(self.restore_image_path)
+                self.restore_image_path = None
+                self.show_current_image()
+            return
+        # 第一批图片到达后立即显示，无需等待扫描完成（筛选时显示第一张符合条件的图片）
+        if was_empty and self.images and self.playlist is None:
             self.current_image_index = 0
             self.show_current_image()
+        elif was_empty and self.images:
+            self.show_first_match = True
+        else:
+            self.ensure_current_matches()
+    
+    def on_scan_progress(self, dirs_scanned, images_found):
+        """更新扫描进度"""
+        if self.sender() is not self.scanner:
+            return
+        self.scan_status_label.setText(f"正在扫描: 已扫描 {dirs_scanned} 个文件夹，找到 {images_found} 张图片")
+    
+    def on_scan_finished(self):
+        """扫描完成"""
+        if self.sender() is not self.scanner:
+            return
+        self.scanner.deleteLater()
+        self.scanner = None
+        self.scan_status_label.setText(f"共 {len(self.images)} 张图片")
+        if self.restore_image_path is not None:
+            # 上次显示的图片已不在图片库中
+            self.restore_image_path = None
+            self.current_image_index = 0
+            if self.images:
+                self.show_current_image()
+            else:
+                self.image_surface.clear()
+                self.setWindowTitle(APP_NAME)
+        self.restore_shuffle()
+        # 扫描期间发生的文件夹变化在扫描完成后处理
+        if self.pending_directories:
+            self.apply_directory_changes()
+        self.read_metadata()
+        self.find_duplicates()
+        self.validate_images()
+    
+    def on_directories_scanned(self, directories):
+        """记录扫描过的文件夹，监视模式下开始监视"""
+        if self.sender() is not self.scanner:
+            return
+        self.scanned_directories.extend(directories)
+        if self.watch_folders.isChecked():
+            self.watch_directories(directories)
+    
+    def toggle_watch_folders(self, state):
+        """开启或关闭文件夹监视"""
+        if state == Qt.Checked:
+            self.watch_directories(self.scanned_directories)
+        else:
+            self.unwatch_directories()
+            self.pending_directories.clear()
+            self.watch_timer.stop()
+        self.save_settings()
+    
+    def watch_directories(self, directories):
+        """添加需要监视的文件夹"""
+        if not directories:
+            return
+        watched = set(self.watcher.directories() + self.watcher.files())
+        directories = [d for d in directories if d not in watched]
+        if directories:
+            failed = self.watcher.addPaths(directories)
+            if failed:
+                print(f"无法监视 {len(failed)} 个文件夹（可能超过了系统的监视数量限制）")
+    
+    def unwatch_directories(self):
+        """停止监视所有文件夹"""
+        directories = self.watcher.directories() + self.watcher.files()
+        if directories:
+            self.watcher.removePaths(directories)
+    
+    def on_directory_changed(self, path):
+        """监视的文件夹发生变化，合并短时间内的多次变化后统一处理"""
+        now = time.monotonic()
+        if not self.pending_directories:
+            self.pending_since = now
+        self.pending_directories.add(path)
+        # 连续变化（如从相机导入照片）时推迟处理，但不超过最长推迟时间
+        if not self.watch_timer.isActive() or now - self.pending_since < WATCH_MAX_DELAY:
+            self.watch_timer.start(WATCH_DEBOUNCE_MS)
+    
+    def apply_directory_changes(self):
+        """将文件夹变化（新增、删除、重命名）增量应用到图片列表，保持当前图片和播放顺序"""
+        if self.scanner is not None or not self.pending_directories:
+            return
+        pending = self.pending_directories
+        self.pending_directories = set()
+        include_subfolders = self.include_subfolders.isChecked()
+        
+        # 收集变化文件夹中当前已有的图片
+        old_names = {directory: set() for directory in pending}
+        pending_ids = {}
+        for directory in pending:
+            folder_id = self.images.find_folder(directory)
+            if folder_id is not None:
+                pending_ids[folder_id] = (directory, "")
+            if directory.lower().endswith(ARCHIVE_FORMATS):
+                # 压缩包中子文件夹里的图片，文件名包含子文件夹
+                prefix = directory + os.sep
+                for folder_id, folder in enumerate(self.images.folders):
+                    if folder.startswith(prefix):
+                        pending_ids[folder_id] = (directory, folder[len(prefix):] + os.sep)
+        if pending_ids:
+            for index in range(len(self.images)):
+                entry = pending_ids.get(self.images.folder_id_of(index))
+                if entry is not None:
+                    old_names[entry[0]].add(entry[1] + self.images.name(index))
+        
+        removed = set()
+        renamed = {}
+        added = {}  # 文件夹 -> 新增的图片路径
+        removed_dirs = []
+        new_dirs = []
+        watched = set(self.watcher.directories() + self.watcher.files())
+        for directory in sorted(pending):
+            try:
+                mtime_ns, subdirs, files = read_directory(directory)
+            except OSError:
+                # 文件夹已被删除
+                removed_dirs.append(directory)
+                if self.catalog is not None:
+                    self.catalog.remove_tree(directory)
+                continue
+            
+            names = old_names[directory]
+            gone = names - {name for name, _, _ in files}
+            new_files = [(name, mtime, size) for name, mtime, size in files if name not in names]
+            
+            # 修改时间和大小都相同的一删一增视为重命名，保留原来的播放位置
+            if gone and new_files and self.catalog is not None:
+                cached = self.catalog.get_directory(directory)
+                signatures = {}
+                if cached is not None:
+                    for name, mtime, size in cached[2]:
+                        if name in gone:
+                            signatures.setdefault((mtime, size), []).append(name)
+                unmatched = []
+                for name, mtime, size in new_files:
+                    candidates = signatures.get((mtime, size))
+                    if candidates:
+                        old_name = candidates.pop()
+                        gone.discard(old_name)
+                        renamed[os.path.join(directory, old_name)] = os.path.join(directory, name)
+                    else:
+                        unmatched.append((name, mtime, size))
+                new_files = unmatched
+            
+            removed.update(os.path.join(directory, name) for name in gone)
+            if new_files:
+                added[directory] = [os.path.join(directory, name) for name, _, _ in new_files]
+            if include_subfolders:
+                subdir_paths = {os.path.join(directory, name) for name in subdirs}
+                new_dirs.extend(os.path.join(directory, name) for name in subdirs
+                                if os.path.join(directory, name) not in watched)
+                # 已删除的子文件夹
+                removed_dirs.extend(path for path in watched
+                                    if os.path.dirname(path) == directory and path not in subdir_paths)
+            if self.catalog is not None:
+                self.catalog.update_directory(directory, mtime_ns, subdirs, files)
+        
+        # 新建的子文件夹整体加入
+        scanned = []
+        while new_dirs:
+            directory = new_dirs.pop()
+            try:
+                mtime_ns, subdirs, files = read_directory(directory)
+            except OSError:
+                continue
+            scanned.append(directory)
+            if files:
+                added[directory] = [os.path.join(directory, name) for name, _, _ in files]
+            new_dirs.extend(os.path.join(directory, name) for name in reversed(subdirs))
+            if self.catalog is not None:
+                self.catalog.update_directory(directory, mtime_ns, subdirs, files)
+        if self.catalog is not None:
+            self.catalog.commit()
+        self.scanned_directories.extend(scanned)
+        if self.watch_folders.isChecked():
+            self.watch_directories(scanned)
+        
+        if removed_dirs:
+            removed_prefixes = tuple(directory + os.sep for directory in removed_dirs)
+            self.scanned_directories = [d for d in self.scanned_directories
+                                        if d not in removed_dirs and not d.startswith(removed_prefixes)]
+            still_watched = [d for d in removed_dirs if d in watched]
+            if still_watched:
+                self.watcher.removePaths(still_watched)
+        
+        if not (removed or renamed or added or removed_dirs):
+            return
+        
+        # 重建列表：删除的图片移除，重命名的原位替换，新增的图片插入到同一文件夹的最后一张之后
+        removed_prefixes = tuple(directory + os.sep for directory in removed_dirs)
+        current_path = self.images[self.current_image_index] if self.images else None
+        current_position = 0
+        kept = array('l')  # 保留的图片的旧索引
+        kept_positions = array('l')  # 旧索引 -> 在kept中的位置（已删除为-1）
+        insert_after = {}
+        for index, path in enumerate(self.images):
+            if index == self.current_image_index:
+                current_position = len(kept)
+            if path in removed or (removed_prefixes and path.startswith(removed_prefixes)):
+                kept_positions.append(-1)
+                continue
+            kept_positions.append(len(kept))
+            kept.append(index)
+            directory = os.path.dirname(renamed.get(path, path))
+            if directory in added:
+                insert_after[directory] = len(kept)
+        
+        inserts = sorted((insert_after.get(directory, len(kept)), paths) for directory, paths in added.items())
+        images = ImageIndex()
+        
+        def extend_kept(start, stop):
+            for position in range(start, stop):
+                path = self.images[kept[position]]
+                images.append(renamed.get(path, path))
+        
+        start = 0
+        for position, paths in inserts:
+            extend_kept(start, position)
+            images.extend(paths)
+            start = position
+            # 插入在当前图片之前时，当前位置随之后移
+            if position <= current_position:
+                current_position += len(paths)
+        extend_kept(start, len(kept))
+        
+        # 将随机播放的历史映射到新的索引
+        insert_positions = [position for position, _ in inserts]
+        inserted_before = [0]
+        for _, paths in inserts:
+            inserted_before.append(inserted_before[-1] + len(paths))
+        
+        def mapping(index):
+            position = kept_positions[index] if index < len(kept_positions) else -1
+            if position < 0:
+                return None
+            return position + inserted_before[bisect.bisect_right(insert_positions, position)]
+        
+        self.thumbnail_model.begin_reset()
+        self.images = images
+        self.thumbnail_model.end_reset()
+        self.shuffle.remap(mapping, len(images))
+        if self.catalog is not None:
+            # 重新映射后的排列无法按种子重放，起点保存到图片目录中
+            try:
+                self.catalog.put_shuffle_base(self.shuffle.base_key(), self.shuffle.base)
+            except sqlite3.Error as e:
+                print(f"保存随机播放状态时出错: {e}")
+        self.date_order = None  # 重新读取EXIF信息后重建
+        self.date_positions = None
+        self.library_index = None
+        if self.image_filter is not None:
+            self.set_playlist(array('l'))
+            self.extend_playlist(0)
+        self.resolve_saved_playlist(reset=True)
+        if not images:
+            self.current_image_index = 0
+            self.image_surface.clear()
+            self.setWindowTitle(APP_NAME)
+        else:
+            self.current_image_index = min(current_position, len(images) - 1)
+            if images[self.current_image_index] != renamed.get(current_path, current_path):
+                # 当前图片已被删除，显示下一张
+                self.show_current_image()
+            self.ensure_current_matches()
+        self.scan_status_label.setText(f"共 {len(self.images)} 张图片")
+        self.read_metadata()
+        self.find_duplicates()
+        self.validate_images()
             
-    def show_current_image(self):
+    def show_current_image(self, transition=None, direction=0):
+        """显示当前图片，direction为切换的方向（1下一张，-1上一张，0直接跳转）"""
         if not self.images:
             return
         
         try:
             image_path = self.images[self.current_image_index]
-            pixmap = QPixmap(image_path)
+            duration = self.transition_duration()
+            stat = self.known_stat(image_path)
             
             # 根据模式选择显示位置
             if self.slideshow_active and self.use_viewer_window.isChecked():
                 # 在独立窗口中显示
-                self.image_viewer.current_pixmap = pixmap  # 保存当前图片
-                self.image_viewer.display_image(pixmap)
+                surface = self.image_viewer.surface
+                image = self.image_viewer.display_image(image_path, transition, duration, stat)
                 if not self.image_viewer.isVisible():
                     self.image_viewer.show()
                 
@@ -625,63 +4662,679 @@ class PhotoAlbum(QMainWindow):
                 # 更新窗口标题
                 self.image_viewer.setWindowTitle(f"电子相册 - {os.path.basename(image_path)}")
             else:
-                # 调整图片大小以适应标签，保持纵横比
-                scaled_pixmap = pixmap.scaled(self.image_label.size(), 
-                                       Qt.KeepAspectRatio, 
-                                       Qt.SmoothTransformation)
+                # 从缓存中取出已按比例缩放到标签大小的图片
+                surface = self.image_surface
+                image = surface.show_image(image_path, transition, duration, stat)
                 
-                self.image_label.setPixmap(scaled_pixmap)
+                # 缩略图条选中当前图片
+                index = self.thumbnail_model.index(self.current_image_index)
+                self.thumbnail_view.setCurrentIndex(index)
+                self.thumbnail_view.scrollTo(index, QListView.PositionAtCenter)
                 self.setWindowTitle(f"电子相册 - {os.path.basename(image_path)}")
                 
                 # 隐藏独立窗口
-                if self.image_viewer.isVisible():
+                if self.viewer_visible():
                     self.image_viewer.hide()
+            
+            if image.isNull():
+                # 显示失败：在后台确认确实无法解码后再放入隔离列表（读取暂时失败的图片不隔离）。
+                # 播放中沿切换的方向立即跳过，不在空白画面上停留一个间隔；暂停时、直接跳转到这张图片时
+                # 或所有图片都无法显示时显示提示
+                self.failure_checker.check(image_path)
+                self.display_failures += 1
+                if self.slideshow_active and direction and self.display_failures < self.play_count():
+                    if direction > 0:
+                        QTimer.singleShot(0, lambda: self.show_next_image(transition))
+                    else:
+                        QTimer.singleShot(0, self.show_prev_image)
+                    return
+                self.display_failures = 0
+                surface.show_error(f"无法显示图片: {os.path.basename(image_path)}")
+                return
+            self.display_failures = 0
+            
+            self.record_first_image()
+            self.update_cache_stats()
+            self.prefetch_upcoming()
+            # 记录当前图片，下次启动时从这里继续
+            self.save_settings()
                 
         except Exception as e:
             print(f"显示图片时出错: {e}")
     
-    def show_next_image(self):
+    def on_thumbnail_clicked(self, index):
+        """点击缩略图跳转到对应的图片"""
+        if 0 <= index.row() < len(self.images):
+            self.current_image_index = index.row()
+            self.show_current_image()
+    
+    def display_size(self):
+        """当前显示图片的区域大小"""
+        if self.slideshow_active and self.use_viewer_window.isChecked():
+            return self.image_viewer.image_label.size()
+        return self.image_label.size()
+    
+    def upcoming_indices(self, count):
+        """按当前播放顺序返回接下来要显示的图片索引（不含被跳过的重复照片和隔离的图片）"""
+        total = self.play_count()
+        count = min(count, total - 1)
+        if count <= 0:
+            return []
+        if self.play_order == "随机播放":
+            # 逐个取用，直到找到足够的可播放图片，不按重复照片和隔离图片的数量预先生成
+            upcoming = itertools.islice(self.active_shuffle().upcoming(), total - 1)
+            candidates = (self.shuffle_index(index) for index in upcoming)
+        else:
+            candidates = (self.ordered_index(i) for i in range(1, total))
+        indices = []
+        for index in candidates:
+            if self.is_playable(index):
+                indices.append(index)
+                if len(indices) >= count:
+                    break
+        return indices
+    
+    def ordered_index(self, offset):
+        """顺序、倒序、按拍摄时间或按保存的播放列表播放时，与当前图片相隔offset张的图片索引
+        
+        按拍摄时间播放时，EXIF信息读取完成之前按顺序播放。
+        """
+        if self.play_order == "倒序播放":
+            offset = -offset
+        current_order = self.current_order()
+        if current_order is None:
+            return (self.current_image_index + offset) % len(self.images)
+        order, positions = current_order
+        if not order:
+            return self.current_image_index
+        # 扫描中新增的图片可能还不在位置数组中
+        position = positions[self.current_image_index] if self.current_image_index < len(positions) else -1
+        if position < 0:
+            # 当前图片不符合筛选条件或不在播放列表中时从第一张（或最后一张）开始
+            position = -1 if offset > 0 else 0
+        return order[(position + offset) % len(order)]
+    
+    def current_order(self):
+        """当前播放顺序的(顺序, 位置)，按图片列表顺序播放全部图片时返回None"""
+        if self.saved_playlist is not None:
+            if self.saved_order is None:
+                self.saved_order = self.saved_playlist.order(len(self.images), self.playlist_positions)
+            return self.saved_order
+        if (self.play_order == "按拍摄时间" and self.date_positions is not None
+                and len(self.date_positions) == len(self.images)):
+            if self.playlist is not None:
+                return self.filtered_by_date()
+            return self.date_order, self.date_positions
+        if self.playlist is not None:
+            return self.playlist, self.playlist_positions
+        return None
+    
+    def play_count(self):
+        """参与播放的图片数（筛选后，播放保存的播放列表时为其中找到的图片数）"""
+        if self.saved_playlist is not None:
+            return len(self.current_order()[0])
+        return len(self.images) if self.playlist is None else len(self.playlist)
+    
+    def play_sequence(self):
+        """按当前播放顺序排列的全部可播放图片索引（随机播放时为新的随机顺序）"""
+        current_order = self.current_order()
+        order = range(len(self.images)) if current_order is None else current_order[0]
+        if self.play_order == "倒序播放":
+            order = reversed(order)
+        indices = [index for index in order if self.is_playable(index)]
+        if self.play_order == "随机播放":
+            random.shuffle(indices)
+        return indices
+    
+    def active_shuffle(self):
+        """当前使用的随机播放顺序（筛选时在筛选出的图片中随机）"""
+        return self.shuffle if self.playlist is None else self.playlist_shuffle
+    
+    def shuffle_index(self, value):
+        """随机播放顺序中的值对应的图片索引"""
+        return value if self.playlist is None else self.playlist[value]
+    
+    def filtered_by_date(self):
+        """按拍摄时间排序并筛选后的(顺序, 位置)"""
+        if self.filtered_date_order is None:
+            order = array('l', (index for index in self.date_order if self.playlist_positions[index] >= 0))
+            positions = array('l', [-1]) * len(self.images)
+            for position, index in enumerate(order):
+                positions[index] = position
+            self.filtered_date_order = (order, positions)
+        return self.filtered_date_order
+    
+    def is_playable(self, index):
+        """不符合筛选条件和隔离列表中的图片不参与播放；开启跳过重复照片时，重复照片也不参与播放"""
+        if self.playlist_positions is not None and self.playlist_positions[index] < 0:
+            return False
+        image_path = self.images[index]
+        if image_path in self.quarantine:
+            return False
+        return not (self.duplicate_paths and self.skip_duplicates.isChecked()
+                    and image_path in self.duplicate_paths)
+    
+    def prefetch_upcoming(self):
+        """在后台预读接下来的图片，慢速存储上的图片提前复制到本地"""
+        if self.staging.slow_roots:
+            self.staging.stage([self.images[index] for index in self.upcoming_indices(STAGING_LOOKAHEAD)])
+        depth = self.prefetch_spin.value()
+        if depth <= 0:
+            return
+        paths = [self.images[index] for index in self.upcoming_indices(depth)]
+        self.prefetcher.prefetch(paths, self.display_size())
+    
+    def transition_duration(self):
+        """过渡时长（毫秒）：过渡从显示时间开始，计入切换间隔，最多占间隔的一半"""
+        return min(TRANSITION_DURATION_MS, self.interval_spin.value() * 1000 // 2)
+    
+    def show_next_image(self, transition=None):
         if not self.images:
             return
+        
+        # 跳过重复照片和隔离的图片，最多转一圈
+        for _ in range(self.play_count()):
+            if self.play_order == "随机播放":
+                # 随机顺序中正在显示的图片（筛选时为它在筛选结果中的位置），不会紧接着再抽到它
+                current = (self.current_image_index if self.playlist is None
+                           else self.playlist_positions[self.current_image_index])
+                index = self.active_shuffle().next(avoid=current if current >= 0 else None)
+                if index is not None:
+                    self.current_image_index = self.shuffle_index(index)
+            else:
+                self.current_image_index = self.ordered_index(1)
+            if self.is_playable(self.current_image_index):
+                break
+        else:
+            # 没有可以播放的图片
+            return
+        if self.play_order == "随机播放":
+            # 保存随机播放的位置，重启后继续本轮
+            self.save_settings()
             
-        if self.play_order == "顺序播放":
-            self.current_image_index = (self.current_image_index + 1) % len(self.images)
-        elif self.play_order == "随机播放":
-            self.current_image_index = random.randint(0, len(self.images) - 1)
-        elif self.play_order == "倒序播放":
-            self.current_image_index = (self.current_image_index - 1) % len(self.images)
-            
-        self.show_current_image()
+        self.show_current_image(transition, 1)
     
     def show_prev_image(self):
         if not self.images:
             return
+        
+        start_index = self.current_image_index
+        for _ in range(self.play_count()):
+            if self.play_order == "随机播放":
+                # 回到本轮中上一张播放过的图片
+                index = self.active_shuffle().prev()
+                if index is None:
+                    break
+                self.current_image_index = self.shuffle_index(index)
+            else:
+                self.current_image_index = self.ordered_index(-1)
+            if self.is_playable(self.current_image_index):
+                break
+        if self.current_image_index == start_index:
+            if self.display_failures:
+                # 向前跳过无法显示的图片时已到本轮开头，在这张图片上显示提示
+                self.show_current_image()
+            return
+        if self.play_order == "随机播放":
+            self.save_settings()
             
-        if self.play_order == "顺序播放":
-            self.current_image_index = (self.current_image_index - 1) % len(self.images)
-        elif self.play_order == "随机播放":
-            self.current_image_index = random.randint(0, len(self.images) - 1)
-        elif self.play_order == "倒序播放":
-            self.current_image_index = (self.current_image_index + 1) % len(self.images)
-            
-        self.show_current_image()
+        self.show_current_image(direction=-1)
+    
+    def apply_filter(self):
+        """按筛选栏中的条件生成播放列表，当前图片仍符合条件时继续显示它"""
+        self.filter_timer.stop()
+        text = self.filter_edit.text().strip()
+        if not text:
+            if self.image_filter is not None:
+                self.image_filter = None
+                self.set_playlist(None)
+                self.save_settings()
+            self.filter_status_label.setText("")
+            return
+        try:
+            image_filter = ImageFilter.parse(text)
+        except ValueError as e:
+            self.filter_status_label.setText(f"筛选条件有误: {e}")
+            return
+        
+        # 图片库索引只在图片列表重建时失效，修改筛选条件只需重新查询（在后台进行，见on_filter_results）
+        self.image_filter = image_filter
+        self.set_playlist(array('l'))
+        self.extend_playlist(0)
+        self.filter_status_label.setText("正在筛选...")
+        self.save_settings()
+    
+    def set_playlist(self, playlist):
+        """设置筛选出的图片（None表示播放全部图片）"""
+        self.playlist = playlist
+        self.filter_generation += 1
+        self.filtered_date_order = None
+        if playlist is None:
+            self.playlist_positions = None
+            self.playlist_shuffle = None
+        else:
+            self.playlist_positions = array('l', [-1]) * len(self.images)
+            for position, index in enumerate(playlist):
+                self.playlist_positions[index] = position
+            self.playlist_shuffle = ShuffleOrder(len(playlist))
+        self.saved_order = None
+        # 接下来要播放的图片可能变化
+        self.prefetcher.cancel()
+        self.scheduler.reschedule()
+    
+    def extend_playlist(self, start):
+        """图片列表从start开始新增了图片：建立索引，符合筛选条件的加入播放列表"""
+        if self.image_filter is None:
+            return
+        if self.library_index is None:
+            self.library_index = LibraryIndex()
+            start = 0
+        # 新增的图片在筛选结果返回前不在播放列表中
+        self.playlist_positions.extend([-1] * (len(self.images) - len(self.playlist_positions)))
+        self.filter_worker.submit(self.filter_generation, self.library_index, self.images, self.image_filter,
+                                  start, len(self.images), self.catalog is not None)
+    
+    def on_filter_results(self, generation, start, end, matches, elapsed):
+        """后台筛选的结果：符合条件的图片加入播放列表"""
+        if generation != self.filter_generation:
+            return  # 播放列表已重建，过期的结果
+        was_empty = not self.playlist
+        for index in matches:
+            self.playlist_positions[index] = len(self.playlist)
+            self.playlist.append(index)
+        self.playlist_shuffle.resize(len(self.playlist))
+        self.filtered_date_order = None
+        self.saved_order = None
+        timing = f"（{elapsed:.0f} ms）" if start == 0 else ""
+        self.filter_status_label.setText(f"筛选出 {len(self.playlist)} / {len(self.images)} 张图片{timing}")
+        if not matches:
+            return
+        if was_empty:
+            # 接下来要播放的图片变化
+            self.prefetcher.cancel()
+            self.scheduler.reschedule()
+        if self.show_first_match:
+            self.show_first_match = False
+            self.current_image_index = self.playlist[0]
+            self.show_current_image()
+        else:
+            self.ensure_current_matches()
+    
+    def ensure_current_matches(self):
+        """当前图片不符合筛选条件时切换到第一张符合条件的图片"""
+        if (self.playlist and self.restore_image_path is None and self.images
+                and self.playlist_positions[self.current_image_index] < 0):
+            self.current_image_index = self.playlist[0]
+            self.show_current_image()
+    
+    def load_saved_playlist(self, name):
+        """加载保存的播放列表（None表示不使用播放列表）"""
+        self.saved_playlist = None
+        self.saved_order = None
+        self.delete_playlist_btn.setEnabled(name is not None)
+        self.playlist_label.setText("")
+        if name is None or self.catalog is None:
+            return
+        start = time.perf_counter()
+        try:
+            entries = self.catalog.load_playlist(name)
+        except sqlite3.Error as e:
+            print(f"加载播放列表时出错: {e}")
+            entries = None
+        if entries is None:
+            self.playlist_label.setText(f"无法加载播放列表: {name}")
+            return
+        self.saved_playlist = SavedPlaylist(name, entries)
+        self.saved_playlist.resolve(self.images)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.update_playlist_label(f"（加载 {elapsed:.0f} ms）")
+    
+    def reload_saved_playlist(self):
+        """正在播放的播放列表被修改后重新加载，接下来按新的内容播放"""
+        self.load_saved_playlist(self.saved_playlist.name)
+        self.prefetcher.cancel()
+        self.scheduler.reschedule()
+    
+    def resolve_saved_playlist(self, reset=False):
+        """图片列表新增或重建后，把播放列表中的图片对应到新的图片索引"""
+        if self.saved_playlist is None:
+            return
+        if reset:
+            self.saved_playlist.reset()
+        if self.saved_playlist.resolve(self.images) or reset:
+            self.saved_order = None
+            self.update_playlist_label()
+    
+    def update_playlist_label(self, suffix=""):
+        playlist = self.saved_playlist
+        missing = len(playlist) - playlist.resolved
+        text = f"播放列表 {playlist.name}: {len(playlist)} 张图片"
+        if missing:
+            # 扫描完成前也包括还没有扫描到的图片
+            text += f"，{missing} 张不在当前图片库中"
+        self.playlist_label.setText(text + suffix)
+    
+    def save_current_playlist(self):
+        """把当前播放顺序（含筛选，随机播放时为一个新的随机顺序）保存为播放列表"""
+        if self.catalog is None or not self.images:
+            return
+        default = self.saved_playlist.name if self.saved_playlist is not None else ""
+        name, ok = QInputDialog.getText(self, "保存播放列表", "播放列表名称:", text=default)
+        name = name.strip()
+        if not ok or not name:
+            return
+        item_text = PLAYLIST_ORDER_PREFIX + name
+        exists = self.order_combo.findText(item_text) >= 0
+        if exists and QMessageBox.question(
+                self, "保存播放列表", f"播放列表“{name}”已存在，是否覆盖？") != QMessageBox.Yes:
+            return
+        try:
+            count = self.catalog.save_playlist(name, (self.images[index] for index in self.play_sequence()))
+        except sqlite3.Error as e:
+            print(f"保存播放列表时出错: {e}")
+            return
+        if not exists:
+            self.order_combo.addItem(item_text)
+        if self.saved_playlist is not None and self.saved_playlist.name == name:
+            self.reload_saved_playlist()
+        else:
+            self.playlist_label.setText(f"已保存播放列表 {name}: {count} 张图片")
+    
+    def delete_current_playlist(self):
+        """删除正在使用的播放列表，改为顺序播放"""
+        if self.saved_playlist is None or self.catalog is None:
+            return
+        name = self.saved_playlist.name
+        if QMessageBox.question(self, "删除播放列表", f"确定删除播放列表“{name}”吗？") != QMessageBox.Yes:
+            return
+        try:
+            self.catalog.delete_playlist(name)
+        except sqlite3.Error as e:
+            print(f"删除播放列表时出错: {e}")
+            return
+        index = self.order_combo.findText(PLAYLIST_ORDER_PREFIX + name)
+        self.order_combo.setCurrentText("顺序播放")
+        self.order_combo.removeItem(index)
+    
+    def show_thumbnail_context_menu(self, position):
+        """缩略图条的右键菜单：把选中的图片添加到播放列表"""
+        index = self.thumbnail_view.indexAt(position)
+        if not index.isValid() or self.catalog is None:
+            return
+        menu = QMenu()
+        playlist_menu = menu.addMenu("添加到播放列表")
+        for row in range(self.order_combo.count()):
+            text = self.order_combo.itemText(row)
+            if text.startswith(PLAYLIST_ORDER_PREFIX):
+                name = text[len(PLAYLIST_ORDER_PREFIX):]
+                action = playlist_menu.addAction(name)
+                action.triggered.connect(lambda checked, name=name: self.add_to_playlist(name, index.row()))
+        playlist_menu.addSeparator()
+        new_action = playlist_menu.addAction("新建播放列表...")
+        new_action.triggered.connect(lambda: self.add_to_playlist(None, index.row()))
+        menu.exec_(self.thumbnail_view.viewport().mapToGlobal(position))
+    
+    def add_to_playlist(self, name, index):
+        """把第index张图片添加到播放列表末尾，name为None时新建播放列表"""
+        if not 0 <= index < len(self.images):
+            return
+        if name is None:
+            name, ok = QInputDialog.getText(self, "新建播放列表", "播放列表名称:")
+            name = name.strip()
+            if not ok or not name:
+                return
+        try:
+            self.catalog.append_playlist(name, [self.images[index]])
+        except sqlite3.Error as e:
+            print(f"添加到播放列表时出错: {e}")
+            return
+        if self.order_combo.findText(PLAYLIST_ORDER_PREFIX + name) < 0:
+            self.order_combo.addItem(PLAYLIST_ORDER_PREFIX + name)
+        if self.saved_playlist is not None and self.saved_playlist.name == name:
+            self.reload_saved_playlist()
+    
+    def read_metadata(self):
+        """在后台读取EXIF信息（扫描完成后），用于按拍摄时间播放和自动旋转"""
+        self.cancel_metadata_read()
+        if self.scanner is not None or not self.images:
+            return
+        self.metadata_reader = MetadataReader(self.images, self)
+        self.metadata_reader.progress.connect(self.on_metadata_progress)
+        self.metadata_reader.metadata_ready.connect(self.on_metadata_ready)
+        self.metadata_reader.finished.connect(self.on_metadata_read_finished)
+        self.metadata_reader.start()
+    
+    def cancel_metadata_read(self):
+        if self.metadata_reader is not None:
+            self.metadata_reader.cancel()
+            self.metadata_reader.finished.connect(self.metadata_reader.deleteLater)
+            self.metadata_reader = None
+    
+    def on_metadata_progress(self, done, total):
+        if self.sender() is not self.metadata_reader or done >= total:
+            return
+        self.scan_status_label.setText(f"正在读取照片信息: {done}/{total}")
+    
+    def on_metadata_ready(self, result):
+        """EXIF信息读取完成：建立拍摄时间顺序，按方向重新显示图片"""
+        if self.sender() is not self.metadata_reader:
+            return
+        taken, orientations = result
+        self.scan_status_label.setText(f"共 {len(self.images)} 张图片")
+        
+        # 拍摄时间相同时保持列表中的顺序
+        order = array('l', sorted(range(len(taken)), key=taken.__getitem__))
+        positions = array('l', bytes(order.itemsize * len(order)))
+        for position, index in enumerate(order):
+            positions[index] = position
+        self.date_order = order
+        self.date_positions = positions
+        self.filtered_date_order = None
+        
+        old = self.image_cache.orientations
+        changed = {image_path for image_path in old.keys() | orientations.keys()
+                   if old.get(image_path, 1) != orientations.get(image_path, 1)}
+        if changed:
+            # 方向是缓存键的一部分，按旧方向解码的图片不会再被取出，只需重新显示方向变化的图片
+            self.image_cache.orientations = orientations
+            self.thumbnail_model.discard_icons(changed)
+            if self.images and self.restore_image_path is None and self.images[self.current_image_index] in changed:
+                self.show_current_image()
+        if self.play_order == "按拍摄时间":
+            self.prefetcher.cancel()
+            self.scheduler.reschedule()
+    
+    def on_metadata_read_finished(self):
+        if self.sender() is not self.metadata_reader:
+            return
+        self.metadata_reader.deleteLater()
+        self.metadata_reader = None
+    
+    def validate_images(self):
+        """在后台检查图片能否显示（扫描完成后），无法显示的图片放入隔离列表"""
+        self.cancel_validation()
+        if self.scanner is not None or not self.images:
+            return
+        self.validator = ImageValidator(self.images, self.full_validation.isChecked(), self)
+        self.validator.progress.connect(self.on_validation_progress)
+        self.validator.invalid_found.connect(self.on_invalid_found)
+        self.validator.finished.connect(self.on_validation_finished)
+        self.validator.start()
+    
+    def cancel_validation(self):
+        if self.validator is not None:
+            self.validator.cancel()
+            self.validator.finished.connect(self.validator.deleteLater)
+            self.validator = None
+    
+    def on_validation_progress(self, done, total):
+        if self.sender() is not self.validator or done >= total:
+            return
+        self.quarantine_label.setText(f"正在检查图片: {done}/{total}")
+    
+    def on_invalid_found(self, invalid):
+        """检查完成：更新隔离列表"""
+        if self.sender() is not self.validator:
+            return
+        # 显示时确认无法解码的图片已记录在图片目录中，检查结果以图片目录为准，检查通过的图片不再隔离
+        self.set_quarantine({image_path: {'reason': reason, 'mtime_ns': mtime_ns}
+                             for image_path, (reason, mtime_ns) in invalid.items()})
+    
+    def on_validation_finished(self):
+        if self.sender() is not self.validator:
+            return
+        self.validator.deleteLater()
+        self.validator = None
+    
+    def on_display_failure_checked(self, image_path, reason, mtime_ns, size):
+        """显示时解码失败的图片确实无法解码：记录到图片目录并放入隔离列表"""
+        if self.catalog is not None:
+            try:
+                self.catalog.put_validation([(image_path, mtime_ns, size, reason)], True)
+                self.catalog.commit()
+            except sqlite3.Error as e:
+                print(f"记录检查结果时出错: {e}")
+        self.quarantine_image(image_path, reason, mtime_ns)
+    
+    def quarantine_image(self, image_path, reason, mtime_ns):
+        """把一张无法显示的图片放入隔离列表"""
+        quarantine = dict(self.quarantine)
+        quarantine[image_path] = {'reason': reason, 'mtime_ns': mtime_ns}
+        self.set_quarantine(quarantine)
+    
+    def set_quarantine(self, quarantine):
+        if quarantine == self.quarantine:
+            self.update_quarantine_list()
+            return
+        self.quarantine = quarantine
+        self.update_quarantine_list()
+        # 接下来要播放的图片可能变化
+        self.prefetcher.cancel()
+        self.scheduler.reschedule()
+        self.save_settings()
+    
+    def update_quarantine_list(self):
+        """在界面上列出隔离的图片"""
+        self.quarantine_list.clear()
+        for image_path, entry in sorted(self.quarantine.items()):
+            item = QListWidgetItem(f"{os.path.basename(image_path)}（{entry.get('reason', '')}）")
+            item.setToolTip(image_path)
+            self.quarantine_list.addItem(item)
+        count = len(self.quarantine)
+        self.quarantine_label.setText(f"隔离 {count} 张无法显示的图片" if count else "")
+        self.quarantine_list.setVisible(count > 0)
+        self.clear_quarantine_button.setVisible(count > 0)
+    
+    def clear_quarantine(self):
+        """清空隔离列表并重新检查所有图片"""
+        self.set_quarantine({})
+        self.validate_images()
+    
+    def toggle_full_validation(self, state):
+        """切换是否完整解码检查，重新检查所有图片"""
+        self.validate_images()
+        self.save_settings()
+    
+    def toggle_skip_duplicates(self, state):
+        """开启或关闭跳过重复照片"""
+        if state == Qt.Checked:
+            self.find_duplicates()
+        else:
+            self.cancel_duplicate_search()
+            self.duplicate_status_label.setText("")
+        # 接下来要播放的图片可能变化
+        self.prefetcher.cancel()
+        self.scheduler.reschedule()
+        self.save_settings()
+    
+    def find_duplicates(self):
+        """在后台查找重复照片（只在开启跳过重复照片且扫描完成后）"""
+        self.cancel_duplicate_search()
+        if not self.skip_duplicates.isChecked() or self.scanner is not None or not self.images:
+            return
+        self.duplicate_finder = DuplicateFinder(self.images, self)
+        self.duplicate_finder.progress.connect(self.on_duplicate_progress)
+        self.duplicate_finder.duplicates_found.connect(self.on_duplicates_found)
+        self.duplicate_finder.finished.connect(self.on_duplicate_search_finished)
+        self.duplicate_finder.start()
+    
+    def cancel_duplicate_search(self):
+        if self.duplicate_finder is not None:
+            self.duplicate_finder.cancel()
+            self.duplicate_finder.finished.connect(self.duplicate_finder.deleteLater)
+            self.duplicate_finder = None
+    
+    def on_duplicate_progress(self, done, total):
+        if self.sender() is not self.duplicate_finder:
+            return
+        self.duplicate_status_label.setText(f"正在查找重复照片: {done}/{total}")
+    
+    def on_duplicates_found(self, paths):
+        if self.sender() is not self.duplicate_finder:
+            return
+        self.duplicate_paths = set(paths)
+        self.duplicate_status_label.setText(f"跳过 {len(paths)} 张重复照片")
+        self.prefetcher.cancel()
+        self.scheduler.reschedule()
+    
+    def on_duplicate_search_finished(self):
+        if self.sender() is not self.duplicate_finder:
+            return
+        self.duplicate_finder.deleteLater()
+        self.duplicate_finder = None
+    
+    def prepare_next_slide(self):
+        """在显示时间之前优先解码下一张图片"""
+        indices = self.upcoming_indices(1)
+        if indices:
+            self.prefetcher.prefetch([self.images[indices[0]]], self.display_size(), priority=1)
+    
+    def on_deadline_missed(self, late_ms):
+        self.perf_monitor.record('late', late_ms)
+    
+    def change_interval(self, seconds):
+        """修改切换间隔，正在播放时按新间隔继续，不打断播放"""
+        self.scheduler.set_interval(seconds * 1000)
+        self.save_settings()
+    
+    def on_slideshow_tick(self):
+        """到达显示时间：记录实际的切换间隔，再显示下一张"""
+        if self.viewer_visible() and self.image_viewer.zoom_view.is_zoomed():
+            return  # 放大查看细节时停留在当前图片
+        now = time.perf_counter()
+        if self.last_tick_time is not None:
+            self.perf_monitor.record('tick', (now - self.last_tick_time) * 1000)
+        self.last_tick_time = now
+        self.show_next_image(TRANSITION_EFFECTS.get(self.transition_combo.currentText()))
+    
+    def export_perf_log(self):
+        """导出性能日志"""
+        path, _ = QFileDialog.getSaveFileName(self, "导出性能日志", "photo_album_perf.csv",
+                                              "CSV文件 (*.csv);;JSON文件 (*.json)")
+        if not path:
+            return
+        try:
+            self.perf_monitor.export(path)
+        except OSError as e:
+            QMessageBox.critical(self, "导出失败", f"无法保存性能日志: {str(e)}")
     
     def toggle_slideshow(self):
         if self.slideshow_active:
-            self.timer.stop()
+            self.scheduler.stop()
             self.slideshow_active = False
             self.play_btn.setText("播放")
             
             # 隐藏独立窗口
-            if self.image_viewer.isVisible():
+            if self.viewer_visible():
                 self.image_viewer.hide()
                 
             # 恢复在主窗口中显示
             self.show()
             self.show_current_image()
         else:
-            interval = self.interval_spin.value() * 1000  # 转换为毫秒
-            self.timer.start(interval)
+            self.scheduler.set_interval(self.interval_spin.value() * 1000)  # 转换为毫秒
+            self.last_tick_time = time.perf_counter()
+            self.scheduler.start()
             self.slideshow_active = True
             self.play_btn.setText("暂停")
             
@@ -689,50 +5342,120 @@ class PhotoAlbum(QMainWindow):
             if self.use_viewer_window.isChecked():
                 self.show_current_image()
     
+    def change_cache_budget(self, budget_mb):
+        """修改图片缓存的内存上限"""
+        self.image_cache.set_budget_mb(budget_mb)
+        self.update_cache_stats()
+        self.save_settings()
+    
+    def update_cache_stats(self):
+        """显示图片缓存的命中统计"""
+        stats = self.image_cache.stats()
+        text = (f"缓存命中率: {stats['hit_rate']:.0%} (命中 {stats['hits']} / 未命中 {stats['misses']})\n"
+                f"已用 {stats['used_mb']:.0f} / {stats['budget_mb']:.0f} MB，{stats['entries']} 张图片")
+        staging = self.staging.stats()
+        if staging['slow_roots']:
+            text += (f"\n慢速文件夹 {staging['slow_roots']} 个，本地缓存 {staging['entries']} 张图片"
+                     f"（{staging['used_mb']:.0f} MB）")
+        self.cache_stats_label.setText(text)
+    
     def toggle_always_on_top(self, state):
         # 设置主窗口置顶
         if state == Qt.Checked:
             self.setWindowFlags(self.windowFlags() | Qt.WindowStaysOnTopHint)
-            # 图片查看器也置顶，保持工具窗口属性
-            self.image_viewer.setWindowFlags(self.image_viewer.windowFlags() | Qt.WindowStaysOnTopHint)
+            # 图片查看器也置顶，保持工具窗口属性（尚未创建时在创建时设置）
+            if self._image_viewer is not None:
+                self._image_viewer.setWindowFlags(self._image_viewer.windowFlags() | Qt.WindowStaysOnTopHint)
         else:
             self.setWindowFlags(self.windowFlags() & ~Qt.WindowStaysOnTopHint)
             # 图片查看器不置顶，保持工具窗口属性
-            self.image_viewer.setWindowFlags((self.image_viewer.windowFlags() & ~Qt.WindowStaysOnTopHint) | Qt.Tool)
+            if self._image_viewer is not None:
+                self._image_viewer.setWindowFlags((self._image_viewer.windowFlags() & ~Qt.WindowStaysOnTopHint) | Qt.Tool)
         
         # 需要重新显示窗口以应用新标志
         self.show()
         
         # 如果图片查看器是可见的，也需要重新显示
-        if self.image_viewer.isVisible():
+        if self.viewer_visible():
             self.image_viewer.show()
             
         # 保存设置
         self.save_settings()
     
-    def resizeEvent(self, event):
-        # 窗口大小改变时重新显示当前图片以适应新尺寸
-        self.show_current_image()
-        super().resizeEvent(event)
-    
     def closeEvent(self, event):
-        # 保存设置
-        self.save_settings()
+        # 保存当前图片的屏幕尺寸版本，并立即保存设置
+        self.save_startup_frame()
+        self.settings_store.flush()
+        
+        # 停止预读、缩略图加载和后台扫描
+        self.prefetcher.shutdown()
+        self.staging.shutdown()
+        self.failure_checker.shutdown()
+        self.filter_worker.shutdown()
+        self.thumbnail_model.shutdown()
+        scanner = self.scanner
+        self.cancel_scan()
+        if scanner is not None:
+            scanner.wait()
+        finder = self.duplicate_finder
+        self.cancel_duplicate_search()
+        if finder is not None:
+            finder.wait()
+        reader = self.metadata_reader
+        self.cancel_metadata_read()
+        if reader is not None:
+            reader.wait()
+        validator = self.validator
+        self.cancel_validation()
+        if validator is not None:
+            validator.wait()
         
         # 关闭主窗口时也关闭图片查看器
-        self.image_viewer.close()
+        if self._image_viewer is not None:
+            self._image_viewer.close()
         super().closeEvent(event)
     
     def change_play_order(self, order):
-        """更改播放顺序"""
+        """更改播放顺序（选择保存的播放列表时加载它）"""
         self.play_order = order
+        name = order[len(PLAYLIST_ORDER_PREFIX):] if order.startswith(PLAYLIST_ORDER_PREFIX) else None
+        self.load_saved_playlist(name)
+        if self.saved_playlist is not None and self.images and self.restore_image_path is None:
+            # 当前图片不在播放列表中时从播放列表的第一张开始
+            playlist_order, positions = self.current_order()
+            if playlist_order and positions[self.current_image_index] < 0:
+                self.current_image_index = playlist_order[0]
+                self.show_current_image()
+        # 取消按旧顺序提交的预读
+        self.prefetcher.cancel()
         # 保存设置
         self.save_settings()
-        if self.slideshow_active:
-            # 如果正在播放，重新开始播放以应用新的顺序
-            self.toggle_slideshow()
-            self.toggle_slideshow()
+        # 正在播放时按新顺序重新准备下一张，显示时间不变
+        self.scheduler.reschedule()
 
+    def restore_shuffle(self):
+        """扫描完成后恢复上次保存的随机播放状态（图片数量变化时重新开始）"""
+        state = self.pending_shuffle_state
+        self.pending_shuffle_state = None
+        if not state:
+            return
+        try:
+            if state['count'] != len(self.images):
+                self.shuffle = ShuffleOrder(len(self.images), state['seed'])
+                return
+            saved_base = None
+            if state.get('remaps') and self.catalog is not None:
+                saved_base = self.catalog.get_shuffle_base()
+            self.shuffle = ShuffleOrder.from_state(state, saved_base)
+        except (KeyError, TypeError, ValueError, sqlite3.Error) as e:
+            print(f"恢复随机播放状态时出错: {e}")
+            self.shuffle.resize(len(self.images))
+            return
+        index = self.shuffle.current()
+        if self.play_order == "随机播放" and index is not None and index != self.current_image_index:
+            self.current_image_index = index
+            self.show_current_image()
+    
     def reload_images(self):
         """重新加载图片（当设置改变时）"""
         # 记住当前播放状态
@@ -768,10 +5491,12 @@ class PhotoAlbum(QMainWindow):
                     
                     # 加载播放顺序
                     play_order = settings.get('play_order', '顺序播放')
-                    if play_order in ["顺序播放", "随机播放", "倒序播放"]:
-                        self.play_order = play_order
+                    if (play_order in ["顺序播放", "随机播放", "倒序播放", "按拍摄时间"]
+                            or play_order.startswith(PLAYLIST_ORDER_PREFIX)):
+                        # 已删除的播放列表不再恢复
                         index = self.order_combo.findText(play_order)
                         if index >= 0:
+                            self.play_order = play_order
                             self.order_combo.setCurrentIndex(index)
                     
                     # 加载窗口置顶状态
@@ -788,53 +5513,108 @@ class PhotoAlbum(QMainWindow):
                     
                     # 加载子文件夹包含设置
                     include_subfolders = settings.get('include_subfolders', True)
+                    # 不在这里触发扫描，启动完成后再统一扫描
+                    self.include_subfolders.blockSignals(True)
                     self.include_subfolders.setChecked(include_subfolders)
+                    self.include_subfolders.blockSignals(False)
+                    
+                    # 加载图片缓存上限
+                    cache_budget = settings.get('cache_budget_mb', DEFAULT_CACHE_BUDGET_MB)
+                    self.cache_budget_spin.setValue(cache_budget)
+                    
+                    # 加载切换效果
+                    transition = settings.get('transition', "无")
+                    if transition in TRANSITION_EFFECTS:
+                        self.transition_combo.setCurrentText(transition)
+                    
+                    # 加载预读张数
+                    prefetch_depth = settings.get('prefetch_depth', DEFAULT_PREFETCH_DEPTH)
+                    self.prefetch_spin.setValue(prefetch_depth)
+                    
+                    # 加载跳过重复照片设置（扫描完成后查找重复照片）
+                    self.skip_duplicates.setChecked(settings.get('skip_duplicates', False))
+                    
+                    # 加载筛选条件（扫描时逐批筛选）
+                    self.filter_edit.blockSignals(True)
+                    self.filter_edit.setText(settings.get('filter', ""))
+                    self.filter_edit.blockSignals(False)
+                    if self.filter_edit.text():
+                        try:
+                            self.image_filter = ImageFilter.parse(self.filter_edit.text())
+                        except ValueError as e:
+                            self.filter_status_label.setText(f"筛选条件有误: {e}")
+                    
+                    # 加载隔离列表和完整解码检查设置（扫描完成后重新检查）
+                    self.full_validation.blockSignals(True)
+                    self.full_validation.setChecked(settings.get('full_validation', False))
+                    self.full_validation.blockSignals(False)
+                    self.quarantine = settings.get('quarantine') or {}
+                    self.update_quarantine_list()
+                    
+                    # 加载文件夹监视设置
+                    watch_folders = settings.get('watch_folders', False)
+                    self.watch_folders.setChecked(watch_folders)
+                    
+                    # 加载随机播放状态（扫描完成后恢复）
+                    self.pending_shuffle_state = settings.get('shuffle')
+                    if self.pending_shuffle_state:
+                        self.shuffle = ShuffleOrder(seed=self.pending_shuffle_state.get('seed'))
                     
                     # 加载独立窗口位置和大小
-                    viewer_geometry = settings.get('viewer_geometry', {})
-                    if viewer_geometry:
-                        self.image_viewer.resize(
-                            viewer_geometry.get('width', 800),
-                            viewer_geometry.get('height', 600)
-                        )
-                        self.image_viewer.move(
-                            viewer_geometry.get('x', 100),
-                            viewer_geometry.get('y', 100)
-                        )
+                    # （在创建独立窗口时应用）
+                    self.viewer_geometry = settings.get('viewer_geometry', {})
+                    
+                    # 加载上次显示的图片（启动时先显示它）
+                    last_image = settings.get('last_image') or {}
+                    self.restore_image_path = last_image.get('path')
                 
-                # 如果有文件夹，加载图片
-                if self.folders:
-                    self.load_images()
+                # 图片在窗口显示后再扫描（见finish_startup）
                     
         except Exception as e:
             print(f"加载设置时出错: {e}")
     
     def save_settings(self):
-        """保存应用程序设置"""
-        try:
-            settings = {
-                'folders': self.folders,
-                'play_order': self.play_order,
-                'always_on_top': self.always_on_top.isChecked(),
-                'use_viewer_window': self.use_viewer_window.isChecked(),
-                'interval': self.interval_spin.value(),
-                'include_subfolders': self.include_subfolders.isChecked(),
-                'viewer_geometry': {
-                    'x': self.image_viewer.x(),
-                    'y': self.image_viewer.y(),
-                    'width': self.image_viewer.width(),
-                    'height': self.image_viewer.height()
-                }
-            }
-            
-            # 创建目录（如果不存在）
-            os.makedirs(os.path.dirname(SETTINGS_FILE), exist_ok=True)
-            
-            with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(settings, f, ensure_ascii=False, indent=2)
-                
-        except Exception as e:
-            print(f"保存设置时出错: {e}")
+        """保存应用程序设置（延迟合并后在后台写入）"""
+        self.settings_store.mark_dirty()
+    
+    def collect_settings(self):
+        """收集需要保存的设置"""
+        return {
+            'folders': self.folders,
+            'play_order': self.play_order,
+            'always_on_top': self.always_on_top.isChecked(),
+            'use_viewer_window': self.use_viewer_window.isChecked(),
+            'interval': self.interval_spin.value(),
+            'include_subfolders': self.include_subfolders.isChecked(),
+            'watch_folders': self.watch_folders.isChecked(),
+            'cache_budget_mb': self.cache_budget_spin.value(),
+            'prefetch_depth': self.prefetch_spin.value(),
+            'transition': self.transition_combo.currentText(),
+            'skip_duplicates': self.skip_duplicates.isChecked(),
+            'filter': self.filter_edit.text().strip(),
+            'full_validation': self.full_validation.isChecked(),
+            'quarantine': self.quarantine,
+            'shuffle': self.shuffle.state(),
+            'viewer_geometry': self.collect_viewer_geometry(),
+            'last_image': self.collect_last_image(),
+        }
+    
+    def collect_viewer_geometry(self):
+        """独立窗口的位置和大小（尚未创建时使用加载的设置）"""
+        if self._image_viewer is None:
+            return self.viewer_geometry
+        return {
+            'x': self._image_viewer.x(),
+            'y': self._image_viewer.y(),
+            'width': self._image_viewer.width(),
+            'height': self._image_viewer.height()
+        }
+    
+    def collect_last_image(self):
+        """当前显示的图片（扫描完成前仍使用上次保存的图片）"""
+        if self.restore_image_path is not None or not self.images:
+            return {'path': self.restore_image_path}
+        return {'path': self.images[self.current_image_index]}
 
     def show_folder_context_menu(self, position):
         """显示文件夹列表的右键菜单"""
@@ -843,6 +5623,9 @@ class PhotoAlbum(QMainWindow):
         delete_action = QAction("删除", self)
         delete_action.triggered.connect(self.delete_selected_folder)
         menu.addAction(delete_action)
+        archive_action = QAction("添加压缩包...", self)
+        archive_action.triggered.connect(self.select_archives)
+        menu.addAction(archive_action)
         
         # 显示菜单
         menu.exec_(self.folder_list.mapToGlobal(position))
@@ -865,27 +5648,196 @@ class PhotoAlbum(QMainWindow):
             row = self.folder_list.row(item)
             self.folder_list.takeItem(row)
         
-        # 重新加载图片
+        # 重新加载图片（后台扫描到的第一批图片会自动显示）
         self.load_images()
-        self.current_image_index = 0
         
-        # 如果还有图片，显示第一张；否则清空显示
-        if self.images:
-            self.show_current_image()
-        else:
+        # 扫描结果到达前先清空显示
+        if not self.images:
             # 清空图片显示
-            self.image_label.clear()
+            self.image_surface.clear()
             self.setWindowTitle(APP_NAME)
             
             # 如果独立窗口是可见的，也清空它并隐藏
-            if self.image_viewer.isVisible():
-                self.image_viewer.image_label.clear()
+            if self.viewer_visible():
+                self.image_viewer.surface.clear()
                 self.image_viewer.hide()
         
         # 保存设置
         self.save_settings()
 
+def parse_size(text):
+    """把"1920x1080"形式的尺寸解析为QSize"""
+    try:
+        width, height = (int(value) for value in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的尺寸: {text}")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"无效的尺寸: {text}")
+    return QSize(width, height)
+
+
+def _init_warm_worker():
+    """进程池中的每个进程创建自己的QCoreApplication（加载图片格式插件需要）"""
+    global _worker_app
+    _worker_app = QCoreApplication.instance() or QCoreApplication([])
+
+
+def warm_image(task):
+    """在子进程中处理一张图片
+    
+    task为(路径, 已知的图片信息, 显示缓存尺寸, 是否生成缩略图)。图片信息未知时读取EXIF并检查文件头；
+    显示缓存尺寸不为None时生成该尺寸的显示缓存。
+    返回(路径, 修改时间, 大小, 图片信息, 错误原因, 生成的缩略图数, 生成的显示缓存数)，文件无法访问时返回None。
+    """
+    image_path, metadata, frame_size, thumbnails = task
+    try:
+        stat = stat_image(image_path)
+    except OSError:
+        return None
+    error = None
+    if metadata is None:
+        try:
+            metadata = read_image_metadata(image_path)
+        except OSError:
+            metadata = None
+        error = validate_image(image_path)
+    if error:
+        return image_path, stat.st_mtime_ns, stat.st_size, metadata, error, 0, 0
+    
+    thumbnail_count = 0
+    if thumbnails:
+        cache = ThumbnailCache()
+        if cache.load(image_path, stat) is None and not cache.generate(image_path, stat).isNull():
+            thumbnail_count = 1
+    frame_count = 0
+    if frame_size is not None:
+        display_cache = DisplayFrameCache()
+        size = QSize(*frame_size)
+        orientation = metadata[1] if metadata is not None else 1
+        if not os.path.exists(display_cache.frame_path(image_path, size, orientation, stat)):
+            frame = load_scaled_image(image_path, size, orientation=orientation)
+            if frame.isNull():
+                error = "无法解码"
+            else:
+                display_cache.put(image_path, size, orientation, frame, stat)
+                frame_count = 1
+    return image_path, stat.st_mtime_ns, stat.st_size, metadata, error, thumbnail_count, frame_count
+
+
+def run_indexer(argv):
+    """命令行模式：扫描图片库并预先生成缓存，不创建窗口
+    
+    --index建立图片目录（文件夹内容、EXIF信息和文件头检查结果），--warm-cache还生成缩略图和屏幕尺寸的
+    显示缓存。图片在进程池中并行处理，首次启动时不必再扫描和解码。
+    """
+    parser = argparse.ArgumentParser(description="电子相册：建立图片目录并预先生成缓存（无界面运行）")
+    parser.add_argument("folders", nargs="*", help="图片文件夹（默认使用设置文件中的文件夹）")
+    parser.add_argument("--index", action="store_true", help="建立图片目录")
+    parser.add_argument("--warm-cache", action="store_true", help="建立图片目录，并生成缩略图和显示缓存")
+    parser.add_argument("--no-subfolders", action="store_true", help="不包含子文件夹")
+    parser.add_argument("--screen-size", type=parse_size,
+                        help="显示缓存的尺寸，如1920x1080（默认使用主屏幕的尺寸）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="并行处理的进程数")
+    args = parser.parse_args(argv)
+    
+    settings = {}
+    try:
+        if os.path.exists(SETTINGS_FILE):
+            with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
+                settings = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"加载设置时出错: {e}")
+    folders = [os.path.abspath(folder) for folder in args.folders] or settings.get('folders', [])
+    folders = [folder for folder in folders
+               if os.path.isdir(folder) or (folder.lower().endswith(ARCHIVE_FORMATS) and os.path.isfile(folder))]
+    if not folders:
+        print("没有可扫描的图片文件夹")
+        return 1
+    include_subfolders = not args.no_subfolders and settings.get('include_subfolders', True)
+    
+    # 只有需要读取屏幕尺寸时才创建QGuiApplication，它不会创建窗口
+    frame_size = None
+    if args.warm_cache:
+        if args.screen_size is None:
+            app = QGuiApplication(sys.argv[:1])
+            args.screen_size = app.primaryScreen().size()
+        else:
+            app = QCoreApplication(sys.argv[:1])
+        frame_size = (args.screen_size.width(), args.screen_size.height())
+    else:
+        app = QCoreApplication(sys.argv[:1])
+    
+    # 扫描文件夹（与后台扫描相同，只重新读取修改时间变化的文件夹）
+    start = time.perf_counter()
+    scanner = FolderScanner(folders, include_subfolders)
+    paths = []
+    scanner.batch_found.connect(paths.extend)
+    scanner.run()
+    scan_seconds = time.perf_counter() - start
+    print(f"扫描 {scanner.dirs_scanned} 个文件夹（{scanner.dirs_changed} 个有变化），"
+          f"找到 {len(paths)} 张图片，耗时 {scan_seconds:.1f} 秒")
+    
+    # 图片目录中已有信息的图片不再读取文件头；只建立目录时直接跳过
+    catalog = ImageCatalog()
+    tasks = []
+    for image_path in paths:
+        try:
+            stat = stat_image(image_path)
+        except OSError:
+            continue
+        metadata = catalog.get_metadata(image_path, stat.st_mtime_ns, stat.st_size)
+        if metadata is not None and catalog.get_validation(image_path, stat.st_mtime_ns, stat.st_size, False) is None:
+            metadata = None
+        if metadata is None or args.warm_cache:
+            tasks.append((image_path, metadata, frame_size, args.warm_cache))
+    
+    start = time.perf_counter()
+    total_bytes = 0
+    thumbnail_count = frame_count = 0
+    invalid = 0
+    metadata_rows = []
+    validation_rows = []
+    workers = max(1, args.workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_warm_worker) as pool:
+        for done, result in enumerate(pool.map(warm_image, tasks, chunksize=16), 1):
+            if result is not None:
+                image_path, mtime_ns, size, metadata, error, thumbnails, frames = result
+                total_bytes += size
+                thumbnail_count += thumbnails
+                frame_count += frames
+                invalid += bool(error)
+                if error is not None:
+                    validation_rows.append((image_path, mtime_ns, size, error))
+                if metadata is not None:
+                    metadata_rows.append((image_path, mtime_ns, size, metadata))
+            if done % CATALOG_BATCH_SIZE == 0 or done == len(tasks):
+                try:
+                    catalog.put_metadata(metadata_rows)
+                    catalog.put_validation(validation_rows, False)
+                    catalog.commit()
+                except sqlite3.Error as e:
+                    print(f"保存到图片目录时出错: {e}")
+                metadata_rows = []
+                validation_rows = []
+                print(f"已处理 {done}/{len(tasks)} 张图片")
+    catalog.close()
+    
+    seconds = time.perf_counter() - start
+    megabytes = total_bytes / (1024 * 1024)
+    print(f"使用 {workers} 个进程处理 {len(tasks)} 张图片，耗时 {seconds:.1f} 秒，"
+          f"{len(tasks) / max(seconds, 1e-6):.1f} 张/秒，{megabytes / max(seconds, 1e-6):.1f} MB/秒")
+    if args.warm_cache:
+        print(f"生成缩略图 {thumbnail_count} 张，显示缓存 {frame_count} 张"
+              f"（{frame_size[0]}x{frame_size[1]}）")
+    if invalid:
+        print(f"{invalid} 张图片无法显示")
+    return 0
+
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    if '--index' in sys.argv[1:] or '--warm-cache' in sys.argv[1:]:
+        sys.exit(run_indexer(sys.argv[1:]))
     app = QApplication(sys.argv)
     window = PhotoAlbum()
     window.show()